@@ -0,0 +1,63 @@
+"""Задержка генерации ответа n-граммной моделью чата
+
+Модель заполняется синтетическими паттернами (без БД), затем измеряются
+время первой выборки (сборка массивов) и p50/p99 генерации фразы.
+Запуск: python -m benchmarks.bench_language_model [--patterns 300000] [--runs 2000]
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from bot.language_model import ChatLanguageModel
+
+def zipf_word(rng: random.Random, vocabulary: int) -> str:
+    return f"w{min(int(rng.paretovariate(1.1)), vocabulary)}"
+
+def fill(model: ChatLanguageModel, patterns: int, vocabulary: int, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(patterns):
+        kind = ('word', 'bigram', 'trigram')[i % 3]
+        size = {'word': 1, 'bigram': 2, 'trigram': 3}[kind]
+        text = ' '.join(zipf_word(rng, vocabulary) for _ in range(size))
+        model.add(kind, text, rng.randint(2, 500))
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patterns', type=int, default=300000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=2000)
+    args = parser.parse_args()
+
+    model = ChatLanguageModel()
+    started = time.perf_counter()
+    fill(model, args.patterns, args.vocabulary)
+    print(f"Загрузка {args.patterns} паттернов: {time.perf_counter() - started:.2f} с, состояний: {len(model)}")
+
+    rng = random.Random(1)
+    started = time.perf_counter()
+    model.generate(['w1'], rng=rng)
+    print(f"Первая генерация (сборка массивов по пути): {(time.perf_counter() - started) * 1000:.2f} мс")
+
+    # Прогрев: все списки переходов собираются в массивы
+    for _ in range(args.runs):
+        model.generate([], rng=rng)
+
+    timings = []
+    lengths = 0
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        words, _ = model.generate([], max_words=12, rng=rng)
+        timings.append((time.perf_counter() - started) * 1000)
+        lengths += len(words)
+    print(f"Генерация: p50 {percentile(timings, 0.5):.3f} мс, p99 {percentile(timings, 0.99):.3f} мс, "
+          f"в среднем {lengths / args.runs:.1f} слов")
+
+if __name__ == '__main__':
+    main()
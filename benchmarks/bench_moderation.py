@@ -0,0 +1,57 @@
+"""Стоимость проверки чёрного списка в зависимости от числа терминов
+
+Сравнивается прежний способ (подстрока для каждого слова) и ModerationFilter
+с одним скомпилированным выражением.
+Запуск: python -m benchmarks.bench_moderation [--messages 5000] [--sizes 10,100,1000,5000]
+"""
+import argparse
+import random
+import time
+
+from bot.moderation_filter import ModerationFilter
+
+ALPHABET = 'абвгдежзиклмнопрстуфхцчшщэюя'
+TEXT_WORDS = (
+    'привет погода работа кофе футбол машина деньги отпуск кошка собака '
+    'сериал музыка игра телефон компьютер новости праздник дорога ужин '
+    'weekend coffee deploy server release meeting python bug ticket'
+).split()
+
+def make_terms(count: int, rng: random.Random):
+    return [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(5, 12))) for _ in range(count)]
+
+def make_messages(count: int, rng: random.Random):
+    return [' '.join(rng.choice(TEXT_WORDS) for _ in range(rng.randint(4, 30))) for _ in range(count)]
+
+def naive_contains(text: str, words) -> bool:
+    text = text.lower()
+    return any(word in text for word in words)
+
+def measure(check, messages) -> float:
+    started = time.perf_counter()
+    for text in messages:
+        check(text)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    messages = make_messages(args.messages, rng)
+
+    print(f"{'терминов':>9} {'компиляция, мс':>15} {'подстроки, мкс':>15} {'фильтр, мкс':>12}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        terms = make_terms(size, rng)
+        started = time.perf_counter()
+        moderation_filter = ModerationFilter(terms, reload_interval=0)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        naive_us = measure(lambda text: naive_contains(text, terms), messages)
+        filter_us = measure(moderation_filter.contains, messages)
+        print(f"{size:>9} {compile_ms:>15.1f} {naive_us:>15.1f} {filter_us:>12.1f}")
+
+if __name__ == '__main__':
+    main()
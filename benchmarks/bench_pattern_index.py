@@ -0,0 +1,64 @@
+"""Задержка ранжированного поиска паттернов по контексту (TF-IDF в NumPy)
+
+Индекс чата заполняется синтетическими паттернами с частотами по Ципфу,
+затем измеряются p50/p99 поиска для контекстов из нескольких сообщений.
+--adds — сколько новых паттернов добавляется между поисками (как apply()
+после выгрузки n-грамм); время добавления в задержку поиска не входит.
+Запуск: python -m benchmarks.bench_pattern_index [--patterns 200000] [--runs 2000] [--adds 0]
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from bot.pattern_index import ChatPatternIndex
+
+def zipf_word(rng: random.Random, vocabulary: int) -> str:
+    return f"w{min(int(rng.paretovariate(0.8)), vocabulary)}"
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patterns', type=int, default=200000)
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    parser.add_argument('--context-words', type=int, default=60)
+    parser.add_argument('--runs', type=int, default=2000)
+    parser.add_argument('--adds', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    index = ChatPatternIndex()
+
+    def add(pattern_id: int):
+        size = pattern_id % 3 + 1
+        text = ' '.join(zipf_word(rng, args.vocabulary) for _ in range(size))
+        index.add(pattern_id, text, ('word', 'bigram', 'trigram')[size - 1], rng.randint(2, 1000))
+
+    started = time.perf_counter()
+    for pattern_id in range(args.patterns):
+        add(pattern_id)
+    print(f"Загрузка {args.patterns} паттернов: {time.perf_counter() - started:.2f} с")
+
+    contexts = [Counter(zipf_word(rng, args.vocabulary) for _ in range(args.context_words))
+                for _ in range(args.runs)]
+    index.search(contexts[0])  # прогрев кэшей списков токенов
+
+    timings = []
+    next_id = args.patterns
+    for context in contexts:
+        for _ in range(args.adds):
+            add(next_id)
+            next_id += 1
+        started = time.perf_counter()
+        index.search(context, limit=15)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"Поиск: p50 {percentile(timings, 0.5):.3f} мс, p99 {percentile(timings, 0.99):.3f} мс")
+
+if __name__ == '__main__':
+    main()
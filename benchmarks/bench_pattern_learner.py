@@ -0,0 +1,93 @@
+"""Сравнение скорости PatternLearner: SELECT на каждую n-грамму против пакетного upsert
+
+Запуск: python -m benchmarks.bench_pattern_learner [--messages 2000]
+Без DATABASE_URL используется временная SQLite-база.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from bot.database import SessionLocal, Pattern, Chat, init_db
+from bot.pattern_learner import PatternLearner
+
+WORDS = (
+    'привет погода работа кофе футбол машина деньги отпуск кошка собака '
+    'сериал музыка игра телефон компьютер новости праздник дорога ужин '
+    'weekend coffee deploy server release meeting python bug ticket'
+).split()
+
+class LegacyPatternLearner(PatternLearner):
+    """Старый путь: SELECT и commit на каждый паттерн сообщения"""
+    
+    def _save_patterns(self, items, pattern_type, chat_id, user_id, db):
+        for item, count in Counter(items).items():
+            if count >= self.MIN_COUNT:
+                pattern = db.query(Pattern).filter(
+                    Pattern.chat_id == chat_id,
+                    Pattern.pattern_text == item,
+                    Pattern.pattern_type == pattern_type
+                ).first()
+                if pattern:
+                    pattern.frequency += count
+                    pattern.last_used = datetime.now()
+                else:
+                    db.add(Pattern(chat_id=chat_id, user_id=user_id, pattern_text=item,
+                                   pattern_type=pattern_type, frequency=count,
+                                   last_used=datetime.now()))
+        db.commit()
+    
+    def flush(self, db):
+        return 0
+
+def make_messages(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))) for _ in range(count)]
+
+def run(learner: PatternLearner, messages, chat_ids) -> float:
+    db = SessionLocal()
+    try:
+        db.query(Pattern).delete()
+        db.commit()
+        started = time.perf_counter()
+        for i, text in enumerate(messages):
+            learner.analyze_message(text, chat_ids[i % len(chat_ids)], None, db)
+        learner.flush(db)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    return len(messages) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=10)
+    args = parser.parse_args()
+    
+    init_db()
+    db = SessionLocal()
+    chat_ids = []
+    for i in range(args.chats):
+        chat = Chat(chat_id=f'bench-{i}-{time.time_ns()}', title='bench')
+        db.add(chat)
+        db.flush()
+        chat_ids.append(chat.id)
+    db.commit()
+    db.close()
+    
+    messages = make_messages(args.messages)
+    legacy = run(LegacyPatternLearner(), messages, chat_ids)
+    batched = run(PatternLearner(), messages, chat_ids)
+    
+    print(f"SELECT на паттерн: {legacy:10.1f} сообщений/с")
+    print(f"Пакетный upsert:   {batched:10.1f} сообщений/с")
+    print(f"Ускорение:         {batched / legacy:10.1f}x")
+
+if __name__ == '__main__':
+    main()
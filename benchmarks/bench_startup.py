@@ -0,0 +1,135 @@
+"""Время холодного старта воркера до готовности и разбор импортов (-X importtime)
+
+Запуск: python -m benchmarks.bench_startup [--runs 5] [--budget-ms 1500] [--output startup.json]
+
+Каждый прогон — отдельный процесс python -X importtime, который проходит
+путь воркера до готовности: create_bot() и init_database() на временной
+SQLite-базе (первый, непосчитанный прогон создает схему, остальные
+меряют перезапуск). Выводятся медианы времени и импортов, самые дорогие
+пакеты по собственному времени импорта и модули, которых не должно быть
+на пути старта. Код возврата 1 — бюджет превышен или загружен
+запрещенный модуль: так регрессия старта видна до деплоя.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+# Тяжелые модули, которые не нужны до первого сообщения (или вовсе)
+FORBIDDEN = ('flask', 'pandas', 'nltk', 'numpy', 'http.server')
+
+STARTUP_SCRIPT = r'''
+import json, sys, time
+started = time.perf_counter()
+from bot.main import create_bot
+bot = create_bot()
+created = time.perf_counter()
+bot.init_database()
+ready = time.perf_counter()
+modules = sorted(sys.modules)
+if bot.maintenance is not None:
+    bot.maintenance.stop()
+bot.stop_ingestion()
+bot.stop_dispatcher()
+print('STARTUP ' + json.dumps({
+    'create_bot_ms': (created - started) * 1000,
+    'init_database_ms': (ready - created) * 1000,
+    'ready_ms': (ready - started) * 1000,
+    'modules': modules,
+}))
+'''
+
+def parse_importtime(stderr: str):
+    """Собственное время импорта (мкс) по модулям из вывода -X importtime"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        self_us = self_us.strip()
+        # Строка заголовка: «self [us] | cumulative | imported package»
+        if self_us.isdigit():
+            name = name.strip()
+            modules[name] = modules.get(name, 0) + int(self_us)
+    return modules
+
+def run_once(env: dict) -> dict:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+                            capture_output=True, text=True, env=env, timeout=120)
+    marker = [line for line in result.stdout.splitlines() if line.startswith('STARTUP ')]
+    if result.returncode != 0 or not marker:
+        raise RuntimeError(f"Прогон старта завершился с ошибкой:\n{result.stderr[-2000:]}")
+    run = json.loads(marker[-1][len('STARTUP '):])
+    run['imports_us'] = parse_importtime(result.stderr)
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1500, help='бюджет медианы времени до готовности')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--output', help='файл для JSON')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.update(
+        PYTHONPATH=root + os.pathsep + env.get('PYTHONPATH', ''),
+        TELEGRAM_TOKEN=env.get('TELEGRAM_TOKEN') or '0:startup-benchmark',
+        DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db'),
+        METRICS_PORT='0',
+        READY_FILE='',
+    )
+
+    run_once(env)  # схема БД и прогрев файлового кэша
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    packages = defaultdict(list)
+    for run in runs:
+        totals = defaultdict(int)
+        for name, self_us in run['imports_us'].items():
+            totals[name.split('.')[0]] += self_us
+        for package, total in totals.items():
+            packages[package].append(total)
+    top = sorted(((package, statistics.median(values) / 1000) for package, values in packages.items()),
+                 key=lambda item: -item[1])[:args.top]
+
+    loaded = set(runs[-1]['modules'])
+    forbidden = [name for name in FORBIDDEN if name in loaded]
+    result = {
+        'runs': args.runs,
+        'ready_ms': round(statistics.median(run['ready_ms'] for run in runs), 1),
+        'create_bot_ms': round(statistics.median(run['create_bot_ms'] for run in runs), 1),
+        'init_database_ms': round(statistics.median(run['init_database_ms'] for run in runs), 1),
+        'imports_ms': round(statistics.median(sum(run['imports_us'].values()) for run in runs) / 1000, 1),
+        'modules_loaded': len(loaded),
+        'top_packages_ms': {package: round(ms, 1) for package, ms in top},
+        'forbidden_loaded': forbidden,
+        'budget_ms': args.budget_ms,
+    }
+
+    print(f"До готовности:    {result['ready_ms']:8.1f} мс (бюджет {args.budget_ms:.0f} мс)")
+    print(f"  create_bot:     {result['create_bot_ms']:8.1f} мс")
+    print(f"  init_database:  {result['init_database_ms']:8.1f} мс")
+    print(f"Импорты:          {result['imports_ms']:8.1f} мс, модулей {result['modules_loaded']}")
+    for package, ms in top:
+        print(f"  {package:<20} {ms:8.1f} мс")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if forbidden:
+        print(f"❌ На пути старта загружены: {', '.join(forbidden)}")
+        failed = True
+    if result['ready_ms'] > args.budget_ms:
+        print(f"❌ Бюджет старта превышен: {result['ready_ms']:.1f} > {args.budget_ms:.0f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
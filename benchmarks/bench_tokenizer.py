@@ -0,0 +1,87 @@
+"""Пропускная способность токенизации: прежний путь NLTK против bot.tokenizer
+
+Запуск: python -m benchmarks.bench_tokenizer [--messages 20000]
+NLTK необязателен: без пакета строка пропускается, а без данных punkt/stopwords
+измеряется только NLTKWordTokenizer (без разбиения на предложения) — это
+нижняя оценка стоимости прежнего пути.
+"""
+import argparse
+import random
+import time
+
+from bot.tokenizer import STOPWORDS, extract_ngrams
+from bot.utils import clean_text
+
+WORDS = (
+    'привет погода работа кофе футбол машина деньги отпуск кошка собака '
+    'сериал музыка игра телефон компьютер новости праздник дорога ужин '
+    'и в не что он на я с как а то все так но да ты weekend coffee deploy '
+    'server release meeting python bug ticket the and is кто-то don\'t'
+).split()
+PUNCTUATION = ['', '', '', ',', '.', '!', '?', '...']
+
+def make_messages(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [clean_text(' '.join(rng.choice(WORDS) + rng.choice(PUNCTUATION)
+                                for _ in range(rng.randint(3, 25))))
+            for _ in range(count)]
+
+def nltk_extractor():
+    """Прежний PatternLearner.analyze_message без записи в БД"""
+    try:
+        import nltk  # noqa: F401
+    except ImportError:
+        print("NLTK не установлен, пропускаю")
+        return None, None
+
+    name = 'nltk word_tokenize'
+    try:
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize
+        stop_words = set(stopwords.words('russian') + stopwords.words('english'))
+        word_tokenize('проверка', language='russian')
+    except LookupError:
+        from nltk.tokenize import NLTKWordTokenizer
+        word_tokenize = lambda text, language=None: NLTKWordTokenizer().tokenize(text)
+        stop_words = set(STOPWORDS)
+        name = 'nltk (без punkt)'
+
+    def extract(text):
+        tokens = word_tokenize(text, language='russian')
+        filtered = [word.lower() for word in tokens
+                    if word.lower() not in stop_words and len(word) > 2]
+        bigrams = [' '.join(filtered[i:i+2]) for i in range(len(filtered)-1)]
+        trigrams = [' '.join(filtered[i:i+3]) for i in range(len(filtered)-2)]
+        return filtered, bigrams, trigrams
+    return name, extract
+
+def report(name: str, seconds: float, count: int, baseline: float = None):
+    line = f"{name:<28} {count / seconds:>12,.0f} сообщ/с"
+    if baseline:
+        line += f"  x{baseline / seconds:.1f}"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+    messages = make_messages(args.messages)
+
+    baseline = None
+    name, extract = nltk_extractor()
+    if extract:
+        started = time.perf_counter()
+        for text in messages:
+            extract(text)
+        baseline = time.perf_counter() - started
+        report(name, baseline, len(messages))
+
+    started = time.perf_counter()
+    for text in messages:
+        extract_ngrams(text)
+    report('tokenizer.extract_ngrams', time.perf_counter() - started, len(messages), baseline)
+
+    print(f"Стоп-слов: {len(STOPWORDS)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Локальный fake-Telegram: имитация Bot API и воспроизведение обновлений в webhook
+
+1. Запустить fake Bot API и веб-приложение, направив бота на него:
+       python -m benchmarks.fake_telegram serve --port 8081
+       TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1} WEBHOOK_SECRET=test \\
+           gunicorn web.app:app --bind 127.0.0.1:5000
+2. Воспроизвести обновления (JSONL, по одному Update на строку):
+       python -m benchmarks.fake_telegram replay --webhook http://127.0.0.1:5000/telegram/webhook \\
+           --secret test --updates updates.jsonl
+   Без --updates генерируются простые текстовые сообщения.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Отвечает на любой метод Bot API успешным результатом"""
+
+    calls = Counter()
+    lock = threading.Lock()
+    message_id = 0
+
+    def _params(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or '{}')
+        from urllib.parse import parse_qsl, urlparse
+        params = dict(parse_qsl(urlparse(self.path).query))
+        params.update(parse_qsl(body))
+        return params
+
+    def _handle(self):
+        method = self.path.split('?')[0].rsplit('/', 1)[-1]
+        params = self._params()
+        with self.lock:
+            self.calls[method] += 1
+            FakeBotAPIHandler.message_id += 1
+            message_id = FakeBotAPIHandler.message_id
+
+        if method.startswith('send'):
+            result = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'group'},
+                'text': params.get('text', ''),
+            }
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        else:
+            result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int):
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeBotAPIHandler)
+    print(f"Fake Bot API: http://127.0.0.1:{port}/bot{{0}}/{{1}}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Вызовы методов: {dict(FakeBotAPIHandler.calls)}")
+
+def generate_updates(count: int, chats: int = 5, users: int = 20, seed: int = 1):
+    """Простые текстовые обновления для проверки webhook"""
+    rng = random.Random(seed)
+    words = 'привет как дела что нового погода кофе работа hello coffee deploy'.split()
+    for update_id in range(1, count + 1):
+        chat_id = -1000 - rng.randrange(chats)
+        user_id = 100 + rng.randrange(users)
+        yield {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'group', 'title': f'Chat {chat_id}'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}',
+                         'username': f'user{user_id}'},
+                'text': ' '.join(rng.choice(words) for _ in range(rng.randint(2, 12))),
+            },
+        }
+
+def load_updates(path: str):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def post_update(url: str, secret: str, update: dict):
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), method='POST',
+        headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError:
+        status = 'error'
+    return status, time.perf_counter() - started
+
+def replay(url: str, secret: str, updates, concurrency: int):
+    updates = list(updates)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda u: post_update(url, secret, u), updates))
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(status for status, _ in results)
+    latencies = sorted(latency for _, latency in results)
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    else:
+        p50 = p99 = 0.0
+    print(json.dumps({
+        'updates': len(updates),
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(len(updates) / elapsed, 1) if elapsed else 0,
+        'statuses': {str(k): v for k, v in statuses.items()},
+        'p50_ms': round(p50, 2),
+        'p99_ms': round(p99, 2),
+    }, ensure_ascii=False, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='fake Bot API')
+    serve_parser.add_argument('--port', type=int, default=8081)
+
+    replay_parser = sub.add_parser('replay', help='отправка обновлений в webhook')
+    replay_parser.add_argument('--webhook', required=True)
+    replay_parser.add_argument('--secret', required=True)
+    replay_parser.add_argument('--updates', help='JSONL-файл с обновлениями')
+    replay_parser.add_argument('--count', type=int, default=500)
+    replay_parser.add_argument('--concurrency', type=int, default=8)
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.port)
+    else:
+        updates = load_updates(args.updates) if args.updates else generate_updates(args.count)
+        replay(args.webhook, args.secret, updates, args.concurrency)
+
+if __name__ == '__main__':
+    main()
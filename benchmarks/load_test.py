@@ -0,0 +1,360 @@
+"""Нагрузочный прогон конвейера: синтетический трафик групповых чатов
+
+Запуск: python -m benchmarks.load_test [--messages 20000] [--chats 50] [--output run.json]
+        python -m benchmarks.load_test --compare baseline.json
+Без DATABASE_URL используется временная SQLite-база; с DATABASE_URL
+(локальный Postgres) чаты прогона получают уникальные Telegram ID.
+
+Генератор выдает telebot Message: активность чатов, пользователи чата
+и слова следуют закону Ципфа, у каждого чата свои «коронные» фразы, часть
+чатов пишет в основном по-английски. При одном --seed трафик одинаков
+от коммита к коммиту.
+
+Сообщения проходят тот же путь, что и в SimpleBot: message_row, пачки
+MessageProcessor.process_batch и PatternLearner.analyze_messages,
+затем ответы ResponseGenerator.generate_response. Первая фаза — обучение
+(чаты в learning_mode), вторая — чаты на уровнях личности 1–4 с ответами
+на долю --respond-rate сообщений. В JSON: пропускная способность, p50/p99
+пачек и ответов, запросы к БД на сообщение, пиковый RSS и разбивка по
+этапам из bot.metrics.
+"""
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import accumulate
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db')
+
+import telebot
+from sqlalchemy import event, update
+
+from bot.database import Chat, SessionLocal, engine, init_db
+from bot.message_processor import MessageProcessor
+from bot.metrics import STAGE_SECONDS
+from bot.pattern_learner import PatternLearner
+from bot.personality_manager import PersonalityManager
+from bot.repository import repository
+from bot.response_generator import ResponseGenerator
+
+RU_WORDS = (
+    'привет как дела что сегодня вчера завтра погода работа кофе чай футбол матч машина '
+    'деньги отпуск кошка собака сериал фильм музыка игра телефон компьютер новости праздник '
+    'дорога ужин обед завтрак утро вечер ночь выходные пятница понедельник начальник проект '
+    'отчет встреча созвон дедлайн релиз баг сервер база данные код ревью тест задача '
+    'город метро пробка такси дача огород шашлык пиво вино торт подарок день рождения '
+    'мама папа брат сестра друг подруга сосед школа универ экзамен сессия лекция книга '
+    'спорт зал бег велосипед лыжи море пляж гора лес река рыбалка грибы снег дождь солнце '
+    'жара холод зима лето весна осень думаю кажется точно конечно наверное может давай '
+    'пойдем поедем смотрели слышали видели купил продал сломал починил забыл вспомнил '
+    'смешно круто отлично ужас кошмар класс норм огонь жесть капец ладно короче вообще'
+).split()
+
+EN_WORDS = (
+    'hello hi what today tomorrow weather work coffee tea football game car money vacation '
+    'cat dog series movie music phone computer news holiday dinner lunch breakfast morning '
+    'evening night weekend friday monday boss project report meeting call deadline release '
+    'bug server database data code review test ticket deploy python docker cloud city '
+    'train traffic beer wine cake gift birthday friend school exam book gym run bike sea '
+    'beach mountain rain sun snow hot cold think maybe sure lets go watched heard bought '
+    'broke fixed forgot lol great awesome terrible nice cool okay anyway actually really'
+).split()
+
+PUNCTUATION = ('', '', '', '!', '?', '...', ')', '))')
+
+def zipf_weights(n: int, s: float):
+    """Накопленные веса рангов 1..n по закону Ципфа с показателем s"""
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+class TrafficGenerator:
+    """Воспроизводимый поток сообщений групповых чатов"""
+
+    def __init__(self, chats: int = 50, users: int = 2000, seed: int = 42, zipf_s: float = 1.1,
+                 english_share: float = 0.2, catchphrase_rate: float = 0.15, id_offset: int = 0):
+        self.rng = random.Random(seed)
+        self.zipf_s = zipf_s
+        self.catchphrase_rate = catchphrase_rate
+        self.message_id = 0
+
+        rng = self.rng
+        self.chat_ids = [-(1000000000000 + id_offset + i) for i in range(chats)]
+        self.chat_weights = zipf_weights(chats, zipf_s)
+        self.chat_english = [rng.random() < english_share for _ in range(chats)]
+
+        # Участники чата — ранжированная выборка общего пула пользователей
+        self.users = [{'id': id_offset + 1 + i, 'username': f'user{i}', 'first_name': f'User{i}'}
+                      for i in range(users)]
+        self.members = []
+        for _ in range(chats):
+            size = min(users, max(3, int(rng.paretovariate(1.2) * 5)))
+            self.members.append(rng.sample(range(users), size))
+        self.member_weights = {}
+
+        # Частотный словарь: своя случайная перестановка рангов на язык
+        self.vocab = {}
+        for language, words in (('ru', RU_WORDS), ('en', EN_WORDS)):
+            ranked = list(words)
+            rng.shuffle(ranked)
+            self.vocab[language] = (ranked, zipf_weights(len(ranked), zipf_s))
+
+        # «Коронные» фразы чата повторяются внутри сообщения и дают паттерны
+        self.catchphrases = [[self._sentence('en' if english else 'ru', rng.randint(2, 4))
+                              for _ in range(3)]
+                             for english in self.chat_english]
+
+    def _pick(self, items, weights):
+        return items[bisect.bisect_left(weights, self.rng.random() * weights[-1])]
+
+    def _sentence(self, language: str, length: int) -> str:
+        words, weights = self.vocab[language]
+        return ' '.join(self._pick(words, weights) for _ in range(length))
+
+    def text(self, chat_index: int) -> str:
+        rng = self.rng
+        language = 'en' if self.chat_english[chat_index] else 'ru'
+        # Длина сообщения: в основном короткие реплики, изредка длинные
+        length = min(60, 1 + int(rng.expovariate(1 / 7)))
+        text = self._sentence(language, length)
+        if rng.random() < self.catchphrase_rate:
+            phrase = rng.choice(self.catchphrases[chat_index])
+            text = f'{phrase} {text} {phrase}'
+        return text + rng.choice(PUNCTUATION)
+
+    def message(self) -> telebot.types.Message:
+        chat_index = bisect.bisect_left(self.chat_weights, self.rng.random() * self.chat_weights[-1])
+        members = self.members[chat_index]
+        weights = self.member_weights.get(chat_index)
+        if weights is None:
+            weights = self.member_weights[chat_index] = zipf_weights(len(members), self.zipf_s)
+        user = self.users[self._pick(members, weights)]
+        self.message_id += 1
+        return telebot.types.Message.de_json({
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': self.chat_ids[chat_index], 'type': 'supergroup', 'title': f'Chat {chat_index}'},
+            'from': {'id': user['id'], 'is_bot': False, 'first_name': user['first_name'],
+                     'username': user['username']},
+            'text': self.text(chat_index),
+        })
+
+    def messages(self, count: int):
+        return [self.message() for _ in range(count)]
+
+class QueryCounter:
+    """Число запросов к БД (round-trips) через события engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def latency_summary(samples) -> dict:
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'max_ms': round(max(samples, default=0.0) * 1000, 3),
+    }
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def stage_summary() -> dict:
+    """Суммарное время и число вызовов этапов из bot.metrics"""
+    stages = {}
+    for labels, child in STAGE_SECONDS._series():
+        counts, total = child.snapshot()
+        stages[labels['stage']] = {'count': sum(counts), 'total_ms': round(total * 1000, 3)}
+    return stages
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+class Pipeline:
+    """Тот же конвейер, что и у SimpleBot, без Telegram и фоновых потоков"""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.processor = MessageProcessor()
+        self.learner = PatternLearner()
+        self.generator = ResponseGenerator(PersonalityManager())
+
+    def ingest(self, messages) -> list:
+        """Запись и обучение пачками; возвращает длительности пачек"""
+        durations = []
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            started = time.perf_counter()
+            rows = [self.processor.message_row(message) for message in batch]
+            with SessionLocal() as db:
+                stored, media, _ = self.processor.process_batch(rows, db)
+                self.learner.analyze_messages(stored, db)
+                self.learner.analyze_media(media, db)
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    def respond(self, message):
+        """Длительность генерации ответа и был ли он (None — нет паттернов)"""
+        started = time.perf_counter()
+        response = None
+        with SessionLocal() as db:
+            chat = repository.get_chat(db, str(message.chat.id))
+            if chat is not None:
+                response = self.generator.generate_response(
+                    chat['id'], {'text': message.text, 'user_id': message.from_user.id}, db)
+        return time.perf_counter() - started, response is not None
+
+    def flush(self):
+        with SessionLocal() as db:
+            self.learner.flush(db)
+            self.processor.flush(db)
+
+def activate_chats(chat_ids):
+    """Конец обучения: чаты на уровнях личности 1–4 по кругу"""
+    with SessionLocal() as db:
+        for index, chat_id in enumerate(chat_ids):
+            db.execute(update(Chat).where(Chat.chat_id == str(chat_id))
+                       .values(learning_mode=False, personality_level=index % 4 + 1))
+        db.commit()
+    for chat_id in chat_ids:
+        repository.chats.pop(str(chat_id))
+
+def run(args) -> dict:
+    init_db()
+    offset = 0 if engine.dialect.name == 'sqlite' else time.time_ns() % 10 ** 9 * 1000
+    generator = TrafficGenerator(chats=args.chats, users=args.users, seed=args.seed,
+                                 zipf_s=args.zipf, id_offset=offset)
+    learn_count = int(args.messages * args.learn_share)
+    learn_messages = generator.messages(learn_count)
+    live_messages = generator.messages(args.messages - learn_count)
+    rng = random.Random(args.seed + 1)
+    respond_to = [message for message in live_messages if rng.random() < args.respond_rate]
+
+    pipeline = Pipeline(args.batch_size)
+    queries = QueryCounter(engine)
+    started = time.perf_counter()
+
+    # Фаза 1: обучение
+    batch_durations = pipeline.ingest(learn_messages)
+    pipeline.flush()
+    ingest_queries = queries.count
+    activate_chats(generator.chat_ids)
+
+    # Фаза 2: запись, обучение и ответы
+    before = queries.count
+    batch_durations += pipeline.ingest(live_messages)
+    pipeline.flush()
+    ingest_seconds = sum(batch_durations)
+    ingest_queries += queries.count - before
+
+    before = queries.count
+    responses = [pipeline.respond(message) for message in respond_to]
+    response_durations = [elapsed for elapsed, _ in responses]
+    answered = sum(1 for _, ok in responses if ok)
+    response_queries = queries.count - before
+    total_seconds = time.perf_counter() - started
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'dialect': engine.dialect.name,
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'messages': args.messages,
+        'elapsed_s': round(total_seconds, 3),
+        'ingest': {
+            'messages_per_s': round(args.messages / ingest_seconds, 1) if ingest_seconds else 0.0,
+            'batch': latency_summary(batch_durations),
+            'db_queries_per_message': round(ingest_queries / args.messages, 3) if args.messages else 0.0,
+        },
+        'respond': {
+            'responses_per_s': round(len(respond_to) / sum(response_durations), 1) if response_durations else 0.0,
+            'latency': latency_summary(response_durations),
+            'answered_share': round(answered / len(respond_to), 3) if respond_to else 0.0,
+            'db_queries_per_response': round(response_queries / len(respond_to), 3) if respond_to else 0.0,
+        },
+        'db_queries_total': queries.count,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stage_summary(),
+    }
+
+# Ключевые показатели для --compare: путь в JSON и «больше — лучше»
+COMPARED = (
+    (('ingest', 'messages_per_s'), True),
+    (('ingest', 'batch', 'p50_ms'), False),
+    (('ingest', 'batch', 'p99_ms'), False),
+    (('ingest', 'db_queries_per_message'), False),
+    (('respond', 'latency', 'p50_ms'), False),
+    (('respond', 'latency', 'p99_ms'), False),
+    (('respond', 'db_queries_per_response'), False),
+    (('peak_rss_mb',), False),
+)
+
+def _lookup(result: dict, path):
+    for key in path:
+        result = result.get(key, {}) if isinstance(result, dict) else {}
+    return result if isinstance(result, (int, float)) else None
+
+def compare(baseline: dict, current: dict):
+    print(f"Сравнение с {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for key in ('dialect', 'params'):
+        if baseline.get(key) != current.get(key):
+            print(f"  ⚠️ Прогоны различаются ({key}): сравнение условно")
+    for path, higher_is_better in COMPARED:
+        old, new = _lookup(baseline, path), _lookup(current, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better if change else True
+        print(f"  {'.'.join(path):36s} {old:12.3f} -> {new:12.3f} {change:+7.1f}% {'✅' if better else '⚠️'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--zipf', type=float, default=1.1, help='показатель закона Ципфа')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--learn-share', type=float, default=0.5, help='доля сообщений фазы обучения')
+    parser.add_argument('--respond-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON (по умолчанию stdout)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    args = parser.parse_args()
+
+    result = run(args)
+    body = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(body + '\n')
+    else:
+        print(body)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from bot.config import Config
+from bot.main import ADMIN_STATUSES, CONTENT_TYPES, RESET_FORBIDDEN_TEXT, SimpleBot, WELCOME_TEXT
+
+logger = logging.getLogger(__name__)
+
+class AsyncBot(SimpleBot):
+    """Бот на AsyncTeleBot: один процесс обслуживает сотни чатов
+
+    Блокирующая работа с БД выполняется в отдельном пуле потоков, а число
+    одновременно обрабатываемых обновлений ограничено глобально и на чат.
+    Ответы уходят через OutboundDispatcher, как в синхронном боте: темп по
+    чатам, общий лимит, повторы после 429 и метрики задержки отправки.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=Config.ASYNC_DB_WORKERS,
+                                           thread_name_prefix='bot-db')
+        self.max_concurrency = Config.ASYNC_MAX_CONCURRENCY
+        self.per_chat_concurrency = Config.ASYNC_PER_CHAT_CONCURRENCY
+        # Семафоры создаются внутри цикла событий в _run()
+        self._global_slots = None
+        self._chat_slots: Dict[int, list] = {}  # chat_id -> [Semaphore, число задач]
+        self._tasks = set()
+        super().__init__()
+
+    def create_bot(self):
+        """Создание асинхронного клиента Telegram"""
+        from telebot.async_telebot import AsyncTeleBot
+        return AsyncTeleBot(self.token)
+
+    async def run_blocking(self, func, *args):
+        """Выполнение блокирующей функции в пуле потоков БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @asynccontextmanager
+    async def _chat_slot(self, chat_id: int):
+        """Ограничение параллельной обработки сообщений одного чата"""
+        slot = self._chat_slots.get(chat_id)
+        if slot is None:
+            slot = self._chat_slots[chat_id] = [asyncio.Semaphore(self.per_chat_concurrency), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._chat_slots[chat_id]
+
+    async def _dispatch(self, handler, message):
+        """Запуск обработчика фоновой задачей, чтобы не задерживать опрос
+
+        AsyncTeleBot ждет завершения всех обработчиков пачки обновлений перед
+        следующим getUpdates, поэтому обработка выносится в задачу. Глобальный
+        семафор берется до создания задачи: при перегрузке опрос притормаживает.
+        """
+        await self._global_slots.acquire()
+        task = asyncio.create_task(self._run_handler(handler, message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_handler(self, handler, message):
+        try:
+            async with self._chat_slot(message.chat.id):
+                await handler(message)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки сообщения: {e}")
+        finally:
+            self._global_slots.release()
+
+    def setup_handlers(self):
+        """Настройка асинхронных обработчиков
+
+        self.reply только ставит ответ в очередь диспетчера и не ждет Bot API.
+        """
+        async def send_welcome(message):
+            self.reply(message, WELCOME_TEXT, command=True, parse_mode='Markdown')
+
+        async def send_stats(message):
+            try:
+                stats_text = await self.run_blocking(self.stats_text)
+                self.reply(message, stats_text, command=True, parse_mode='Markdown')
+            except Exception as e:
+                self.reply(message, f"❌ Ошибка: {str(e)}", command=True)
+
+        async def send_reset(message):
+            try:
+                if message.chat.type != 'private':
+                    member = await self.bot.get_chat_member(message.chat.id, message.from_user.id)
+                    if member.status not in ADMIN_STATUSES:
+                        self.reply(message, RESET_FORBIDDEN_TEXT, command=True)
+                        return
+                reset_text = await self.run_blocking(self.reset_chat, message.chat.id)
+                self.reply(message, reset_text, command=True)
+            except Exception as e:
+                self.reply(message, f"❌ Ошибка: {str(e)}", command=True)
+
+        async def handle_message(message):
+            # put() может ждать при переполнении очереди записи
+            await self.run_blocking(self.store_message, message)
+
+            # Лимит может обращаться к Redis — не в цикле событий
+            response = await self.run_blocking(self.pick_response, message)
+            if response:
+                self.reply(message, response)
+
+            logger.info(f"📨 Сообщение от @{message.from_user.username}: {(message.text or message.content_type)[:50]}...")
+
+        @self.bot.message_handler(commands=['start', 'help'])
+        async def on_welcome(message):
+            await self._dispatch(send_welcome, message)
+
+        @self.bot.message_handler(commands=['stats'])
+        async def on_stats(message):
+            await self._dispatch(send_stats, message)
+
+        @self.bot.message_handler(commands=['reset'])
+        async def on_reset(message):
+            await self._dispatch(send_reset, message)
+
+        @self.bot.message_handler(func=lambda message: True, content_types=CONTENT_TYPES)
+        async def on_message(message):
+            await self._dispatch(handle_message, message)
+
+    async def _run(self):
+        self._global_slots = asyncio.Semaphore(self.max_concurrency)
+        self.start_dispatcher(loop=asyncio.get_running_loop())
+        try:
+            self.mark_ready()
+            await self.bot.infinity_polling(timeout=60, request_timeout=90)
+        finally:
+            # Дожидаемся начатых обработчиков, отправляем очередь и закрываем HTTP-сессию.
+            # Потоки отправки ждут корутины этого цикла, поэтому остановка — не в нем
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.run_blocking(self.stop_dispatcher)
+            await self.bot.close_session()
+
+    def run(self):
+        """Запуск бота в цикле событий asyncio"""
+        logger.info("🚀 Запускаю Telegram бота (async)...")
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            logger.error(f"❌ Ошибка в боте: {e}")
+            raise
+        finally:
+            from bot import readiness
+            readiness.mark_stopping()
+            self.stop_ingestion()
+            self.executor.shutdown(wait=True)
+            self.log_pool_stats()
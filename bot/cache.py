@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Optional
+
+from bot.config import Config
+
+_MISSING = object()
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удаление записи (инвалидация)"""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+class KeyedLocks:
+    """Блокировки по ключу: ждут только вызовы с тем же ключом
+
+    Блокировка создается при первом обращении и удаляется, когда ее никто
+    не держит и не ждет, поэтому словарь не растет с числом ключей.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, list] = {}  # ключ -> [Lock, число держащих и ждущих]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+# Общие на процесс кэши строк chats и users (ключ — Telegram ID строкой)
+chat_cache = LRUCache(maxsize=Config.CACHE_MAX_CHATS, ttl=Config.CACHE_TTL)
+user_cache = LRUCache(maxsize=Config.CACHE_MAX_USERS, ttl=Config.CACHE_TTL)
+
+def invalidate_chat(chat_id: Any):
+    """Сброс закэшированного чата (после /reset или смены режима)"""
+    chat_cache.pop(str(chat_id))
@@ -12,14 +12,112 @@ class Config:
     if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
     
+    # Пул соединений SQLAlchemy (общий для всех обработчиков процесса)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 300))
+    # sslmode для PostgreSQL (require на Railway); пусто — по умолчанию libpq
+    DB_SSLMODE = os.getenv('DB_SSLMODE')
+    
+    # Пакетная запись входящих сообщений
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 200))
+    INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', 1.0))
+    INGEST_MAX_QUEUE = int(os.getenv('INGEST_MAX_QUEUE', 10000))
+    INGEST_PUT_TIMEOUT = float(os.getenv('INGEST_PUT_TIMEOUT', 2.0))
+    
+    # Выгрузка накопленных n-грамм в таблицу patterns
+    PATTERN_FLUSH_INTERVAL = float(os.getenv('PATTERN_FLUSH_INTERVAL', 5.0))
+    PATTERN_FLUSH_MAX_PENDING = int(os.getenv('PATTERN_FLUSH_MAX_PENDING', 5000))
+    
+    # Кэш строк chats/users в MessageProcessor
+    CACHE_MAX_CHATS = int(os.getenv('CACHE_MAX_CHATS', 10000))
+    CACHE_MAX_USERS = int(os.getenv('CACHE_MAX_USERS', 100000))
+    CACHE_TTL = float(os.getenv('CACHE_TTL', 600))
+    USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', 10.0))
+    
+    # Ответы стикерами и GIF: доля ответов, top-k чата и минимальная частота
+    MEDIA_RESPONSE_RATE = float(os.getenv('MEDIA_RESPONSE_RATE', 0.1))
+    MEDIA_TOP_K = int(os.getenv('MEDIA_TOP_K', 20))
+    MEDIA_MIN_FREQUENCY = int(os.getenv('MEDIA_MIN_FREQUENCY', 2))
+    MEDIA_INDEX_MAX_CHATS = int(os.getenv('MEDIA_INDEX_MAX_CHATS', 1000))
+    # Сколько медиа чата хранит индекс и сколько file_id еще редких медиа
+    MEDIA_INDEX_MAX_ENTRIES = int(os.getenv('MEDIA_INDEX_MAX_ENTRIES', 500))
+    MEDIA_RECENT_FILE_IDS = int(os.getenv('MEDIA_RECENT_FILE_IDS', 256))
+    
+    # Профили стиля пользователей (уровни личности 3 и 4)
+    STYLE_PROFILE_MAX_USERS = int(os.getenv('STYLE_PROFILE_MAX_USERS', 10000))
+    STYLE_PROFILE_FLUSH_INTERVAL = float(os.getenv('STYLE_PROFILE_FLUSH_INTERVAL', 30.0))
+    
+    # Выгрузка дневной статистики чатов в таблицу statistics
+    STATS_FLUSH_INTERVAL = float(os.getenv('STATS_FLUSH_INTERVAL', 10.0))
+    
+    # Обслуживание БД: помесячные секции messages, срок хранения, уплотнение patterns
+    MESSAGE_PARTITIONING = os.getenv('MESSAGE_PARTITIONING', 'true').lower() == 'true'
+    MESSAGE_PARTITIONS_AHEAD = int(os.getenv('MESSAGE_PARTITIONS_AHEAD', 2))
+    # 0 — хранить сообщения бессрочно
+    MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', 0))
+    # archive — перенести секцию в MESSAGE_ARCHIVE_SCHEMA, drop — удалить
+    MESSAGE_RETENTION_ACTION = os.getenv('MESSAGE_RETENTION_ACTION', 'archive')
+    MESSAGE_ARCHIVE_SCHEMA = os.getenv('MESSAGE_ARCHIVE_SCHEMA', 'archive')
+    PATTERN_STALE_DAYS = int(os.getenv('PATTERN_STALE_DAYS', 90))
+    # Порог в повторах (Pattern.frequency): n-граммы сохраняются сразу с частотой
+    # не меньше PatternLearner.MIN_COUNT (2), поэтому порог ниже 2 ничего не удалит
+    PATTERN_COMPACT_MAX_FREQUENCY = int(os.getenv('PATTERN_COMPACT_MAX_FREQUENCY', 2))
+    MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 3600))
+    
+    # Инвертированный индекс паттернов (число чатов в памяти)
+    PATTERN_INDEX_MAX_CHATS = int(os.getenv('PATTERN_INDEX_MAX_CHATS', 1000))
+    
+    # N-граммные модели чатов для уровней личности 3 и 4 (число чатов в памяти)
+    LANGUAGE_MODEL_MAX_CHATS = int(os.getenv('LANGUAGE_MODEL_MAX_CHATS', 500))
+    
     # Redis (для кэширования)
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
     
+    # Режим работы бота: threaded (TeleBot), async (AsyncTeleBot) или webhook
+    BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'threaded')
+    ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', 200))
+    ASYNC_PER_CHAT_CONCURRENCY = int(os.getenv('ASYNC_PER_CHAT_CONCURRENCY', 1))
+    ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', 8))
+    
+    # Webhook: обновления принимает веб-приложение по /telegram/webhook
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+    WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+    
     # Настройки бота
     LEARNING_HOURS = int(os.getenv('LEARNING_HOURS', 72))
     RESPONSE_RATE = float(os.getenv('RESPONSE_RATE', 0.3))
     MAX_MESSAGES_PER_DAY = int(os.getenv('MAX_MESSAGES_PER_DAY', 500))
     RATE_LIMIT_SECONDS = int(os.getenv('RATE_LIMIT_SECONDS', 120))
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 1))
+    # local — лимит в памяти процесса, redis — общий для всех воркеров и реплик
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+    # Сколько ключей (чатов) хранит локальный лимит в памяти
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+    
+    # Исходящие сообщения: темп по лимитам Telegram (30 сообщений/с всего,
+    # 1 в секунду в личный чат, ~20 в минуту в группу)
+    SEND_WORKERS = int(os.getenv('SEND_WORKERS', 4))
+    SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 30))
+    SEND_CHAT_INTERVAL = float(os.getenv('SEND_CHAT_INTERVAL', 1.0))
+    SEND_GROUP_INTERVAL = float(os.getenv('SEND_GROUP_INTERVAL', 3.0))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', 5))
+    SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', 10000))
+    # Статистика задержки чата забывается, если в него не писали столько секунд
+    SEND_CHAT_IDLE_SECONDS = float(os.getenv('SEND_CHAT_IDLE_SECONDS', 3600))
+    # Сколько самых активных чатов отдается в /metrics с меткой chat
+    SEND_LATENCY_EXPORT_CHATS = int(os.getenv('SEND_LATENCY_EXPORT_CHATS', 20))
+    
+    # Метрики Prometheus: /metrics веб-панели и HTTP-сервер воркера (0 — не запускать)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    METRICS_SLOW_TRACE_MS = float(os.getenv('METRICS_SLOW_TRACE_MS', 1000))
+    # Файл-признак готовности воркера для exec-проверок (пусто — не писать)
+    READY_FILE = os.getenv('READY_FILE')
     
     # Настройки веб-панели
     WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
@@ -31,6 +129,9 @@ class Config:
         'политика', 'религия', 'экстремизм', 'национализм',
         'расизм', 'ксенофобия', 'порно', 'наркотики'
     ]
+    # Дополнительные термины из файла (по одному на строку), перечитываются на лету
+    BLACKLIST_FILE = os.getenv('BLACKLIST_FILE')
+    BLACKLIST_RELOAD_INTERVAL = float(os.getenv('BLACKLIST_RELOAD_INTERVAL', 30))
     
     @classmethod
     def validate(cls):
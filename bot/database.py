@@ -1,17 +1,65 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
-from datetime import datetime
-import pytz
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timezone
+import logging
+import threading
+import time
 
 from bot.config import Config
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
-# Создаем engine для PostgreSQL
-engine = create_engine(Config.DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+class TimedQueuePool(QueuePool):
+    """QueuePool, который считает время ожидания свободного соединения"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+def _engine_options(url: str) -> dict:
+    """Параметры пула соединений из Config"""
+    options = {'pool_pre_ping': True, 'pool_recycle': Config.DB_POOL_RECYCLE}
+    if url and url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:'):
+        # In-memory SQLite живет в одном соединении, пул не нужен
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+    )
+    if url and url.startswith('postgresql') and Config.DB_SSLMODE:
+        options['connect_args'] = {'sslmode': Config.DB_SSLMODE}
+    return options
+
+# Единый engine на процесс: все обработчики берут соединения из одного пула
+engine = create_engine(Config.DATABASE_URL, **_engine_options(Config.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if Config.METRICS_ENABLED:
+    from bot.metrics import instrument_engine, registry
+    
+    instrument_engine(engine)
+    registry.register_collector('db_pool', lambda: _pool_metrics())
+
 class Chat(Base):
     __tablename__ = 'chats'
     
@@ -22,7 +70,7 @@ class Chat(Base):
     learning_mode = Column(Boolean, default=True)
     learning_end_time = Column(DateTime)
     personality_level = Column(Integer, default=1)
-    created_at = Column(DateTime, default=datetime.now(pytz.UTC))
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
     
     messages = relationship("Message", back_populates="chat")
     patterns = relationship("Pattern", back_populates="chat")
@@ -37,15 +85,22 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     message_count = Column(Integer, default=0)
-    style_patterns = Column(Text)  # JSON
-    last_seen = Column(DateTime, default=datetime.now(pytz.UTC))
-    created_at = Column(DateTime, default=datetime.now(pytz.UTC))
+    style_patterns = Column(Text)  # JSON (не используется, см. style_profile)
+    style_profile = Column(LargeBinary)  # bot.style_profile.StyleProfile.to_bytes()
+    last_seen = Column(DateTime, default=datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
     
     messages = relationship("Message", back_populates="user")
     patterns = relationship("Pattern", back_populates="user")
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset-пагинация по (timestamp, id): общая лента и фильтры по чату/пользователю
+        Index('ix_messages_timestamp_id', 'timestamp', 'id'),
+        Index('ix_messages_chat_timestamp_id', 'chat_id', 'timestamp', 'id'),
+        Index('ix_messages_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('chats.id'))
@@ -53,7 +108,8 @@ class Message(Base):
     message_id = Column(Integer)
     text = Column(Text)
     message_type = Column(String)  # text, sticker, photo, etc.
-    timestamp = Column(DateTime, default=datetime.now(pytz.UTC))
+    # Ключ секционирования в PostgreSQL (см. bot.maintenance)
+    timestamp = Column(DateTime, default=datetime.now)
     is_processed = Column(Boolean, default=False)
     has_reaction = Column(Boolean, default=False)
     
@@ -62,26 +118,34 @@ class Message(Base):
 
 class Pattern(Base):
     __tablename__ = 'patterns'
+    __table_args__ = (
+        # Ключ для INSERT ... ON CONFLICT при пакетной выгрузке n-грамм
+        Index('ix_patterns_chat_type_text', 'chat_id', 'pattern_type', 'pattern_text', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('chats.id'))
     user_id = Column(Integer, ForeignKey('users.id'))
     pattern_text = Column(Text, nullable=False)
-    pattern_type = Column(String)  # word, phrase, sticker, joke, topic
+    pattern_type = Column(String)  # word, phrase, sticker, animation, joke, topic
     frequency = Column(Integer, default=1)
-    context = Column(Text)  # JSON контекста
+    context = Column(Text)  # JSON контекста (у стикеров и GIF — file_id)
     last_used = Column(DateTime)
-    created_at = Column(DateTime, default=datetime.now(pytz.UTC))
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
     
     chat = relationship("Chat", back_populates="patterns")
     user = relationship("User", back_populates="patterns")
 
 class Statistic(Base):
     __tablename__ = 'statistics'
+    __table_args__ = (
+        # Одна строка на чат и день: счетчики копятся через ON CONFLICT
+        Index('ix_statistics_chat_date', 'chat_id', 'date', unique=True),
+    )
     
     id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('chats.id'))
-    date = Column(DateTime, default=datetime.now(pytz.UTC))
+    date = Column(DateTime, default=datetime.now(timezone.utc))
     total_messages = Column(Integer, default=0)
     bot_responses = Column(Integer, default=0)
     avg_response_time = Column(Float, default=0.0)
@@ -93,10 +157,11 @@ class Reaction(Base):
     __tablename__ = 'reactions'
     
     id = Column(Integer, primary_key=True)
-    message_id = Column(Integer, ForeignKey('messages.id'))
+    # Без внешнего ключа: первичный ключ секционированной messages — (id, timestamp)
+    message_id = Column(Integer)
     reaction_type = Column(String)  # like, dislike, funny, etc.
     user_id = Column(Integer)
-    timestamp = Column(DateTime, default=datetime.now(pytz.UTC))
+    timestamp = Column(DateTime, default=datetime.now(timezone.utc))
 
 class Quote(Base):
     __tablename__ = 'quotes'
@@ -108,11 +173,102 @@ class Quote(Base):
     week_number = Column(Integer)
     year = Column(Integer)
     votes = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.now(pytz.UTC))
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
 
-# Создание таблиц
+def _merge_duplicate_patterns(conn):
+    """Схлопывание дублей patterns перед созданием уникального индекса"""
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text("""
+        WITH dups AS (
+            SELECT MIN(id) AS keep_id, SUM(frequency) AS total
+            FROM patterns
+            GROUP BY chat_id, pattern_type, pattern_text
+            HAVING COUNT(*) > 1
+        )
+        UPDATE patterns p SET frequency = dups.total
+        FROM dups WHERE p.id = dups.keep_id
+    """))
+    conn.execute(text("""
+        DELETE FROM patterns p USING patterns q
+        WHERE p.chat_id = q.chat_id
+          AND p.pattern_type = q.pattern_type
+          AND p.pattern_text = q.pattern_text
+          AND p.id > q.id
+    """))
+
+# Подготовка данных перед созданием индекса на существующей таблице
+_BEFORE_INDEX = {
+    'ix_patterns_chat_type_text': _merge_duplicate_patterns,
+}
+
+def _ensure_indexes():
+    """Создание индексов из моделей на уже существующих таблицах"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with engine.begin() as conn:
+                    prepare = _BEFORE_INDEX.get(index.name)
+                    if prepare:
+                        prepare(conn)
+                    index.create(bind=conn)
+                logger.info(f"Создан индекс {index.name}")
+            except Exception as e:
+                logger.error(f"Не удалось создать индекс {index.name}: {e}")
+
+# Создание и обновление схемы
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from bot.migrations import migrate
+    
+    from bot.maintenance import init_partitioning
+    
+    migrate()
+    # Секции messages на ближайшие месяцы (новая БД получает их в миграции)
+    with engine.begin() as conn:
+        init_partitioning(conn)
+    _ensure_indexes()
+
+def get_pool_stats() -> dict:
+    """Статистика пула соединений для подбора его размера"""
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=Config.DB_MAX_OVERFLOW,
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            wait_total_ms=round(pool.wait_total * 1000, 3),
+            wait_avg_ms=round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+            wait_max_ms=round(pool.wait_max * 1000, 3),
+        )
+    return stats
+
+def _pool_metrics():
+    """Состояние пула соединений для /metrics"""
+    stats = get_pool_stats()
+    families = []
+    for key, name, kind, documentation in (
+        ('checked_out', 'chatclone_db_pool_checked_out', 'gauge', 'Занятые соединения пула'),
+        ('overflow', 'chatclone_db_pool_overflow', 'gauge',
+         'Соединения сверх pool_size (отрицательное — свободные места пула)'),
+        ('checkouts', 'chatclone_db_pool_checkouts_total', 'counter', 'Выдачи соединений из пула'),
+    ):
+        if key in stats:
+            families.append((name, kind, documentation, [({}, stats[key])]))
+    if 'wait_total_ms' in stats:
+        families.append(('chatclone_db_pool_wait_seconds_total', 'counter', 'Суммарное ожидание соединения',
+                         [({}, stats['wait_total_ms'] / 1000)]))
+    return families
 
 def get_db() -> Session:
     """Получение сессии базы данных"""
@@ -0,0 +1,329 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from bot.config import Config
+from bot.metrics import SEND_LATENCY_SECONDS, span
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше — раньше
+PRIORITY_COMMAND = 0
+PRIORITY_REPLY = 10
+
+# Сколько последних задержек хранится на чат для перцентилей
+LATENCY_SAMPLES = 200
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'chat_id', 'func', 'args', 'kwargs', 'enqueued_at', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, func, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class _ChatState:
+    __slots__ = ('jobs', 'next_send', 'busy', 'scheduled', 'latencies', 'sent', 'failed', 'flood_waits',
+                 'last_active')
+
+    def __init__(self):
+        self.jobs = []  # куча _Job по (priority, seq)
+        self.next_send = 0.0  # monotonic-время, раньше которого в чат не пишем
+        self.busy = False  # сообщение чата уже отправляется
+        self.scheduled = False  # чат стоит в очереди планировщика
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.last_active = time.monotonic()  # последняя постановка в очередь или отправка
+
+class OutboundDispatcher:
+    """Очередь исходящих сообщений с темпом отправки по лимитам Telegram
+
+    Обработчики обновлений только ставят отправку в очередь и сразу
+    возвращаются. Пул потоков отправляет сообщения по приоритету, не чаще
+    одного раза в chat_interval (group_interval для групп) в каждый чат и не
+    больше global_rate сообщений в секунду всего. Сообщения одного чата
+    уходят по очереди, а ответ 429 откладывает только этот чат на
+    retry_after секунд. Каждый поток pyTelegramBotAPI держит свою
+    requests-сессию, поэтому соединения с Bot API переиспользуются.
+    Статистика чата, в который не писали idle_seconds, удаляется.
+
+    С loop диспетчер обслуживает и AsyncTeleBot: корутина вызова Bot API
+    выполняется в этом цикле событий, а поток отправки ждет ее результата,
+    так что темп, повторы и метрики те же.
+    """
+
+    def __init__(self, workers: int = None, global_rate: float = None,
+                 chat_interval: float = None, group_interval: float = None,
+                 max_retries: int = None, max_size: int = None, idle_seconds: float = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.workers = workers or Config.SEND_WORKERS
+        self.global_rate = global_rate or Config.SEND_GLOBAL_RATE
+        self.chat_interval = chat_interval if chat_interval is not None else Config.SEND_CHAT_INTERVAL
+        self.group_interval = group_interval if group_interval is not None else Config.SEND_GROUP_INTERVAL
+        self.max_retries = max_retries if max_retries is not None else Config.SEND_MAX_RETRIES
+        self.max_size = max_size or Config.SEND_QUEUE_SIZE
+        self.idle_seconds = idle_seconds if idle_seconds is not None else Config.SEND_CHAT_IDLE_SECONDS
+        self.loop = loop
+
+        self._chats: Dict[Any, _ChatState] = {}
+        self._waiting = []  # куча (monotonic-время готовности, chat_id)
+        self._ready = []  # куча (priority, seq, chat_id) — чаты, которым уже можно писать
+        self._pending = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._swept_at = time.monotonic()
+
+        # Глобальное ведро токенов
+        self._tokens = float(self.global_rate)
+        self._tokens_at = time.monotonic()
+
+        self.stats = {'enqueued': 0, 'sent': 0, 'failed': 0, 'dropped': 0, 'flood_waits': 0, 'retries': 0}
+
+    def start(self):
+        with self._cond:
+            self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'sender-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """Отправка оставшихся сообщений и остановка потоков"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if self._pending:
+            logger.warning(f"⚠️ Не отправлено сообщений при остановке: {self._pending}")
+        self._threads = []
+
+    def submit(self, chat_id, func: Callable, *args, priority: int = PRIORITY_REPLY, **kwargs) -> bool:
+        """Поставить вызов Bot API в очередь чата; False — очередь переполнена"""
+        with self._cond:
+            if self._pending >= self.max_size:
+                self.stats['dropped'] += 1
+                return False
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _ChatState()
+            chat.last_active = time.monotonic()
+            heapq.heappush(chat.jobs, _Job(priority, next(self._seq), chat_id, func, args, kwargs))
+            self._pending += 1
+            self.stats['enqueued'] += 1
+            self._schedule(chat_id, chat)
+            self._cond.notify()
+        return True
+
+    def reply_to(self, bot, message, text: str, priority: int = PRIORITY_REPLY, **kwargs) -> bool:
+        """Аналог bot.reply_to через очередь"""
+        return self.submit(message.chat.id, bot.reply_to, message, text, priority=priority, **kwargs)
+
+    def reply_media(self, bot, message, media, priority: int = PRIORITY_REPLY) -> bool:
+        """Ответ стикером или GIF (bot.media_index.MediaReply) через очередь"""
+        send = bot.send_sticker if media.media_type == 'sticker' else bot.send_animation
+        return self.submit(message.chat.id, send, message.chat.id, media.file_id, priority=priority,
+                           reply_to_message_id=message.message_id)
+
+    def qsize(self) -> int:
+        return self._pending
+
+    def _interval(self, chat_id) -> float:
+        # Отрицательный id у групп и каналов: там лимит Telegram строже
+        try:
+            is_group = int(chat_id) < 0
+        except (TypeError, ValueError):
+            is_group = False
+        return self.group_interval if is_group else self.chat_interval
+
+    def _schedule(self, chat_id, chat: _ChatState):
+        """Поставить чат в очередь планировщика, если ему есть что отправить"""
+        if chat.busy or chat.scheduled or not chat.jobs:
+            return
+        chat.scheduled = True
+        now = time.monotonic()
+        if chat.next_send <= now:
+            head = chat.jobs[0]
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        else:
+            heapq.heappush(self._waiting, (chat.next_send, next(self._seq), chat_id))
+
+    def _take_token(self, now: float) -> float:
+        """0 — токен взят, иначе сколько ждать следующего"""
+        self._tokens = min(self.global_rate, self._tokens + (now - self._tokens_at) * self.global_rate)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.global_rate
+
+    def _next_job(self) -> Optional[_Job]:
+        """Следующее сообщение с учетом темпа; None — пора завершаться"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._waiting)
+                    head = self._chats[chat_id].jobs[0]
+                    heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+
+                timeout = None
+                if self._ready:
+                    wait = self._take_token(now)
+                    if wait == 0.0:
+                        _, _, chat_id = heapq.heappop(self._ready)
+                        chat = self._chats[chat_id]
+                        chat.scheduled = False
+                        chat.busy = True
+                        return heapq.heappop(chat.jobs)
+                    timeout = wait
+                elif self._waiting:
+                    timeout = self._waiting[0][0] - now
+
+                if self._stopping and not self._pending:
+                    return None
+                self._cond.wait(timeout)
+
+    def _finish(self, job: _Job, requeue: bool, delay: float):
+        with self._cond:
+            chat = self._chats[job.chat_id]
+            chat.busy = False
+            chat.next_send = time.monotonic() + delay
+            if requeue:
+                heapq.heappush(chat.jobs, job)
+            else:
+                self._pending -= 1
+            if chat.jobs:
+                self._schedule(job.chat_id, chat)
+            elif not chat.latencies and not chat.sent:
+                del self._chats[job.chat_id]
+            self._sweep(time.monotonic())
+            self._cond.notify_all()
+
+    def _sweep(self, now: float):
+        """Удаление простаивающих чатов (не чаще раза в минуту, под self._cond)"""
+        if now - self._swept_at < min(60.0, self.idle_seconds):
+            return
+        self._swept_at = now
+        cutoff = now - self.idle_seconds
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if chat.last_active < cutoff and not chat.jobs and not chat.busy and not chat.scheduled]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def _call(self, job: _Job):
+        result = job.func(*job.args, **job.kwargs)
+        if self.loop is not None and inspect.isawaitable(result):
+            # Вызов AsyncTeleBot: ждем корутину из потока отправки
+            result = asyncio.run_coroutine_threadsafe(result, self.loop).result()
+        return result
+
+    def _worker(self):
+        from telebot.apihelper import ApiTelegramException
+
+        api_errors = (ApiTelegramException,)
+        if self.loop is not None:
+            from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+            api_errors += (AsyncApiTelegramException,)
+
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+
+            job.attempts += 1
+            interval = self._interval(job.chat_id)
+            try:
+                with span('send'):
+                    self._call(job)
+            except api_errors as e:
+                if e.error_code == 429 and job.attempts <= self.max_retries:
+                    retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    self._record(job, 'flood_waits')
+                    logger.warning(f"⏳ Flood wait в чате {job.chat_id}: {retry_after} с")
+                    self._finish(job, requeue=True, delay=retry_after)
+                else:
+                    # Ошибки запроса (чат недоступен, сообщение удалено) не повторяем
+                    self._record(job, 'failed')
+                    logger.error(f"❌ Не удалось отправить сообщение в чат {job.chat_id}: {e}")
+                    self._finish(job, requeue=False, delay=interval)
+            except Exception as e:
+                if job.attempts <= self.max_retries:
+                    self._record(job, 'retries')
+                    self._finish(job, requeue=True, delay=min(30.0, 2 ** job.attempts))
+                else:
+                    self._record(job, 'failed')
+                    logger.error(f"❌ Сообщение в чат {job.chat_id} не отправлено после {job.attempts} попыток: {e}")
+                    self._finish(job, requeue=False, delay=interval)
+            else:
+                self._record(job, 'sent')
+                self._finish(job, requeue=False, delay=interval)
+
+    def _record(self, job: _Job, outcome: str):
+        with self._cond:
+            self.stats[outcome] += 1
+            chat = self._chats[job.chat_id]
+            if outcome == 'sent':
+                latency = time.monotonic() - job.enqueued_at
+                chat.sent += 1
+                chat.latencies.append(latency)
+                chat.last_active = time.monotonic()
+                SEND_LATENCY_SECONDS.observe(latency)
+            elif outcome == 'failed':
+                chat.failed += 1
+            elif outcome == 'flood_waits':
+                chat.flood_waits += 1
+
+    def latency_stats(self, chat_id=None) -> Dict[Any, dict]:
+        """Задержка от постановки в очередь до отправки по чатам (мс)"""
+        with self._cond:
+            chats = {chat_id: self._chats.get(chat_id)} if chat_id is not None else dict(self._chats)
+            result = {}
+            for key, chat in chats.items():
+                if chat is None or not chat.latencies:
+                    continue
+                samples = sorted(chat.latencies)
+                result[key] = {
+                    'sent': chat.sent,
+                    'failed': chat.failed,
+                    'flood_waits': chat.flood_waits,
+                    'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+                    'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                    'max_ms': round(samples[-1] * 1000, 1),
+                }
+            return result
+
+    def latency_metrics(self, limit: int = None):
+        """Перцентили задержки самых активных чатов для реестра метрик (сборщик)"""
+        limit = Config.SEND_LATENCY_EXPORT_CHATS if limit is None else limit
+        with self._cond:
+            ids = heapq.nlargest(limit, (chat_id for chat_id, chat in self._chats.items() if chat.latencies),
+                                 key=lambda chat_id: self._chats[chat_id].sent)
+        samples = []
+        for chat_id in ids:
+            chat = self.latency_stats(chat_id).get(chat_id)
+            if chat is None:
+                continue
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms')):
+                samples.append(({'chat': str(chat_id), 'quantile': quantile}, chat[key] / 1000))
+        return [('chatclone_send_chat_latency_seconds', 'gauge',
+                 'Задержка отправки ответов по самым активным чатам', samples)]
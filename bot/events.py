@@ -0,0 +1,53 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+from sqlalchemy import text
+
+# Канал Postgres LISTEN/NOTIFY для живой ленты веб-панели
+EVENTS_CHANNEL = 'chat_clone_events'
+
+# NOTIFY ограничен 8000 байт: в событие попадает только хвост пачки
+MAX_EVENT_MESSAGES = 10
+MAX_EVENT_TEXT = 200
+MAX_PAYLOAD_BYTES = 7900
+
+def messages_event(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Событие о новых сообщениях: прирост счетчиков и последние сообщения"""
+    now = datetime.now().isoformat()
+    chats: Dict[str, int] = {}
+    for row in rows:
+        key = str(row.get('chat_id'))
+        chats[key] = chats.get(key, 0) + 1
+    return {
+        'type': 'messages',
+        'count': len(rows),
+        'chats': chats,
+        'messages': [
+            {
+                'chat_id': row.get('chat_id'),
+                'user_id': row.get('user_id'),
+                'text': (row.get('text') or '')[:MAX_EVENT_TEXT],
+                'created_at': row.get('created_at') or now,
+            }
+            for row in rows[-MAX_EVENT_MESSAGES:]
+        ],
+    }
+
+def _encode(event: Dict[str, Any]) -> str:
+    return json.dumps(event, ensure_ascii=False, default=str)
+
+def publish(conn, event: Dict[str, Any]):
+    """NOTIFY в текущей транзакции: событие уйдет подписчикам после коммита"""
+    if conn.dialect.name != 'postgresql':
+        return
+    payload = _encode(event)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        event = dict(event, messages=list(event.get('messages', [])))
+        while event['messages'] and len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            event['messages'].pop(0)
+            payload = _encode(event)
+        if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            event.pop('chats', None)
+            payload = _encode(event)
+    conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                 {'channel': EVENTS_CHANNEL, 'payload': payload})
@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Any
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Будит поток записи при остановке, чтобы он не ждал flush_interval
+_WAKEUP = object()
+
+class IngestionQueue:
+    """Буфер входящих сообщений с пакетной (write-behind) записью в БД
+
+    Обработчики кладут строки в ограниченную очередь, а фоновый поток
+    записывает их пачками, когда набирается batch_size строк или проходит
+    flush_interval секунд с момента первой строки в пачке.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], None],
+                 batch_size: int = None, flush_interval: float = None,
+                 max_size: int = None, put_timeout: float = None,
+                 max_retries: int = 3):
+        self.write_batch = write_batch
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else Config.INGEST_FLUSH_INTERVAL
+        self.put_timeout = put_timeout if put_timeout is not None else Config.INGEST_PUT_TIMEOUT
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=max_size or Config.INGEST_MAX_QUEUE)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failed_batches': 0}
+
+    def start(self):
+        """Запуск фонового потока записи"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ingestion-flusher', daemon=True)
+        self._thread.start()
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """Поставить строку в очередь; блокируется при переполнении (backpressure)"""
+        if self._stop.is_set():
+            self._count('dropped')
+            return False
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(f"⚠️ Очередь записи переполнена ({self._queue.maxsize}), сообщение отброшено")
+            return False
+        self._count('enqueued')
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """Остановка с записью всего, что осталось в очереди"""
+        if not self._thread:
+            return
+        self._stop.set()
+        try:
+            self._queue.put_nowait(_WAKEUP)
+        except queue.Full:
+            pass  # очередь полна — поток и так не ждет
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"❌ Очередь записи не успела сброситься, осталось {self._queue.qsize()} строк")
+        self._thread = None
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _run(self):
+        batch = []
+        batch_started = None
+
+        while True:
+            if batch:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - batch_started))
+            else:
+                timeout = self.flush_interval
+
+            try:
+                row = self._queue.get(timeout=timeout)
+                if row is not _WAKEUP:
+                    batch.append(row)
+                    if batch_started is None:
+                        batch_started = time.monotonic()
+                # Забираем всё, что уже накопилось, не дожидаясь таймаута
+                while len(batch) < self.batch_size:
+                    row = self._queue.get_nowait()
+                    if row is not _WAKEUP:
+                        batch.append(row)
+            except queue.Empty:
+                pass
+
+            stopping = self._stop.is_set()
+            due = batch and (len(batch) >= self.batch_size
+                             or time.monotonic() - batch_started >= self.flush_interval)
+            if batch and (due or stopping):
+                self._flush(batch)
+                batch = []
+                batch_started = None
+
+            if stopping and not batch and self._queue.empty():
+                break
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        """Запись пачки с повторными попытками"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_batch(batch)
+                self._count('written', len(batch))
+                self._count('batches')
+                return
+            except Exception as e:
+                if attempt < self.max_retries:
+                    logger.warning(f"⚠️ Ошибка записи пачки ({len(batch)} строк), повтор: {e}")
+                    time.sleep(0.5 * 2 ** attempt)
+                else:
+                    logger.error(f"❌ Пачка из {len(batch)} строк потеряна: {e}")
+                    self._count('failed_batches')
+                    self._count('dropped', len(batch))
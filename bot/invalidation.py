@@ -0,0 +1,99 @@
+import json
+import logging
+import select
+import threading
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres LISTEN/NOTIFY для сброса кэшей паттернов в работающих ботах
+INVALIDATION_CHANNEL = 'chat_clone_invalidate'
+
+# Таблица patterns пересобрана (bot.relearn): id и частоты паттернов другие
+PATTERNS_REBUILT = 'patterns_rebuilt'
+
+def notify(cur, event_type: str):
+    """NOTIFY через курсор psycopg2 в текущей транзакции: боты получат его после коммита"""
+    cur.execute("SELECT pg_notify(%s, %s)", (INVALIDATION_CHANNEL, json.dumps({'type': event_type})))
+
+def clear_pattern_caches():
+    """Сброс всех индексов паттернов процесса: чаты перезагрузятся из БД при обращении"""
+    from bot.language_model import language_model
+    from bot.media_index import media_index
+    from bot.pattern_index import pattern_index
+
+    pattern_index.clear()
+    language_model.clear()
+    media_index.clear()
+
+class InvalidationListener:
+    """Поток с LISTEN на INVALIDATION_CHANNEL: сбрасывает кэши по сигналу
+
+    Одно соединение на процесс бота; при обрыве переподключается с паузой,
+    а после переподключения кэши сбрасываются — сигнал мог быть пропущен.
+    """
+
+    def __init__(self, dsn: str = None, connect_kwargs: dict = None):
+        self.dsn = dsn or Config.DATABASE_URL
+        if connect_kwargs is None:
+            connect_kwargs = {'sslmode': Config.DB_SSLMODE} if Config.DB_SSLMODE else {}
+        self.connect_kwargs = connect_kwargs
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        import psycopg2
+
+        backoff = 1
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                if connected_before:
+                    clear_pattern_caches()
+                connected_before = True
+                backoff = 1
+                try:
+                    self._poll(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"❌ Ошибка подписки на сброс кэшей, переподключение через {backoff} с: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _poll(self, conn):
+        while not self._stop.is_set():
+            if not select.select([conn], [], [], 1.0)[0]:
+                continue
+            conn.poll()
+            while conn.notifies:
+                message = conn.notifies.pop(0)
+                try:
+                    event = json.loads(message.payload)
+                except ValueError:
+                    continue
+                self.handle(event)
+
+    def handle(self, event: dict):
+        if event.get('type') == PATTERNS_REBUILT:
+            clear_pattern_caches()
+            logger.info("🔄 Таблица паттернов пересобрана, индексы чатов сброшены")
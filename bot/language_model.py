@@ -0,0 +1,217 @@
+import random
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from bot.cache import KeyedLocks, LRUCache
+from bot.config import Config
+from bot.database import Pattern
+
+# Паттерны, из которых строится модель: старты, переходы 1-го и 2-го порядка
+MODEL_TYPES = ('word', 'bigram', 'trigram')
+
+class Transitions:
+    """Взвешенные переходы из одного состояния в компактных массивах
+
+    Токены и накопленные веса лежат в array, выбор следующего токена — bisect
+    по накопленным весам (O(log n)). Новые частоты копятся в pending и
+    применяются перед следующей выборкой, перестраивается только этот список.
+    set() и rebuild() вызываются под блокировкой модели; sample() читает
+    готовую пару массивов, которая заменяется целиком.
+    """
+
+    __slots__ = ('arrays', 'pending')
+
+    def __init__(self):
+        self.arrays: Tuple[array, array] = (array('I'), array('Q'))
+        self.pending: Optional[Dict[int, int]] = None
+
+    def set(self, token: int, weight: int):
+        """Новая частота перехода (итоговая, а не прирост)"""
+        if self.pending is None:
+            self.pending = {}
+        self.pending[token] = weight
+
+    def rebuild(self):
+        """Применение pending к массивам (под блокировкой модели)"""
+        tokens, cumulative = self.arrays
+        weights = {}
+        previous = 0
+        for token, total in zip(tokens, cumulative):
+            weights[token] = total - previous
+            previous = total
+        weights.update(self.pending)
+        self.pending = None
+
+        tokens, cumulative = array('I'), array('Q')
+        total = 0
+        for token, weight in weights.items():
+            if weight > 0:
+                total += weight
+                tokens.append(token)
+                cumulative.append(total)
+        self.arrays = (tokens, cumulative)
+
+    def sample(self, rng: random.Random) -> Optional[int]:
+        tokens, cumulative = self.arrays
+        if not cumulative:
+            return None
+        return tokens[bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+    def __len__(self) -> int:
+        return len(self.arrays[0]) + len(self.pending or ())
+
+class ChatLanguageModel:
+    """N-граммная модель чата: биграммы и триграммы из таблицы patterns
+
+    Токены хранятся как целые числа, состояние второго порядка (a, b) —
+    одно число a << 32 | b, поэтому ключи словарей переходов компактны.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.words: List[str] = []
+        self.starts = Transitions()
+        self.bigrams: Dict[int, Transitions] = {}
+        self.trigrams: Dict[int, Transitions] = {}
+        self._lock = threading.Lock()
+
+    def _token(self, word: str) -> int:
+        token = self.vocab.get(word)
+        if token is None:
+            token = self.vocab[word] = len(self.words)
+            self.words.append(word)
+        return token
+
+    def add(self, pattern_type: str, pattern_text: str, frequency: int):
+        """Учет паттерна или новой частоты уже известного паттерна"""
+        parts = pattern_text.split()
+        with self._lock:
+            if pattern_type == 'word' and len(parts) == 1:
+                self.starts.set(self._token(parts[0]), frequency)
+            elif pattern_type == 'bigram' and len(parts) == 2:
+                a, b = self._token(parts[0]), self._token(parts[1])
+                transitions = self.bigrams.get(a)
+                if transitions is None:
+                    transitions = self.bigrams[a] = Transitions()
+                transitions.set(b, frequency)
+            elif pattern_type == 'trigram' and len(parts) == 3:
+                a, b, c = (self._token(part) for part in parts)
+                state = a << 32 | b
+                transitions = self.trigrams.get(state)
+                if transitions is None:
+                    transitions = self.trigrams[state] = Transitions()
+                transitions.set(c, frequency)
+
+    def _sample(self, transitions: Optional[Transitions], rng: random.Random) -> Optional[int]:
+        if transitions is None:
+            return None
+        # Перестройка только под блокировкой: add() в это время может менять pending.
+        # Частоты, пришедшие после проверки, попадут в следующую выборку
+        if transitions.pending is not None:
+            with self._lock:
+                if transitions.pending is not None:
+                    transitions.rebuild()
+        return transitions.sample(rng)
+
+    def _start(self, seeds: Iterable[str], rng: random.Random) -> Optional[int]:
+        for seed in seeds:
+            token = self.vocab.get(seed)
+            if token is not None and token in self.bigrams:
+                return token
+        for _ in range(5):
+            token = self._sample(self.starts, rng)
+            if token is not None and token in self.bigrams:
+                return token
+        if self.bigrams:
+            # Ключи словаря не индексируются: берем случайное слово словаря с переходами
+            for _ in range(20):
+                token = rng.randrange(len(self.words))
+                if token in self.bigrams:
+                    return token
+        return None
+
+    def generate(self, seeds: Sequence[str] = (), max_words: int = 12,
+                 rng: random.Random = None) -> Tuple[List[str], int]:
+        """Цепочка слов и число шагов, сделанных по триграммам
+
+        Следующее слово выбирается по триграмме (a, b), а если ее нет — по
+        биграмме b. Генерация останавливается на max_words словах, при
+        отсутствии переходов или на третьем повторе слова.
+        """
+        rng = rng or random
+        token = self._start(seeds, rng)
+        if token is None:
+            return [], 0
+
+        tokens = [token]
+        seen = {token: 1}
+        trigram_steps = 0
+        while len(tokens) < max_words:
+            following = None
+            if len(tokens) >= 2:
+                following = self._sample(self.trigrams.get(tokens[-2] << 32 | tokens[-1]), rng)
+                if following is not None:
+                    trigram_steps += 1
+            if following is None:
+                following = self._sample(self.bigrams.get(tokens[-1]), rng)
+            if following is None:
+                break
+            seen[following] = seen.get(following, 0) + 1
+            if seen[following] > 2:
+                break
+            tokens.append(following)
+        return [self.words[token] for token in tokens], trigram_steps
+
+    def __len__(self) -> int:
+        return len(self.bigrams) + len(self.trigrams)
+
+class LanguageModelIndex:
+    """Модели чатов: строятся лениво из БД и обновляются при выгрузке паттернов"""
+
+    def __init__(self, max_chats: int = None):
+        self._chats = LRUCache(maxsize=max_chats or Config.LANGUAGE_MODEL_MAX_CHATS)
+        # Загрузку чата ждут только запросы к тому же чату
+        self._build_locks = KeyedLocks()
+
+    def get(self, chat_id: int, db: Session) -> ChatLanguageModel:
+        model = self._chats.get(chat_id)
+        if model is not None:
+            return model
+
+        with self._build_locks.hold(chat_id):
+            model = self._chats.get(chat_id)
+            if model is not None:
+                return model
+            model = ChatLanguageModel()
+            rows = db.query(
+                Pattern.pattern_type, Pattern.pattern_text, Pattern.frequency
+            ).filter(
+                Pattern.chat_id == chat_id,
+                Pattern.pattern_type.in_(MODEL_TYPES)
+            ).yield_per(10000)
+            for pattern_type, pattern_text, frequency in rows:
+                model.add(pattern_type, pattern_text, frequency or 0)
+            self._chats.set(chat_id, model)
+        return model
+
+    def apply(self, rows):
+        """Инкрементальное обновление загруженных моделей после upsert паттернов"""
+        for _, chat_id, pattern_type, pattern_text, frequency in rows:
+            if pattern_type not in MODEL_TYPES:
+                continue
+            model = self._chats.get(chat_id)
+            if model is not None:
+                model.add(pattern_type, pattern_text, frequency)
+
+    def invalidate(self, chat_id: int):
+        self._chats.pop(chat_id)
+
+    def clear(self):
+        self._chats.clear()
+
+# Общий на процесс набор моделей
+language_model = LanguageModelIndex()
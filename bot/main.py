@@ -1,7 +1,6 @@
 import os
 import sys
 import logging
-import time
 
 # Настройка логирования
 logging.basicConfig(
@@ -10,41 +9,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WELCOME_TEXT = """
+🤖 *Chat Clone Bot v1.0*
+
+*Доступные команды:*
+/start - Приветствие
+/help - Помощь
+/stats - Статистика
+/reset - Сбросить обучение
+
+*Режимы работы:*
+1. Обучение (72 часа) - собираю фразы из чата
+2. Активный режим - отвечаю на сообщения
+
+Отправьте любое сообщение, чтобы начать!
+            """
+
+# Простые ответы
+RESPONSES = [
+    "Интересное сообщение! 🤔",
+    "Запомнил эту фразу! 📝",
+    "Продолжайте общаться, я учусь! 🎓",
+    "Спасибо за сообщение! 🙏",
+    "Отличная мысль! 💭",
+    "А что вы об этом думаете? 💬",
+    "Продолжайте в том же духе! 🚀",
+    "Записал в базу знаний! 🗂️",
+    "Интересный паттерн речи! 🎯",
+    "Учусь на ваших разговорах... 🧠"
+]
+
+# Кто может сбросить обучение в группе
+ADMIN_STATUSES = ('creator', 'administrator')
+RESET_FORBIDDEN_TEXT = "⛔ Сбросить обучение может только администратор чата"
+
+# Какие сообщения обрабатывает бот: стикеры и GIF он запоминает и ими же отвечает
+CONTENT_TYPES = ['text', 'sticker', 'animation', 'photo', 'video', 'voice']
+
+# Загружаются в фоне после готовности: нужны не раньше первого ответа
+WARM_UP_MODULES = ('numpy',)
+
 def check_dependencies():
-    """Проверка установленных зависимостей"""
-    try:
-        import telebot
-        logger.info("✅ pyTelegramBotAPI установлен")
-    except ImportError:
+    """Проверка установленных зависимостей (find_spec: без импорта самих пакетов)"""
+    from importlib.util import find_spec
+    
+    if find_spec('telebot') is None:
         logger.error("❌ pyTelegramBotAPI не установлен")
         return False
     
-    try:
-        import sqlalchemy
-        logger.info("✅ SQLAlchemy установлен")
-    except ImportError:
+    if find_spec('sqlalchemy') is None:
         logger.error("❌ SQLAlchemy не установлен")
         return False
     
-    try:
-        import flask
-        logger.info("✅ Flask установлен")
-    except ImportError:
+    if find_spec('flask') is None:
         logger.warning("⚠️ Flask не установлен (требуется только для веб-панели)")
     
+    logger.info("✅ Зависимости установлены")
     return True
 
 class SimpleBot:
-    def __init__(self):
+    def __init__(self, threaded: bool = True):
         # Проверяем зависимости
         if not check_dependencies():
             logger.error("❌ Не все зависимости установлены")
             sys.exit(1)
         
-        # Импортируем после проверки
-        import telebot
-        from sqlalchemy import create_engine, text
-        
         # Получаем токен
         self.token = os.getenv('TELEGRAM_TOKEN')
         if not self.token:
@@ -52,8 +81,18 @@ class SimpleBot:
             logger.info("💡 Добавьте TELEGRAM_TOKEN в переменные окружения Railway")
             sys.exit(1)
         
-        self.bot = telebot.TeleBot(self.token)
+        self.threaded = threaded
+        self.bot = self.create_bot()
         self.db_url = os.getenv('DATABASE_URL')
+        self.engine = None
+        self.ingestion = None
+        self.dispatcher = None
+        self.maintenance = None
+        self.invalidation = None
+        # Конвейер обработки (создается в init_database, если есть БД)
+        self.processor = None
+        self.learner = None
+        self.generator = None
         
         if self.db_url and self.db_url.startswith("postgres://"):
             self.db_url = self.db_url.replace("postgres://", "postgresql://", 1)
@@ -62,146 +101,371 @@ class SimpleBot:
         self.setup_handlers()
     
     def init_database(self):
-        """Инициализация базы данных (упрощенная)"""
+        """Схема БД (миграции) и конвейер обработки сообщений"""
         if not self.db_url:
             logger.warning("⚠️ DATABASE_URL не установлен, работаю без БД")
             return None
         
         try:
-            from sqlalchemy import create_engine, text
-            engine = create_engine(self.db_url)
+            # Общий пул соединений процесса из bot.database
+            from bot.database import engine, init_db
+            from bot.message_processor import MessageProcessor
+            from bot.pattern_learner import PatternLearner
+            from bot.personality_manager import PersonalityManager
+            from bot.response_generator import ResponseGenerator
             
-            # Создаем таблицу если не существует
-            with engine.connect() as conn:
-                conn.execute(text("""
-                    CREATE TABLE IF NOT EXISTS messages (
-                        id SERIAL PRIMARY KEY,
-                        chat_id BIGINT,
-                        user_id BIGINT,
-                        username VARCHAR(255),
-                        message_text TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """))
-                conn.commit()
+            # Миграции схемы, включая перенос сообщений из старой таблицы бота
+            init_db()
             
+            self.engine = engine
+            self.processor = MessageProcessor()
+            self.learner = PatternLearner()
+            self.generator = ResponseGenerator(PersonalityManager())
+            self.start_ingestion()
+            self.start_maintenance()
+            self.start_invalidation_listener()
             logger.info("✅ База данных инициализирована")
             return engine
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
             return None
     
-    def setup_handlers(self):
-        """Настройка обработчиков"""
-        import telebot
-        import random
+    def start_ingestion(self):
+        """Запуск фоновой пакетной записи сообщений"""
+        import atexit
+        from bot.ingestion import IngestionQueue
+        from bot.metrics import register_queue
         
-        @self.bot.message_handler(commands=['start', 'help'])
-        def send_welcome(message):
-            welcome_text = """
-🤖 *Chat Clone Bot v1.0*
-
-*Доступные команды:*
-/start - Приветствие
-/help - Помощь
-/stats - Статистика
-/reset - Сбросить обучение
-
-*Режимы работы:*
-1. Обучение (72 часа) - собираю фразы из чата
-2. Активный режим - отвечаю на сообщения
-
-Отправьте любое сообщение, чтобы начать!
-            """
-            self.bot.reply_to(message, welcome_text, parse_mode='Markdown')
+        self.ingestion = IngestionQueue(self._write_messages)
+        self.ingestion.start()
+        register_queue('ingestion', self.ingestion, 'Очередь записи сообщений')
+        atexit.register(self.stop_ingestion)
+    
+    def stop_ingestion(self):
+        """Сброс очереди записи и накопленных счетчиков при остановке"""
+        if self.ingestion is not None:
+            self.ingestion.stop()
+            logger.info(f"💾 Очередь записи остановлена: {self.ingestion.stats}")
+            self.ingestion = None
+            
+            from bot.database import SessionLocal
+            with SessionLocal() as db:
+                try:
+                    self.learner.flush(db)
+                    self.processor.flush(db)
+                except Exception as e:
+                    logger.error(f"❌ Не удалось выгрузить счетчики при остановке: {e}")
+    
+    def start_maintenance(self):
+        """Фоновое обслуживание БД: секции messages, срок хранения, уплотнение паттернов"""
+        import atexit
+        from bot.maintenance import MaintenanceThread
         
-        @self.bot.message_handler(commands=['stats'])
-        def send_stats(message):
+        self.maintenance = MaintenanceThread()
+        self.maintenance.start()
+        atexit.register(self.maintenance.stop)
+    
+    def start_invalidation_listener(self):
+        """Сброс индексов паттернов по сигналу bot.relearn (только PostgreSQL)"""
+        import atexit
+        from bot.invalidation import InvalidationListener
+        
+        if self.engine.dialect.name != 'postgresql':
+            return
+        self.invalidation = InvalidationListener()
+        self.invalidation.start()
+        atexit.register(self.invalidation.stop)
+    
+    def start_dispatcher(self, loop=None):
+        """Запуск пула отправки исходящих сообщений (loop — цикл событий AsyncTeleBot)"""
+        import atexit
+        from bot.dispatcher import OutboundDispatcher
+        from bot.metrics import register_queue, registry
+        
+        self.dispatcher = OutboundDispatcher(loop=loop)
+        self.dispatcher.start()
+        register_queue('send', self.dispatcher, 'Очередь отправки ответов')
+        registry.register_collector('send_chats', self.dispatcher.latency_metrics)
+        atexit.register(self.stop_dispatcher)
+    
+    def stop_dispatcher(self):
+        """Отправка оставшихся сообщений при остановке"""
+        if self.dispatcher is not None:
+            from bot.metrics import registry
+            registry.unregister_collector('send_chats')
+            self.dispatcher.stop()
+            logger.info(f"📤 Очередь отправки остановлена: {self.dispatcher.stats}")
+            self.dispatcher = None
+    
+    def _write_messages(self, rows):
+        """Запись пачки сообщений из очереди и обучение на ней"""
+        from bot.database import SessionLocal
+        from bot.metrics import span, trace
+        
+        with trace('batch'), SessionLocal() as db:
+            # Сообщения, чаты и пользователи — одним коммитом через bot.repository
+            with span('write'):
+                stored, media, switched = self.processor.process_batch(rows, db)
+            for chat_id in switched:
+                logger.info(f"🎓 Чат {chat_id} завершил обучение и переходит в активный режим")
             try:
-                from sqlalchemy import create_engine, text
-                if self.db_url:
-                    engine = create_engine(self.db_url)
-                    with engine.connect() as conn:
-                        result = conn.execute(text("SELECT COUNT(*) FROM messages"))
-                        count = result.scalar() or 0
-                    
-                    stats_text = f"""
+                with span('learn'):
+                    self.learner.analyze_messages(stored, db)
+                    self.learner.analyze_media(media, db)
+            except Exception as e:
+                # Сообщения уже записаны: повтор пачки из очереди задвоил бы их
+                db.rollback()
+                logger.error(f"❌ Ошибка обучения на пачке сообщений: {e}")
+    
+    def create_bot(self):
+        """Создание клиента Telegram"""
+        # Импортируем после проверки зависимостей
+        import telebot
+        
+        # Подмена адреса Bot API (локальный fake-Telegram для тестов)
+        api_url = os.getenv('TELEGRAM_API_URL')
+        if api_url:
+            telebot.apihelper.API_URL = api_url
+        
+        # threaded=False: обновления из webhook обрабатываются в потоках диспетчера
+        return telebot.TeleBot(self.token, threaded=self.threaded)
+    
+    def stats_text(self, chat_id: int = None) -> str:
+        """Текст ответа на /stats (с задержкой ответов в чате chat_id)"""
+        if self.engine is None:
+            return "📊 База данных не настроена"
+        
+        from bot.database import get_pool_stats
+        from bot.repository import repository
+        with self.engine.connect() as conn:
+            count = repository.message_total(conn)
+        
+        pool = get_pool_stats()
+        latency = ''
+        if self.dispatcher is not None and chat_id is not None:
+            chat = self.dispatcher.latency_stats(chat_id).get(chat_id)
+            if chat:
+                latency = f"\n*Задержка ответов:* p50 {chat['p50_ms']} мс, p95 {chat['p95_ms']} мс"
+        return f"""
 📊 *Статистика бота:*
 
 *Сообщений в базе:* {count}
 *Режим:* Обучение
 *Версия:* 1.0
+*Соединений с БД:* {pool.get('checked_out', 0)} занято, {pool.get('overflow', 0)} сверх пула{latency}
                     """
-                else:
-                    stats_text = "📊 База данных не настроена"
-                
-                self.bot.reply_to(message, stats_text, parse_mode='Markdown')
+    
+    def store_message(self, message):
+        """Постановка сообщения в очередь на пакетную запись в БД"""
+        from bot.metrics import span
+        
+        if self.ingestion is not None:
+            with span('enqueue'):
+                self.ingestion.put(self.processor.message_row(message))
+    
+    def pick_response(self, message):
+        """Выбор ответа на сообщение (или None)"""
+        from bot.metrics import span
+        
+        with span('respond'):
+            return self._pick_response(message)
+    
+    def _pick_response(self, message):
+        import random
+        from datetime import datetime
+        from bot.config import Config
+        from bot.rate_limit import get_rate_limiter
+        
+        if self.generator is None:
+            # Без БД: отвечаем с вероятностью RESPONSE_RATE, не чаще общего лимита
+            if random.random() < Config.RESPONSE_RATE and get_rate_limiter().try_acquire(str(message.chat.id)):
+                return random.choice(RESPONSES)
+            return None
+        
+        received_at = datetime.now()
+        if not self.generator.should_respond(message.chat.id):
+            return None
+        
+        from bot.database import SessionLocal
+        from bot.repository import repository
+        with SessionLocal() as db:
+            chat = repository.get_chat(db, str(message.chat.id))
+            # Пока чат учится (или еще не записан), отвечаем шаблонными фразами
+            if chat is None or chat['learning_mode']:
+                return random.choice(RESPONSES)
+            response = self.generator.generate_response(
+                chat['id'], {'text': message.text, 'received_at': received_at,
+                             'user_id': message.from_user.id if message.from_user else None,
+                             'message_type': message.content_type}, db)
+        return response or random.choice(RESPONSES)
+    
+    def reset_chat(self, chat_id: int) -> str:
+        """Сброс обучения чата (/reset)"""
+        if self.engine is None:
+            return "📊 База данных не настроена"
+        
+        from bot.database import SessionLocal
+        from bot.repository import repository
+        with SessionLocal() as db:
+            chat = repository.get_chat(db, str(chat_id))
+            if chat is None:
+                return "🤷 Я еще ничего не выучил в этом чате"
+            deleted = repository.reset_chat(db, chat)
+        return f"🧹 Обучение сброшено, забыто паттернов: {deleted}. Начинаю учиться заново!"
+    
+    def reply(self, message, text, command: bool = False, **kwargs):
+        """Ответ через очередь отправки: обработчик не ждет Bot API
+
+        text — строка или MediaReply (стикер или GIF из bot.media_index).
+        """
+        from bot.dispatcher import PRIORITY_COMMAND, PRIORITY_REPLY
+        from bot.media_index import MediaReply
+        
+        priority = PRIORITY_COMMAND if command else PRIORITY_REPLY
+        if isinstance(text, MediaReply):
+            queued = self.dispatcher.reply_media(self.bot, message, text, priority=priority)
+        else:
+            queued = self.dispatcher.reply_to(self.bot, message, text, priority=priority, **kwargs)
+        if not queued:
+            logger.warning(f"⚠️ Очередь отправки переполнена, ответ в чат {message.chat.id} пропущен")
+    
+    def setup_handlers(self):
+        """Настройка обработчиков"""
+        self.start_dispatcher()
+        
+        @self.bot.message_handler(commands=['start', 'help'])
+        def send_welcome(message):
+            self.reply(message, WELCOME_TEXT, command=True, parse_mode='Markdown')
+        
+        @self.bot.message_handler(commands=['stats'])
+        def send_stats(message):
+            try:
+                self.reply(message, self.stats_text(message.chat.id), command=True, parse_mode='Markdown')
             except Exception as e:
-                self.bot.reply_to(message, f"❌ Ошибка: {str(e)}")
+                self.reply(message, f"❌ Ошибка: {str(e)}", command=True)
         
-        @self.bot.message_handler(func=lambda message: True)
-        def handle_message(message):
-            # Сохраняем сообщение в БД
+        @self.bot.message_handler(commands=['reset'])
+        def send_reset(message):
+            # В группах сбросить обучение может только администратор
+            if message.chat.type != 'private':
+                member = self.bot.get_chat_member(message.chat.id, message.from_user.id)
+                if member.status not in ADMIN_STATUSES:
+                    self.reply(message, RESET_FORBIDDEN_TEXT, command=True)
+                    return
             try:
-                if self.db_url:
-                    from sqlalchemy import create_engine, text
-                    engine = create_engine(self.db_url)
-                    with engine.connect() as conn:
-                        conn.execute(text("""
-                            INSERT INTO messages (chat_id, user_id, username, message_text)
-                            VALUES (:chat_id, :user_id, :username, :message_text)
-                        """), {
-                            'chat_id': message.chat.id,
-                            'user_id': message.from_user.id,
-                            'username': message.from_user.username or message.from_user.first_name,
-                            'message_text': message.text
-                        })
-                        conn.commit()
+                self.reply(message, self.reset_chat(message.chat.id), command=True)
             except Exception as e:
-                logger.error(f"Ошибка сохранения в БД: {e}")
-            
-            # Простые ответы
-            responses = [
-                "Интересное сообщение! 🤔",
-                "Запомнил эту фразу! 📝",
-                "Продолжайте общаться, я учусь! 🎓",
-                "Спасибо за сообщение! 🙏",
-                "Отличная мысль! 💭",
-                "А что вы об этом думаете? 💬",
-                "Продолжайте в том же духе! 🚀",
-                "Записал в базу знаний! 🗂️",
-                "Интересный паттерн речи! 🎯",
-                "Учусь на ваших разговорах... 🧠"
-            ]
+                self.reply(message, f"❌ Ошибка: {str(e)}", command=True)
+        
+        @self.bot.message_handler(func=lambda message: True, content_types=CONTENT_TYPES)
+        def handle_message(message):
+            from bot.metrics import trace
             
-            # Отвечаем с вероятностью 30%
-            if random.random() < 0.3:
-                response = random.choice(responses)
-                self.bot.reply_to(message, response)
+            # Этапы обновления (enqueue, respond, запросы к БД) — в одной трассе
+            with trace('update'):
+                self.store_message(message)
+                
+                response = self.pick_response(message)
+                if response:
+                    self.reply(message, response)
             
-            logger.info(f"📨 Сообщение от @{message.from_user.username}: {message.text[:50]}...")
+            logger.info(f"📨 Сообщение от @{message.from_user.username}: {(message.text or message.content_type)[:50]}...")
+    
+    def mark_ready(self):
+        """Сигнал готовности и фоновая загрузка модулей первого ответа"""
+        from bot import readiness
+        
+        readiness.mark_ready()
+        readiness.warm_up(*WARM_UP_MODULES)
+    
+    def log_pool_stats(self):
+        """Вывод статистики пула соединений в лог"""
+        if self.engine is None:
+            return
+        from bot.database import get_pool_stats
+        logger.info(f"📈 Пул БД: {get_pool_stats()}")
+    
+    def set_webhook(self):
+        """Регистрация webhook: обновления будет принимать веб-приложение"""
+        from bot.config import Config
+        
+        if not Config.WEBHOOK_URL or not Config.WEBHOOK_SECRET:
+            raise ValueError("Для режима webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+        
+        url = Config.WEBHOOK_URL.rstrip('/') + '/telegram/webhook'
+        self.bot.set_webhook(url=url, secret_token=Config.WEBHOOK_SECRET,
+                             max_connections=Config.WEBHOOK_MAX_CONNECTIONS)
+        logger.info(f"🔗 Webhook установлен: {url}")
+    
+    def run_webhook_registration(self):
+        """Режим webhook: регистрация и ожидание остановки процесса
+
+        Обновления принимает /telegram/webhook в веб-приложении, конвейер
+        работает там же. Процесс воркера не завершается, иначе платформа
+        с политикой перезапуска ALWAYS запускала бы его по кругу (и каждый
+        раз заново вызывала setWebhook).
+        """
+        import threading
+        from bot import readiness
+        
+        self.set_webhook()
+        readiness.mark_ready()
+        logger.info("🔗 Обновления принимает веб-приложение, процесс ожидает остановки")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            readiness.mark_stopping()
+            self.stop_dispatcher()
     
     def run(self):
         """Запуск бота"""
+        from bot.config import Config
+        
+        if Config.BOT_RUNTIME == 'webhook':
+            self.run_webhook_registration()
+            return
+        
+        from bot import readiness
+        
         logger.info("🚀 Запускаю Telegram бота...")
         try:
+            self.mark_ready()
             self.bot.infinity_polling(timeout=60, long_polling_timeout=60)
         except Exception as e:
             logger.error(f"❌ Ошибка в боте: {e}")
             raise
+        finally:
+            readiness.mark_stopping()
+            self.stop_dispatcher()
+            self.stop_ingestion()
+            self.log_pool_stats()
+
+def create_bot() -> SimpleBot:
+    """Создание бота в режиме из BOT_RUNTIME (threaded, async или webhook)"""
+    from bot.config import Config
+    
+    if Config.BOT_RUNTIME == 'async':
+        from bot.async_runtime import AsyncBot
+        return AsyncBot()
+    return SimpleBot()
 
 def main():
     """Основная функция запуска"""
+    # Отсчет времени до готовности (bot.readiness)
+    import bot.readiness  # noqa: F401
+    from bot.config import Config
+    
     logger.info("=" * 50)
     logger.info("🤖 ЗАПУСК CHAT CLONE BOT")
     logger.info("=" * 50)
     
-    # Задержка для гарантированной установки зависимостей
-    time.sleep(5)
-    
     # Создаем и запускаем бота
-    bot = SimpleBot()
-    bot.init_database()  # Инициализируем БД
+    bot = create_bot()
+    if Config.BOT_RUNTIME != 'webhook':
+        # В режиме webhook конвейер и БД — в процессах веб-приложения
+        bot.init_database()
     bot.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,310 @@
+"""Обслуживание таблиц: помесячные секции messages, хранение и уплотнение patterns
+
+Запуск: python -m bot.maintenance [--partition] [--dry-run]
+
+Таблица messages в PostgreSQL секционирована по месяцам поля timestamp:
+messages_pYYYY_MM на каждый месяц и messages_default для строк вне
+созданных секций. Обслуживание:
+
+* создает секции на MESSAGE_PARTITIONS_AHEAD месяцев вперед;
+* секции старше MESSAGE_RETENTION_DAYS отсоединяет и переносит в схему
+  MESSAGE_ARCHIVE_SCHEMA (MESSAGE_RETENTION_ACTION=archive) или удаляет
+  (drop) — это метаданные, а не DELETE по строкам;
+* удаляет паттерны, которые не встречались PATTERN_STALE_DAYS дней и
+  набрали не больше PATTERN_COMPACT_MAX_FREQUENCY повторов (Pattern.frequency;
+  n-граммы сохраняются с частотой от PatternLearner.MIN_COUNT).
+
+--partition переводит существующую несекционированную таблицу messages
+на секции (копирование строк под эксклюзивной блокировкой).
+"""
+import argparse
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from bot.config import Config
+from bot.database import Message, engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'messages'
+DEFAULT_PARTITION = 'messages_default'
+# Ключ advisory-блокировки: обслуживание идет в одном процессе из всех воркеров
+MAINTENANCE_LOCK_KEY = 0x6d736773
+
+# Колонки модели Message; id и timestamp входят в первичный ключ секционированной таблицы
+_MESSAGES_DDL = f"""
+    CREATE TABLE {PARENT_TABLE} (
+        id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+        chat_id INTEGER REFERENCES chats (id),
+        user_id INTEGER REFERENCES users (id),
+        message_id INTEGER,
+        text TEXT,
+        message_type VARCHAR,
+        timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT LOCALTIMESTAMP,
+        is_processed BOOLEAN,
+        has_reaction BOOLEAN,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+def month_start(moment) -> date:
+    return date(moment.year, moment.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+def _is_postgres(conn) -> bool:
+    return conn.dialect.name == 'postgresql'
+
+def table_kind(conn, name: str) -> Optional[str]:
+    """relkind таблицы: 'r' — обычная, 'p' — секционированная, None — нет таблицы"""
+    return conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"
+    ), {'name': name}).scalar()
+
+def partitions(conn) -> List[Tuple[str, date]]:
+    """Помесячные секции messages (без секции по умолчанию), по возрастанию"""
+    rows = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:parent)
+    """), {'parent': PARENT_TABLE}).scalars()
+    prefix = f"{PARENT_TABLE}_p"
+    result = []
+    for name in rows:
+        if name.startswith(prefix):
+            year, month = name[len(prefix):].split('_')
+            result.append((name, date(int(year), int(month), 1)))
+    return sorted(result, key=lambda item: item[1])
+
+def create_partitioned_table(conn):
+    """Секционированная таблица messages с секцией по умолчанию"""
+    conn.execute(text("CREATE SEQUENCE IF NOT EXISTS messages_id_seq"))
+    conn.execute(text(_MESSAGES_DDL))
+    conn.execute(text(f"ALTER SEQUENCE messages_id_seq OWNED BY {PARENT_TABLE}.id"))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+
+def create_partition(conn, month: date) -> bool:
+    """Секция месяца; строки этого месяца из секции по умолчанию переносятся в нее"""
+    name = partition_name(month)
+    if table_kind(conn, name) is not None:
+        return False
+    bounds = {'start': month, 'end': add_months(month, 1)}
+    # Подключение секции проверяет, что в секции по умолчанию нет ее строк
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE timestamp >= :start AND timestamp < :end
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds).rowcount
+    conn.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    logger.info(f"🗂️ Создана секция {name}" + (f", перенесено строк: {moved}" if moved else ""))
+    return True
+
+def ensure_partitions(conn, now: datetime = None, ahead: int = None, since: datetime = None) -> int:
+    """Секции от самой ранней существующей (или since) до текущего месяца + ahead"""
+    now = now or datetime.now()
+    ahead = Config.MESSAGE_PARTITIONS_AHEAD if ahead is None else ahead
+    current = month_start(now)
+    existing = partitions(conn)
+    month = existing[0][1] if existing and existing[0][1] < current else current
+    if since is not None:
+        month = min(month, month_start(since))
+    created = 0
+    while month <= add_months(current, ahead):
+        created += create_partition(conn, month)
+        month = add_months(month, 1)
+    return created
+
+def init_partitioning(conn):
+    """Вызывается из init_db до create_all: messages создается секционированной"""
+    if not _is_postgres(conn) or not Config.MESSAGE_PARTITIONING:
+        return
+    kind = table_kind(conn, PARENT_TABLE)
+    if kind is None:
+        create_partitioned_table(conn)
+        ensure_partitions(conn)
+    elif kind == 'p':
+        ensure_partitions(conn)
+    else:
+        logger.warning("⚠️ Таблица messages не секционирована: "
+                       "перенесите ее командой python -m bot.maintenance --partition")
+
+def migrate_to_partitions(conn) -> int:
+    """Перенос обычной таблицы messages в секционированную; возвращает число строк"""
+    if table_kind(conn, PARENT_TABLE) != 'r':
+        raise RuntimeError("Таблица messages отсутствует или уже секционирована")
+
+    conn.execute(text(f"LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE"))
+    legacy = f"{PARENT_TABLE}_unpartitioned"
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}"))
+    # Имена первичного ключа и индексов нужны новой таблице
+    conn.execute(text(f"ALTER INDEX IF EXISTS {PARENT_TABLE}_pkey RENAME TO {legacy}_pkey"))
+    for name in conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE 'ix_messages_%'"
+    ), {'table': legacy}).scalars().all():
+        conn.execute(text(f"DROP INDEX {name}"))
+
+    create_partitioned_table(conn)
+    oldest = conn.execute(text(f"SELECT MIN(timestamp) FROM {legacy}")).scalar()
+    ensure_partitions(conn, since=oldest)
+
+    rows = conn.execute(text(f"""
+        INSERT INTO {PARENT_TABLE}
+            (id, chat_id, user_id, message_id, text, message_type, timestamp, is_processed, has_reaction)
+        SELECT id, chat_id, user_id, message_id, text, message_type,
+               COALESCE(timestamp, LOCALTIMESTAMP), is_processed, has_reaction
+        FROM {legacy}
+    """)).rowcount
+    # Индексы модели строятся после копирования, а не на каждую вставку
+    for index in Message.__table__.indexes:
+        index.create(bind=conn)
+    conn.execute(text(
+        f"SELECT setval('messages_id_seq', GREATEST((SELECT MAX(id) FROM {PARENT_TABLE}), 1))"
+    ))
+    # CASCADE снимает внешний ключ reactions.message_id: на секционированную таблицу он не ссылается
+    conn.execute(text(f"DROP TABLE {legacy} CASCADE"))
+    logger.info(f"✅ messages переведена на секции, перенесено строк: {rows}")
+    return rows
+
+def apply_retention(conn, now: datetime = None, days: int = None, action: str = None) -> List[str]:
+    """Отсоединение секций старше срока хранения; возвращает их имена"""
+    days = Config.MESSAGE_RETENTION_DAYS if days is None else days
+    action = action or Config.MESSAGE_RETENTION_ACTION
+    if days <= 0:
+        return []
+    cutoff = (now or datetime.now()) - timedelta(days=days)
+
+    removed = []
+    for name, month in partitions(conn):
+        # Секция уходит целиком, когда самые новые ее строки старше срока
+        if datetime.combine(add_months(month, 1), datetime.min.time()) > cutoff:
+            break
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if action == 'drop':
+            conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            schema = Config.MESSAGE_ARCHIVE_SCHEMA
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {schema}"))
+        removed.append(name)
+        logger.info(f"🧹 Секция {name}: {'удалена' if action == 'drop' else 'перенесена в архив'}")
+
+    # Старые строки, попавшие в секцию по умолчанию
+    stale = conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"),
+                         {'cutoff': cutoff}).rowcount
+    if stale:
+        logger.info(f"🧹 Удалено старых строк из {DEFAULT_PARTITION}: {stale}")
+    return removed
+
+def compact_patterns(conn, now: datetime = None, days: int = None, max_frequency: int = None) -> List[int]:
+    """Удаление давно не встречавшихся редких паттернов; возвращает затронутые чаты"""
+    days = Config.PATTERN_STALE_DAYS if days is None else days
+    max_frequency = Config.PATTERN_COMPACT_MAX_FREQUENCY if max_frequency is None else max_frequency
+    if days <= 0:
+        return []
+    cutoff = (now or datetime.now()) - timedelta(days=days)
+    rows = conn.execute(text("""
+        DELETE FROM patterns
+        WHERE COALESCE(last_used, created_at) < :cutoff AND frequency <= :max_frequency
+        RETURNING chat_id
+    """), {'cutoff': cutoff, 'max_frequency': max_frequency}).scalars().all()
+    if rows:
+        logger.info(f"🧹 Удалено устаревших паттернов: {len(rows)}")
+    return sorted({chat_id for chat_id in rows if chat_id is not None})
+
+def run_maintenance(now: datetime = None) -> Optional[dict]:
+    """Один проход обслуживания; None — его уже выполняет другой процесс"""
+    with engine.begin() as conn:
+        if not _is_postgres(conn):
+            return None
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                            {'key': MAINTENANCE_LOCK_KEY}).scalar():
+            return None
+        summary = {'partitions_created': 0, 'partitions_removed': [], 'pattern_chats': []}
+        if Config.MESSAGE_PARTITIONING and table_kind(conn, PARENT_TABLE) == 'p':
+            summary['partitions_created'] = ensure_partitions(conn, now)
+            summary['partitions_removed'] = apply_retention(conn, now)
+        summary['pattern_chats'] = compact_patterns(conn, now)
+
+    # Удаленные паттерны больше не должны попадать в ответы этого процесса
+    if summary['pattern_chats']:
+        from bot.language_model import language_model
+        from bot.media_index import media_index
+        from bot.pattern_index import pattern_index
+        for chat_id in summary['pattern_chats']:
+            pattern_index.invalidate(chat_id)
+            language_model.invalidate(chat_id)
+            media_index.invalidate(chat_id)
+    return summary
+
+class MaintenanceThread:
+    """Фоновое обслуживание раз в MAINTENANCE_INTERVAL секунд"""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval if interval is not None else Config.MAINTENANCE_INTERVAL
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                summary = run_maintenance()
+                if summary:
+                    logger.info(f"🧰 Обслуживание БД: {summary}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка обслуживания БД: {e}")
+            self._stop.wait(self.interval)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partition', action='store_true',
+                        help='перевести существующую таблицу messages на секции')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='с --partition: выполнить перенос в транзакции и откатить')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if engine.dialect.name != 'postgresql':
+        raise SystemExit("Обслуживание поддерживается только для PostgreSQL")
+
+    if not args.partition:
+        logger.info(f"✅ Обслуживание завершено: {run_maintenance()}")
+        return
+
+    with engine.connect() as conn:
+        rows = migrate_to_partitions(conn)
+        if args.dry_run:
+            conn.rollback()
+            logger.info(f"Пробный запуск: перенеслось бы строк {rows}, изменения отменены")
+        else:
+            conn.commit()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import json
+import random
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from bot.cache import KeyedLocks, LRUCache
+from bot.config import Config
+from bot.database import Pattern
+
+# Медиа, которыми бот может ответить: file_id пересылается без загрузки файла
+MEDIA_TYPES = ('sticker', 'animation')
+
+# Строка паттерна: (id, chat_id, pattern_type, pattern_text, frequency)
+PatternRow = Tuple[int, int, str, str, int]
+
+class MediaReply(NamedTuple):
+    """Ответ стикером или GIF вместо текста"""
+    media_type: str
+    file_id: str
+
+def media_context(file_id: str) -> str:
+    """JSON для Pattern.context медиа-паттерна"""
+    return json.dumps({'file_id': file_id})
+
+class ChatMediaIndex:
+    """Стикеры и GIF одного чата: file_unique_id -> [тип, file_id, частота]
+
+    Один file_unique_id — одна запись, сколько бы раз и кем файл ни
+    присылали; file_id — последний увиденный (по нему отправляют). Top-k
+    по частоте пересобирается лениво, только после изменения частот,
+    поэтому выбор ответа — взвешенная выборка из готового списка.
+
+    В media только медиа с частотой от min_frequency и не больше
+    max_entries самых частых: остальные ответом не станут. file_id еще
+    редких медиа хранятся в небольшом LRU recent, пока выгрузка паттернов
+    не принесет их частоту.
+    """
+
+    def __init__(self, top_k: int = None, min_frequency: int = None, max_entries: int = None,
+                 recent_size: int = None):
+        self.top_k = top_k or Config.MEDIA_TOP_K
+        self.min_frequency = min_frequency if min_frequency is not None else Config.MEDIA_MIN_FREQUENCY
+        self.max_entries = max_entries or Config.MEDIA_INDEX_MAX_ENTRIES
+        self.media: Dict[str, list] = {}
+        # file_unique_id -> (тип, file_id) медиа, которых еще нет в media
+        self.recent = LRUCache(maxsize=recent_size or Config.MEDIA_RECENT_FILE_IDS)
+        self._top: Optional[List[MediaReply]] = None
+        self._weights: List[int] = []
+        self._lock = threading.Lock()
+
+    def add(self, unique_id: str, media_type: str, file_id: Optional[str], frequency: int):
+        """Добавление медиа или обновление его частоты (file_id=None — прежний)"""
+        with self._lock:
+            entry = self.media.get(unique_id)
+            if frequency < self.min_frequency:
+                if entry is not None:
+                    del self.media[unique_id]
+                    self.recent.set(unique_id, (entry[0], file_id or entry[1]))
+                    self._top = None
+                elif file_id is not None:
+                    self.recent.set(unique_id, (media_type, file_id))
+                return
+            if entry is None:
+                if file_id is None:
+                    file_id = (self.recent.pop(unique_id) or (None, None))[1]
+                    if file_id is None:
+                        return
+                self.media[unique_id] = [media_type, file_id, frequency]
+                if len(self.media) > self.max_entries:
+                    rarest = min(self.media, key=lambda key: self.media[key][2])
+                    del self.media[rarest]
+            else:
+                entry[2] = frequency
+                if file_id is not None:
+                    entry[1] = file_id
+            self._top = None
+
+    def remember(self, unique_id: str, media_type: str, file_id: str):
+        """Свежий file_id; частота придет с выгрузкой паттернов"""
+        with self._lock:
+            entry = self.media.get(unique_id)
+            if entry is None:
+                self.recent.set(unique_id, (media_type, file_id))
+            else:
+                entry[1] = file_id
+
+    def top(self) -> List[MediaReply]:
+        with self._lock:
+            if self._top is None:
+                ranked = sorted(self.media.values(), key=lambda entry: -entry[2])[:self.top_k]
+                self._top = [MediaReply(media_type, file_id) for media_type, file_id, _ in ranked]
+                self._weights = [frequency for _, _, frequency in ranked]
+            return self._top
+
+    def pick(self, rng: random.Random = random) -> Optional[MediaReply]:
+        """Популярное медиа чата с вероятностью по частоте (None — таких нет)"""
+        top = self.top()
+        if not top:
+            return None
+        return rng.choices(top, weights=self._weights)[0]
+
+    def __len__(self) -> int:
+        return len(self.media)
+
+class MediaIndex:
+    """Медиа-индексы чатов: строятся лениво из БД и обновляются при обучении"""
+
+    def __init__(self, max_chats: int = None):
+        self._chats = LRUCache(maxsize=max_chats or Config.MEDIA_INDEX_MAX_CHATS)
+        # Загрузку чата ждут только запросы к тому же чату
+        self._build_locks = KeyedLocks()
+
+    def get(self, chat_id: int, db: Session) -> ChatMediaIndex:
+        """Индекс чата; при первом обращении загружается одним запросом"""
+        index = self._chats.get(chat_id)
+        if index is not None:
+            return index
+
+        with self._build_locks.hold(chat_id):
+            index = self._chats.get(chat_id)
+            if index is not None:
+                return index
+            index = ChatMediaIndex()
+            # Редкие медиа ответом не станут: грузятся только max_entries самых частых
+            rows = db.query(
+                Pattern.pattern_text, Pattern.pattern_type, Pattern.context, Pattern.frequency
+            ).filter(
+                Pattern.chat_id == chat_id,
+                Pattern.pattern_type.in_(MEDIA_TYPES),
+                Pattern.frequency >= index.min_frequency
+            ).order_by(Pattern.frequency.desc()).limit(index.max_entries).all()
+            for unique_id, media_type, context, frequency in rows:
+                try:
+                    file_id = json.loads(context)['file_id'] if context else None
+                except (ValueError, KeyError, TypeError):
+                    file_id = None
+                index.add(unique_id, media_type, file_id, frequency or 0)
+            self._chats.set(chat_id, index)
+        return index
+
+    def remember(self, chat_id: int, media: Iterable[Tuple[str, str, str]]):
+        """(тип, file_unique_id, file_id) из новых сообщений для загруженного индекса"""
+        index = self._chats.get(chat_id)
+        if index is not None:
+            for media_type, unique_id, file_id in media:
+                index.remember(unique_id, media_type, file_id)
+
+    def apply(self, rows: Iterable[PatternRow]):
+        """Инкрементальное обновление частот загруженных индексов после upsert"""
+        for _, chat_id, pattern_type, pattern_text, frequency in rows:
+            if pattern_type not in MEDIA_TYPES:
+                continue
+            index = self._chats.get(chat_id)
+            if index is not None:
+                index.add(pattern_text, pattern_type, None, frequency)
+
+    def pick(self, chat_id: int, db: Session, rng: random.Random = random) -> Optional[MediaReply]:
+        return self.get(chat_id, db).pick(rng)
+
+    def invalidate(self, chat_id: int):
+        self._chats.pop(chat_id)
+
+    def clear(self):
+        self._chats.clear()
+
+# Общий на процесс медиа-индекс
+media_index = MediaIndex()
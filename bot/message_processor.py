@@ -1,89 +1,207 @@
-import re
-import json
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
 from sqlalchemy.orm import Session
 
-from bot.database import Message, User, Chat, get_db
-from bot.utils import clean_text, contains_blacklisted_words
+from bot.media_index import MEDIA_TYPES
+from bot.metrics import span
+from bot.repository import repository
+from bot.stats_rollup import stats_rollup
+from bot.utils import contains_blacklisted_words
 from bot.config import Config
 
+logger = logging.getLogger(__name__)
+
 class MessageProcessor:
-    def __init__(self):
-        self.message_cache = {}
-        
-    async def process_message(self, message: Any, db: Session) -> Dict:
-        """Обработка входящего сообщения"""
-        chat_id = str(message.chat.id)
-        user_id = str(message.from_user.id)
-        
-        # Проверка на чёрный список
-        if hasattr(message, 'text') and message.text:
-            if contains_blacklisted_words(message.text, Config.BLACKLIST_WORDS):
-                return {'action': 'ignore', 'reason': 'blacklisted'}
-        
-        # Сохранение чата
-        chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
-        if not chat:
-            chat = Chat(
-                chat_id=chat_id,
-                title=message.chat.title if hasattr(message.chat, 'title') else "Unknown",
-                learning_mode=True,
-                learning_end_time=datetime.now() + timedelta(hours=Config.LEARNING_HOURS)
-            )
-            db.add(chat)
-            db.commit()
-            db.refresh(chat)
-        
-        # Сохранение пользователя
-        user = db.query(User).filter(User.user_id == user_id).first()
-        if not user:
-            user = User(
-                user_id=user_id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name,
-                message_count=1
-            )
-            db.add(user)
-        else:
-            user.message_count += 1
-            user.last_seen = datetime.now()
-        
-        # Сохранение сообщения
-        msg = Message(
-            chat_id=chat.id,
-            user_id=user.id,
-            message_id=message.message_id,
-            text=message.text if hasattr(message, 'text') else None,
-            message_type=self._get_message_type(message),
-            timestamp=datetime.now()
-        )
-        db.add(msg)
-        db.commit()
-        db.refresh(msg)
-        
-        # Проверка режима обучения
-        if chat.learning_mode and chat.learning_end_time:
-            if datetime.now() > chat.learning_end_time:
-                chat.learning_mode = False
-                chat.personality_level = 2
-                db.commit()
-                return {'action': 'switch_to_active', 'chat': chat}
-        
+    def __init__(self, flush_interval: float = None):
+        self.repository = repository
+
+        # Отложенные обновления users: id -> [прирост message_count, last_seen]
+        self.flush_interval = flush_interval if flush_interval is not None else Config.USER_FLUSH_INTERVAL
+        self._pending_users: Dict[int, list] = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def message_row(message: Any, received_at: datetime = None) -> Dict[str, Any]:
+        """Поля сообщения Telegram для очереди записи"""
+        user = message.from_user
+        message_type = MessageProcessor._get_message_type(message)
+        # Стикеры и GIF: file_unique_id — ключ без повторов, file_id — для отправки
+        media = getattr(message, message_type, None) if message_type in MEDIA_TYPES else None
         return {
-            'action': 'process',
-            'message': msg,
-            'chat': chat,
-            'user': user
+            'chat_id': str(message.chat.id),
+            'chat_title': getattr(message.chat, 'title', None),
+            'user_id': str(user.id),
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'message_id': message.message_id,
+            'text': getattr(message, 'text', None),
+            'message_type': message_type,
+            'media_id': media.file_unique_id if media else None,
+            'file_id': media.file_id if media else None,
+            'timestamp': received_at or datetime.now(),
         }
-    
-    def _get_message_type(self, message: Any) -> str:
+
+    def process_message(self, message: Any, db: Session) -> Dict:
+        """Обработка одного сообщения (та же запись, что и для пачки)"""
+        row = self.message_row(message)
+        if row['text'] and contains_blacklisted_words(row['text'], Config.BLACKLIST_WORDS):
+            return {'action': 'ignore', 'reason': 'blacklisted'}
+
+        _, _, switched = self.process_batch([row], db)
+        chat = self.repository.get_chat(db, row['chat_id'])
+        if switched:
+            return {'action': 'switch_to_active', 'chat': chat}
+        return {'action': 'process', 'chat': chat}
+
+    def process_batch(self, rows: List[Dict[str, Any]], db: Session) -> Tuple[List[tuple], List[tuple], List[int]]:
+        """Запись пачки сообщений из очереди одним коммитом
+
+        Возвращает для PatternLearner сохраненные тексты (text, chat_id, user_id)
+        и медиа (media_type, media_id, file_id, chat_id, user_id) с ключами
+        chats и users, а также ключи чатов, у которых закончилось обучение.
+        """
+        with span('blacklist'):
+            rows = [row for row in rows
+                    if not (row['text'] and contains_blacklisted_words(row['text'], Config.BLACKLIST_WORDS))]
+        if not rows:
+            return [], [], []
+
+        try:
+            return self._write_batch(rows, db)
+        except Exception:
+            db.rollback()
+            # Снимки строк, созданных в откаченной транзакции, недействительны
+            for row in rows:
+                self.repository.chats.pop(row['chat_id'])
+                self.repository.users.pop(row['user_id'])
+            raise
+
+    def _write_batch(self, rows: List[Dict[str, Any]], db: Session) -> Tuple[List[tuple], List[tuple], List[int]]:
+        with span('lookup'):
+            chats = self.repository.ensure_chats(db, {row['chat_id']: row['chat_title'] for row in rows})
+            users = self.repository.ensure_users(db, {
+                row['user_id']: {'username': row['username'], 'first_name': row['first_name'],
+                                 'last_name': row['last_name']}
+                for row in rows
+            })
+
+        messages = []
+        for row in rows:
+            chat, user = chats[row['chat_id']], users[row['user_id']]
+            messages.append({
+                'chat_id': chat['id'],
+                'user_id': user['id'],
+                'message_id': row['message_id'],
+                'text': row['text'],
+                'message_type': row['message_type'],
+                'timestamp': row['timestamp'],
+                'is_processed': False,
+                'has_reaction': False,
+            })
+        with span('insert'):
+            self.repository.insert_messages(db, messages)
+
+        # Проверка режима обучения
+        switched = []
+        now = datetime.now()
+        for chat in chats.values():
+            if chat['learning_mode'] and chat['learning_end_time'] and now > chat['learning_end_time']:
+                self.repository.end_learning(db, chat)
+                switched.append(chat['id'])
+
+        # Пакетное обновление счётчиков пользователей уходит в тот же коммит
+        flushed_users = {}
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            flushed_users = self._flush_user_updates(db)
+
+        try:
+            with span('commit'):
+                db.commit()
+        except Exception:
+            self._merge_back_users(flushed_users)
+            raise
+
+        # Счетчики — только после коммита: при повторе пачки они не задвоятся
+        for row in rows:
+            chat, user = chats[row['chat_id']], users[row['user_id']]
+            self._count_user(user, row['timestamp'])
+            # Дневная статистика чата копится в памяти и сливается пачкой
+            stats_rollup.record_message(chat['id'], personality_level=chat['personality_level'],
+                                        when=row['timestamp'])
+
+        # Пачка уже закоммичена: ошибка отсюда заставила бы очередь записать ее
+        # повторно. Неудачная выгрузка возвращает дельты и повторится позже
+        if stats_rollup.should_flush():
+            try:
+                stats_rollup.flush(db)
+            except Exception as e:
+                logger.error(f"❌ Не удалось выгрузить статистику чатов: {e}")
+
+        texts = [(message['text'], message['chat_id'], message['user_id'])
+                 for message in messages if message['text']]
+        media = [(row['message_type'], row['media_id'], row['file_id'], message['chat_id'], message['user_id'])
+                 for row, message in zip(rows, messages) if row.get('media_id')]
+        return texts, media, switched
+
+    def flush(self, db: Session):
+        """Запись отложенных обновлений (например, при остановке)"""
+        flushed_users = self._flush_user_updates(db)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._merge_back_users(flushed_users)
+            raise
+        stats_rollup.flush(db)
+
+    def _count_user(self, snapshot: Dict, seen: datetime):
+        """Write-through: кэш обновляется сразу, БД — пачкой при следующей выгрузке"""
+        with self._pending_lock:
+            snapshot['message_count'] = (snapshot['message_count'] or 0) + 1
+            snapshot['last_seen'] = seen
+            pending = self._pending_users.setdefault(snapshot['id'], [0, seen])
+            pending[0] += 1
+            pending[1] = seen
+
+    def _flush_user_updates(self, db: Session) -> Dict[int, list]:
+        """Один UPDATE (executemany) на все накопленные изменения users
+
+        Возвращает выгруженные изменения: если коммит не удастся, их нужно
+        вернуть через _merge_back_users, иначе приросты потеряются.
+        """
+        with self._pending_lock:
+            pending, self._pending_users = self._pending_users, {}
+            self._last_flush = time.monotonic()
+
+        try:
+            self.repository.bump_users(db, pending)
+        except Exception:
+            self._merge_back_users(pending)
+            raise
+        return pending
+
+    def _merge_back_users(self, pending: Dict[int, list]):
+        with self._pending_lock:
+            for pk, (delta, seen) in pending.items():
+                entry = self._pending_users.setdefault(pk, [0, seen])
+                entry[0] += delta
+                if seen > entry[1]:
+                    entry[1] = seen
+
+    @staticmethod
+    def _get_message_type(message: Any) -> str:
         """Определение типа сообщения"""
         if message.content_type == 'text':
             return 'text'
         elif message.content_type == 'sticker':
             return 'sticker'
+        elif message.content_type == 'animation':
+            return 'animation'
         elif message.content_type == 'photo':
             return 'photo'
         elif message.content_type == 'video':
@@ -91,4 +209,4 @@ class MessageProcessor:
         elif message.content_type == 'voice':
             return 'voice'
         else:
-            return 'other'
\ No newline at end of file
+            return 'other'
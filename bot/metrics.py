@@ -0,0 +1,353 @@
+"""Метрики горячего пути в текстовом формате Prometheus
+
+Этапы обработки сообщения оборачиваются в span('<этап>'): длительность
+попадает в гистограмму chatclone_stage_seconds с фиксированными
+корзинами (bisect по кортежу границ и инкремент под блокировкой — единицы
+микросекунд на этап). Запросы к БД считаются по событиям engine
+SQLAlchemy (instrument_engine). trace('<имя>') объединяет этапы одного
+обновления или пачки: если вся трасса дольше METRICS_SLOW_TRACE_MS,
+в лог уходит разбивка по этапам и число запросов.
+
+Метрики отдают /metrics веб-приложения и HTTP-сервер воркера
+(METRICS_PORT, там же /ready из bot.readiness). Реестр свой у каждого процесса: воркеры gunicorn
+Prometheus видит как отдельные цели.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин задержки, секунды: от 0.1 мс до 10 с
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Число запросов к БД на трассу
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+Sample = Tuple[Dict[str, str], float]
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Серия с заданными значениями меток (создается один раз)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[Dict[str, str], object]]:
+        for values, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, values)), child
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [(self.name, labels, child.value) for labels, child in self._series()]
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        result = []
+        for labels, child in self._series():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                result.append((self.name + '_bucket', {**labels, 'le': _format_value(float(bound))}, cumulative))
+            result.append((self.name + '_sum', labels, total))
+            result.append((self.name + '_count', labels, cumulative))
+        return result
+
+# Сборщик: функция, возвращающая [(имя, тип, описание, [(метки, значение)])]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+class Registry:
+    """Метрики процесса и сборщики значений чужих объектов (очереди, пул)"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, key: str, collector: Collector):
+        """Сборщик под ключом key (повторная регистрация заменяет прежний)"""
+        with self._lock:
+            self._collectors[key] = collector
+
+    def unregister_collector(self, key: str):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors.items())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for key, collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"❌ Ошибка сборщика метрик {key}: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'chatclone_stage_seconds', 'Длительность этапов обработки сообщений', ['stage'])
+TRACE_DB_QUERIES = registry.histogram(
+    'chatclone_trace_db_queries', 'Запросов к БД на обновление или пачку', ['trace'], COUNT_BUCKETS)
+SLOW_TRACES = registry.counter(
+    'chatclone_slow_traces_total', 'Трассы дольше METRICS_SLOW_TRACE_MS', ['trace'])
+DB_QUERIES = registry.counter(
+    'chatclone_db_queries_total', 'Запросы к БД по типу', ['operation'])
+DB_QUERY_SECONDS = registry.histogram(
+    'chatclone_db_query_seconds', 'Длительность запросов к БД', ['operation'])
+DB_ERRORS = registry.counter(
+    'chatclone_db_errors_total', 'Ошибки выполнения запросов к БД')
+SEND_LATENCY_SECONDS = registry.histogram(
+    'chatclone_send_latency_seconds', 'От постановки ответа в очередь до его отправки')
+
+class _Trace:
+    __slots__ = ('name', 'started', 'stages', 'queries', 'query_seconds')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.queries = 0
+        self.query_seconds = 0.0
+
+_local = threading.local()
+
+@contextmanager
+def span(stage: str):
+    """Замер этапа: гистограмма stage и разбивка текущей трассы"""
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        current = getattr(_local, 'trace', None)
+        if current is not None:
+            current.stages.append((stage, elapsed))
+
+@contextmanager
+def trace(name: str):
+    """Трасса обновления или пачки в текущем потоке (вложенные не заводятся)"""
+    if not Config.METRICS_ENABLED or getattr(_local, 'trace', None) is not None:
+        with span(name):
+            yield
+        return
+    current = _local.trace = _Trace(name)
+    try:
+        yield
+    finally:
+        _local.trace = None
+        elapsed = time.perf_counter() - current.started
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        TRACE_DB_QUERIES.labels(name).observe(current.queries)
+        if elapsed * 1000 >= Config.METRICS_SLOW_TRACE_MS:
+            SLOW_TRACES.labels(name).inc()
+            breakdown = ', '.join(f"{stage} {seconds * 1000:.1f}" for stage, seconds in current.stages)
+            logger.warning(f"🐢 Медленная трасса {name}: {elapsed * 1000:.1f} мс ({breakdown}); "
+                           f"запросов к БД {current.queries} за {current.query_seconds * 1000:.1f} мс")
+
+_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK')
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip()[:8].upper()
+    for operation in _OPERATIONS:
+        if head.startswith(operation):
+            return operation.lower()
+    return 'other'
+
+def instrument_engine(engine):
+    """Счетчики и длительность запросов по событиям engine SQLAlchemy"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        operation = _operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        DB_QUERY_SECONDS.labels(operation).observe(elapsed)
+        current = getattr(_local, 'trace', None)
+        if current is not None:
+            current.queries += 1
+            current.query_seconds += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        DB_ERRORS.inc()
+
+def register_queue(key: str, queue, documentation: str):
+    """Счетчики queue.stats и длина очереди (IngestionQueue, диспетчеры отправки и webhook)"""
+    def collect():
+        stats = dict(queue.stats)
+        return [
+            (f'chatclone_{key}_total', 'counter', documentation,
+             [({'outcome': outcome}, value) for outcome, value in stats.items()]),
+            (f'chatclone_{key}_queue_size', 'gauge', f'{documentation}: длина очереди',
+             [({}, queue.qsize())]),
+        ]
+    registry.register_collector(key, collect)
+
+def _ready_metrics():
+    from bot.readiness import is_ready, startup_seconds
+    return [
+        ('chatclone_ready', 'gauge', 'Бот принимает обновления', [({}, 1 if is_ready() else 0)]),
+        ('chatclone_startup_seconds', 'gauge', 'Время от старта процесса до готовности', [({}, startup_seconds())]),
+    ]
+
+registry.register_collector('readiness', _ready_metrics)
+
+def start_http_server(port: int, host: str = '0.0.0.0'):
+    """/metrics и /ready воркера бота в фоновом потоке"""
+    # http.server тянет email и html: импорт только там, где сервер нужен
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from bot.readiness import is_ready
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                status, content_type, body = 200, CONTENT_TYPE, registry.render().encode()
+            elif path == '/ready':
+                status = 200 if is_ready() else 503
+                content_type, body = 'text/plain; charset=utf-8', (b'ready\n' if status == 200 else b'starting\n')
+            else:
+                self.send_error(404)
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,197 @@
+"""Версионированные миграции схемы БД
+
+Запуск: python -m bot.migrations [--list]
+
+Примененные версии записываются в таблицу schema_version. Все новые
+миграции выполняются в одной транзакции; в PostgreSQL ее защищает
+advisory-блокировка, поэтому воркеры и веб-процессы, стартующие
+одновременно, не применят миграцию дважды. Новая миграция — функция
+с декоратором @migration(<следующий номер>, '<имя>') в конце файла.
+"""
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (Column, DateTime, Integer, LargeBinary, MetaData, String, Table, cast, false, func,
+                        inspect, literal, select, text)
+
+from bot.database import Base, Chat, Message, Statistic, User, engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки на время миграций
+MIGRATION_LOCK_KEY = 0x6d696772
+
+# Таблица сообщений старого SimpleBot (message_text, created_at)
+LEGACY_TABLE = 'messages_raw_legacy'
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+def migration(version: int, name: str):
+    def register(func: Callable) -> Callable:
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+def _columns(conn, table: str) -> set:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+@migration(1, 'legacy_raw_messages')
+def _rename_legacy_messages(conn):
+    """Сырая таблица messages старого бота освобождает имя для модели Message"""
+    if 'message_text' not in _columns(conn, 'messages'):
+        return
+    conn.execute(text(f"ALTER TABLE messages RENAME TO {LEGACY_TABLE}"))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(f"ALTER INDEX IF EXISTS messages_pkey RENAME TO {LEGACY_TABLE}_pkey"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS messages_id_seq RENAME TO {LEGACY_TABLE}_id_seq"))
+
+@migration(2, 'base_schema')
+def _create_base_schema(conn):
+    """Таблицы моделей; messages в PostgreSQL — секционированная (bot.maintenance)"""
+    from bot.maintenance import init_partitioning
+
+    Base.metadata.create_all(bind=conn, tables=[Chat.__table__, User.__table__])
+    init_partitioning(conn)
+    Base.metadata.create_all(bind=conn)
+
+@migration(3, 'import_legacy_messages')
+def _import_legacy_messages(conn):
+    """Перенос сообщений старого бота в messages с созданием чатов и пользователей"""
+    if not _columns(conn, LEGACY_TABLE):
+        return
+    from bot.maintenance import ensure_partitions, table_kind
+    from bot.repository import repository
+
+    legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=conn)
+    chat_ids = conn.execute(select(legacy.c.chat_id).where(legacy.c.chat_id.isnot(None))
+                            .distinct()).scalars().all()
+    profiles = {}
+    for user_id, username in conn.execute(select(legacy.c.user_id, legacy.c.username)
+                                          .where(legacy.c.user_id.isnot(None)).distinct()):
+        profiles[str(user_id)] = {'username': username, 'first_name': None, 'last_name': None}
+    try:
+        repository.ensure_chats(conn, {str(chat_id): None for chat_id in chat_ids})
+        repository.ensure_users(conn, profiles)
+    finally:
+        # Снимки из незакоммиченной транзакции в кэше не оставляем
+        repository.chats.clear()
+        repository.users.clear()
+
+    if conn.dialect.name == 'postgresql' and table_kind(conn, 'messages') == 'p':
+        oldest = conn.execute(select(legacy.c.created_at).order_by(legacy.c.created_at)
+                              .where(legacy.c.created_at.isnot(None)).limit(1)).scalar()
+        ensure_partitions(conn, since=oldest)
+
+    chats_table, users_table = Chat.__table__, User.__table__
+    created_at = func.coalesce(legacy.c.created_at, datetime.now())
+    if conn.dialect.name == 'sqlite':
+        # SQLite хранит время текстом: приводим к формату SQLAlchemy (с микросекундами),
+        # иначе сравнение с курсором ленты (timestamp, id) идет не по времени
+        created_at = func.strftime('%Y-%m-%d %H:%M:%f000', created_at)
+    source = select(
+        chats_table.c.id, users_table.c.id, legacy.c.message_text, literal('text'),
+        created_at, false(), false(),
+    ).select_from(
+        legacy.outerjoin(chats_table, chats_table.c.chat_id == cast(legacy.c.chat_id, String))
+              .outerjoin(users_table, users_table.c.user_id == cast(legacy.c.user_id, String))
+    ).order_by(legacy.c.id)
+    moved = conn.execute(Message.__table__.insert().from_select(
+        ['chat_id', 'user_id', 'text', 'message_type', 'timestamp', 'is_processed', 'has_reaction'],
+        source,
+    )).rowcount
+
+    conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    logger.info(f"Перенесено сообщений старого формата: {moved}")
+
+@migration(4, 'user_style_profile')
+def _add_user_style_profile(conn):
+    """Колонка users.style_profile для профилей стиля (bot.style_profile)"""
+    if 'style_profile' in _columns(conn, 'users'):
+        return
+    column_type = LargeBinary().compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE users ADD COLUMN style_profile {column_type}"))
+
+@migration(5, 'backfill_statistics')
+def _backfill_statistics(conn):
+    """Дневные счетчики statistics по уже записанным сообщениям
+
+    Итоги панели и /stats читаются только из statistics (bot.stats_rollup),
+    поэтому история до его появления и перенесенные миграцией 3 сообщения
+    засчитываются здесь. Если за день уже есть счетчик, остается больший:
+    сообщения, удаленные по сроку хранения, из него не вычитаются.
+    """
+    from bot.repository import UPSERT_CHUNK_SIZE, dialect_insert
+
+    day = func.date(Message.timestamp)
+    counts = conn.execute(
+        select(Message.chat_id, day.label('day'), func.count().label('messages'))
+        .where(Message.chat_id.isnot(None))
+        .group_by(Message.chat_id, day)
+    ).all()
+    rows = [
+        # SQLite возвращает date() строкой, PostgreSQL — датой
+        {'chat_id': chat_id, 'date': datetime.combine(date.fromisoformat(str(value)), datetime.min.time()),
+         'total_messages': messages, 'bot_responses': 0, 'avg_response_time': 0.0, 'personality_level': None}
+        for chat_id, value, messages in counts
+    ]
+    greatest = func.greatest if conn.dialect.name == 'postgresql' else func.max
+    insert_ = dialect_insert(conn.dialect.name)
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = insert_(Statistic.__table__).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Statistic.chat_id, Statistic.date],
+            set_={'total_messages': greatest(func.coalesce(Statistic.total_messages, 0),
+                                             stmt.excluded.total_messages)},
+        )
+        conn.execute(stmt)
+    logger.info(f"Дневных счетчиков statistics по истории сообщений: {len(rows)}")
+
+def applied_versions(conn) -> List[int]:
+    schema_version.create(conn, checkfirst=True)
+    return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version)).scalars().all()
+
+def migrate() -> List[int]:
+    """Применение новых миграций; возвращает их номера"""
+    done = []
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        applied = set(applied_versions(conn))
+        for version, name, apply in sorted(MIGRATIONS):
+            if version in applied:
+                continue
+            apply(conn)
+            conn.execute(schema_version.insert().values(version=version, name=name,
+                                                        applied_at=datetime.now()))
+            logger.info(f"Применена миграция {version}: {name}")
+            done.append(version)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help='показать миграции и их статус')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.list:
+        with engine.begin() as conn:
+            applied = set(applied_versions(conn))
+        for version, name, _ in sorted(MIGRATIONS):
+            print(f"{version:4d} {'✅' if version in applied else '⏳'} {name}")
+        return
+    logger.info(f"✅ Применено миграций: {len(migrate())}")
+
+if __name__ == '__main__':
+    main()
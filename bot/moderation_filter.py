@@ -0,0 +1,241 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Невидимые символы, которыми разбивают слова: zero-width и мягкий перенос
+_INVISIBLE_RE = re.compile('[\u00ad\u200b-\u200d\u2060\ufeff]')
+
+# Латиница и цифры, похожие на кириллицу (только в словах с кириллицей)
+_TO_CYRILLIC = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у', 'u': 'и', 'r': 'г',
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б', '@': 'а', '$': 'с',
+})
+# Замены в латинских словах
+_TO_LATIN = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's',
+})
+
+_CYRILLIC_RE = re.compile(r'[а-я]')
+# Слова, где кириллица смешана с латиницей или цифрами (проверка от начала слова)
+_MIXED_CYRILLIC_RE = re.compile(r'(?<![\w@$])(?=[\w@$]*[а-я])(?=[\w@$]*[a-z0-9@$])[\w@$]+')
+# Латинские слова с цифрами и символами вместо букв
+_LEET_LATIN_RE = re.compile(r'(?<![\w@$])(?=[\w@$]*[a-z])(?=[\w@$]*[0-9@$])[\w@$]+')
+_REPEAT_RE = re.compile(r'(\w)\1+')
+_SEPARATORS_RE = re.compile(r'[\W_]+')
+
+# Окончания для грубого стемминга (длинные проверяются первыми)
+_RU_ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ией',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ия', 'ья',
+    'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+_EN_ENDINGS = ('es', 's')
+MIN_STEM = 4
+# Чередования в основах однокоренных слов: расизм — расист, политика — политический
+_ALTERNATIONS = (('изм', 'ист'), ('ик', 'ич'))
+
+def normalize(text: str, collapse_repeats: bool = True) -> str:
+    """Приведение текста к виду для сравнения: регистр, ё, гомоглифы, повторы букв
+
+    Знаки препинания и пробелы схлопываются в один пробел, поэтому границы
+    слов в нормализованном тексте — это пробелы. Все шаги — проходы
+    регулярных выражений по всему тексту, без цикла по словам в Python.
+    collapse_repeats=False оставляет повторы букв (так нормализуются термины).
+    """
+    if not text:
+        return ''
+    text = _INVISIBLE_RE.sub('', text).casefold().replace('ё', 'е')
+    text = _MIXED_CYRILLIC_RE.sub(lambda m: m.group().translate(_TO_CYRILLIC), text)
+    text = _LEET_LATIN_RE.sub(lambda m: m.group().translate(_TO_LATIN), text)
+    if collapse_repeats:
+        text = _REPEAT_RE.sub(r'\1', text)
+    return _SEPARATORS_RE.sub(' ', text).strip()
+
+def _text_forms(text: str) -> Tuple[str, ...]:
+    """Текст как есть и со схлопнутыми повторами («ааааа» -> «а») после нормализации"""
+    plain = normalize(text, collapse_repeats=False)
+    collapsed = _REPEAT_RE.sub(r'\1', plain)
+    return (plain,) if collapsed == plain else (plain, collapsed)
+
+def stem(word: str) -> str:
+    """Отбрасывание окончания, если остается основа не короче MIN_STEM"""
+    endings = _RU_ENDINGS if _CYRILLIC_RE.search(word) else _EN_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def _stem_variants(word: str) -> List[str]:
+    """Основа слова и ее вариант с чередованием (основа однокоренных слов)"""
+    stemmed = stem(word)
+    variants = [stemmed]
+    for ending, replacement in _ALTERNATIONS:
+        if stemmed.endswith(ending) and len(stemmed) - len(ending) >= MIN_STEM - len(replacement):
+            variants.append(stemmed[:-len(ending)] + replacement)
+            break
+    return variants
+
+def _term_forms(term: str) -> List[Tuple[str, bool]]:
+    """Нормализованные формы термина и нужно ли точное совпадение слова
+
+    У фраз стеммится последнее слово, основа ищется как начало слова с любым
+    продолжением («порно» — «порнография»), а чередования дают основы
+    однокоренных слов («расизм» — «расистский»). Повторы букв в термине не
+    схлопываются: короткий «ass» иначе стал бы «as» и совпадал с обычными
+    словами. Форма со схлопнутыми повторами добавляется, только если ее
+    последнее слово не короче MIN_STEM. Термины, чье последнее слово короче
+    MIN_STEM, ищутся как слово целиком, без окончаний.
+    """
+    words = normalize(term, collapse_repeats=False).split()
+    if not words:
+        return []
+    forms = []
+    for variant in _stem_variants(words[-1]):
+        plain = ' '.join(words[:-1] + [variant])
+        forms.append((plain, len(variant) < MIN_STEM))
+        collapsed = _REPEAT_RE.sub(r'\1', plain)
+        if collapsed != plain and len(collapsed.split()[-1]) >= MIN_STEM:
+            forms.append((collapsed, False))
+    return forms
+
+def _trie_pattern(node: Dict[str, dict]) -> str:
+    """Регулярное выражение из префиксного дерева: общие префиксы не дублируются"""
+    end = '' in node
+    branches = []
+    chars = []
+    for char in sorted(k for k in node if k):
+        child = node[char]
+        if list(child) == ['']:
+            chars.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + _trie_pattern(child))
+    if chars:
+        branches.append(chars[0] if len(chars) == 1 else '[' + ''.join(chars) + ']')
+    if not branches:
+        return ''
+    if len(branches) == 1 and not end:
+        return branches[0]
+    pattern = '(?:' + '|'.join(branches) + ')'
+    return pattern + '?' if end else pattern
+
+def compile_terms(terms: Iterable[str]) -> Optional[re.Pattern]:
+    """Одно регулярное выражение для всех терминов списка"""
+    stems: Dict[str, dict] = {}
+    exact: Dict[str, dict] = {}
+    for term in terms:
+        for form, whole_word in _term_forms(term):
+            node = exact if whole_word else stems
+            for char in form:
+                node = node.setdefault(char, {})
+            node[''] = {}
+    # Основа термина с начала слова и любое продолжение слова;
+    # короткие термины — только слово целиком
+    branches = []
+    if stems:
+        branches.append(rf'{_trie_pattern(stems)}\w*')
+    if exact:
+        branches.append(_trie_pattern(exact))
+    if not branches:
+        return None
+    return re.compile(rf'(?<!\w)(?:{"|".join(branches)})(?!\w)')
+
+def load_terms(path: str) -> List[str]:
+    """Термины из файла: по одному на строку, # — комментарий"""
+    terms = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                terms.append(line)
+    return terms
+
+class ModerationFilter:
+    """Проверка сообщений по чёрному списку одним скомпилированным выражением
+
+    Термины из списка и файла BLACKLIST_FILE сводятся в префиксное дерево и
+    компилируются один раз, поэтому стоимость проверки почти не зависит от
+    длины списка. Файл перечитывается, если изменилось время его модификации
+    (не чаще reload_interval секунд) — без перезапуска бота.
+    """
+
+    def __init__(self, words: Iterable[str] = (), path: Optional[str] = None,
+                 reload_interval: float = None):
+        self.words = tuple(words)
+        self.path = path
+        self.reload_interval = reload_interval if reload_interval is not None else Config.BLACKLIST_RELOAD_INTERVAL
+        self._pattern: Optional[re.Pattern] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> int:
+        """Перекомпиляция списка; возвращает число терминов"""
+        terms = list(self.words)
+        mtime = None
+        if self.path:
+            try:
+                mtime = os.path.getmtime(self.path)
+                terms.extend(load_terms(self.path))
+            except OSError as e:
+                logger.error(f"❌ Не удалось прочитать чёрный список {self.path}: {e}")
+        pattern = compile_terms(terms)
+        with self._lock:
+            self._pattern = pattern
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        return len(terms)
+
+    def _maybe_reload(self):
+        if not self.path or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def find(self, text: str) -> List[str]:
+        """Найденные в тексте термины (в нормализованном виде)"""
+        self._maybe_reload()
+        pattern = self._pattern
+        if pattern is None or not text:
+            return []
+        found = []
+        for form in _text_forms(text):
+            found.extend(match for match in pattern.findall(form) if match not in found)
+        return found
+
+    def contains(self, text: str) -> bool:
+        """Есть ли термин в тексте (как написан или со схлопнутыми повторами букв)"""
+        self._maybe_reload()
+        pattern = self._pattern
+        if pattern is None or not text:
+            return False
+        return any(pattern.search(form) is not None for form in _text_forms(text))
+
+_filters: Dict[Tuple[str, ...], ModerationFilter] = {}
+_filters_lock = threading.Lock()
+
+def get_filter(words: Iterable[str]) -> ModerationFilter:
+    """Фильтр для списка слов (компилируется при первом обращении)"""
+    key = tuple(words)
+    moderation_filter = _filters.get(key)
+    if moderation_filter is None:
+        with _filters_lock:
+            moderation_filter = _filters.get(key)
+            if moderation_filter is None:
+                moderation_filter = ModerationFilter(key, path=Config.BLACKLIST_FILE)
+                _filters[key] = moderation_filter
+    return moderation_filter
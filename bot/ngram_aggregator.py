@@ -0,0 +1,121 @@
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Tuple, Optional
+from sqlalchemy.orm import Session
+
+from bot.config import Config
+from bot.repository import repository
+
+logger = logging.getLogger(__name__)
+
+# Ключ агрегата: (chat_id, pattern_type, pattern_text)
+PatternKey = Tuple[int, str, str]
+
+# Агрегаторы процесса: сброс чата выбрасывает и его невыгруженные дельты
+_aggregators = weakref.WeakSet()
+
+def discard_chat(chat_id: int):
+    """Удаление невыгруженных дельт чата из всех агрегаторов процесса"""
+    for aggregator in list(_aggregators):
+        aggregator.discard_chat(chat_id)
+
+class NgramAggregator:
+    """Накопление частот n-грамм в памяти с периодической пакетной выгрузкой
+
+    Дельты частот копятся в Counter по ключу (chat_id, pattern_type, text)
+    и сливаются в таблицу patterns одним upsert-запросом на пачку.
+    """
+
+    def __init__(self, flush_interval: float = None, max_pending: int = None):
+        self.flush_interval = flush_interval if flush_interval is not None else Config.PATTERN_FLUSH_INTERVAL
+        self.max_pending = max_pending or Config.PATTERN_FLUSH_MAX_PENDING
+
+        self._counts: Counter = Counter()
+        self._first_user: Dict[PatternKey, int] = {}
+        # Pattern.context (JSON) по ключу — последний увиденный
+        self._contexts: Dict[PatternKey, str] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        _aggregators.add(self)
+
+    def add(self, chat_id: int, pattern_type: str, counts: Counter, user_id: Optional[int] = None,
+            contexts: Optional[Dict[str, str]] = None):
+        """Добавить дельты частот для одного типа паттернов (contexts — JSON по элементу)"""
+        with self._lock:
+            for item, count in counts.items():
+                key = (chat_id, pattern_type, sys.intern(item))
+                self._counts[key] += count
+                if user_id is not None and key not in self._first_user:
+                    self._first_user[key] = user_id
+                if contexts and item in contexts:
+                    self._contexts[key] = contexts[item]
+
+    def discard_chat(self, chat_id: int):
+        """Удаление невыгруженных дельт одного чата (сброс обучения)"""
+        with self._lock:
+            for key in [key for key in self._counts if key[0] == chat_id]:
+                del self._counts[key]
+                self._first_user.pop(key, None)
+                self._contexts.pop(key, None)
+
+    def pending(self) -> int:
+        return len(self._counts)
+
+    def should_flush(self) -> bool:
+        if not self._counts:
+            return False
+        return (len(self._counts) >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush(self, db: Session) -> List[tuple]:
+        """Выгрузка накопленных дельт в БД
+
+        Возвращает строки (id, chat_id, pattern_type, pattern_text, frequency)
+        с итоговыми частотами — по ним обновляются индексы в памяти.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            first_user, self._first_user = self._first_user, {}
+            contexts, self._contexts = self._contexts, {}
+            self._last_flush = time.monotonic()
+
+        if not counts:
+            return []
+
+        now = datetime.now()
+        rows = [
+            {
+                'chat_id': chat_id,
+                'pattern_type': pattern_type,
+                'pattern_text': text,
+                'frequency': frequency,
+                'user_id': first_user.get((chat_id, pattern_type, text)),
+                'context': contexts.get((chat_id, pattern_type, text)),
+                'last_used': now,
+            }
+            for (chat_id, pattern_type, text), frequency in counts.items()
+        ]
+
+        try:
+            updated = repository.upsert_patterns(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._merge_back(counts, first_user, contexts)
+            raise
+
+        return updated
+
+    def _merge_back(self, counts: Counter, first_user: Dict[PatternKey, int], contexts: Dict[PatternKey, str]):
+        """Вернуть невыгруженные дельты, чтобы не потерять их до следующей попытки"""
+        with self._lock:
+            self._counts.update(counts)
+            for key, user_id in first_user.items():
+                self._first_user.setdefault(key, user_id)
+            for key, context in contexts.items():
+                self._contexts.setdefault(key, context)
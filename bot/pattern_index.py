@@ -0,0 +1,336 @@
+import math
+import threading
+from array import array
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Tuple
+
+from sqlalchemy.orm import Session
+
+from bot.cache import KeyedLocks, LRUCache
+from bot.config import Config
+from bot.database import Pattern
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Типы паттернов, по которым ищет ResponseGenerator
+INDEXED_TYPES = ('word', 'bigram', 'trigram')
+
+# Строка паттерна: (id, chat_id, pattern_type, pattern_text, frequency)
+PatternRow = Tuple[int, int, str, str, int]
+
+_INITIAL_CAPACITY = 256
+
+# Токены, которые есть больше чем в 5% паттернов (и не менее чем в 1000), не учитываются
+COMMON_TOKEN_SHARE = 0.05
+COMMON_TOKEN_MIN_DF = 1000
+
+# Паттерны индекса — word, bigram и trigram: не больше трех токенов
+MAX_PATTERN_TOKENS = 3
+# Сколько паттернов токена с наибольшим prior участвует в поиске (не меньше limit поиска)
+IMPACT_POSTINGS = 256
+
+class ChatPatternIndex:
+    """Инвертированный индекс token -> паттерны одного чата с ранжированием TF-IDF
+
+    Паттерны — «документы» из 1–3 токенов. Частоты паттернов, токены строк
+    и документная частота токенов лежат в массивах NumPy. IDF считается при
+    поиске только для токенов контекста, поэтому добавление паттерна меняет
+    лишь счетчики его токенов.
+
+    Кандидаты для контекста — до IMPACT_POSTINGS паттернов каждого токена с
+    наибольшим prior и паттерны, где есть сразу два частых токена контекста
+    (для пар частых токенов хранятся общие строки). Остальные паттерны
+    совпадают с контекстом одним токеном и уступают IMPACT_POSTINGS лучшим
+    паттернам этого токена, поэтому результат совпадает с полным перебором.
+    """
+
+    def __init__(self):
+        # NumPy грузится при первом индексе чата, а не при старте бота
+        import numpy as np
+
+        self.patterns: Dict[int, list] = {}  # id -> [pattern_text, pattern_type, frequency]
+        self._rows: Dict[int, int] = {}  # id паттерна -> строка в массивах
+        self._next_row = 0
+        self._ids = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)
+        # log(1 + frequency) / sqrt(число токенов) — множитель оценки паттерна
+        self._prior = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        # Столбцы токенов строки; -1 — нет токена (в оценке это нулевой вес)
+        self._row_tokens = np.full((_INITIAL_CAPACITY, MAX_PATTERN_TOKENS), -1, dtype=np.int32)
+
+        self._tokens: Dict[str, int] = {}  # токен -> столбец в _df
+        self._df = np.zeros(_INITIAL_CAPACITY, dtype=np.float64)
+        self._postings: Dict[str, list] = {}  # токен -> строки паттернов
+        self._impact: Dict[str, 'np.ndarray'] = {}  # токен -> лучшие строки по prior
+        # (столбец, столбец) частых токенов -> общие строки
+        self._pairs: Dict[Tuple[int, int], array] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _grow(array: 'np.ndarray', size: int, fill=0) -> 'np.ndarray':
+        import numpy as np
+
+        if size <= len(array):
+            return array
+        grown = np.full((max(size, len(array) * 2),) + array.shape[1:], fill, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add(self, pattern_id: int, pattern_text: str, pattern_type: str, frequency: int):
+        """Добавление паттерна или обновление его частоты"""
+        with self._lock:
+            entry = self.patterns.get(pattern_id)
+            if entry is not None:
+                row = self._rows[pattern_id]
+                tokens = list(dict.fromkeys(pattern_text.split()))[:MAX_PATTERN_TOKENS]
+                entry[2] = frequency
+                self._prior[row] = self._pattern_prior(frequency, len(tokens))
+                for token in tokens:
+                    self._offer(token, row)
+                return
+
+            tokens = list(dict.fromkeys(pattern_text.split()))[:MAX_PATTERN_TOKENS]
+            row = self._next_row
+            self._next_row += 1
+            self.patterns[pattern_id] = [pattern_text, pattern_type, frequency]
+            self._rows[pattern_id] = row
+            self._ids = self._grow(self._ids, row + 1)
+            self._prior = self._grow(self._prior, row + 1)
+            self._row_tokens = self._grow(self._row_tokens, row + 1, fill=-1)
+            self._ids[row] = pattern_id
+            self._prior[row] = self._pattern_prior(frequency, len(tokens))
+
+            columns = []
+            linked = set()
+            for position, token in enumerate(tokens):
+                column = self._tokens.get(token)
+                if column is None:
+                    column = self._tokens[token] = len(self._tokens)
+                    self._df = self._grow(self._df, column + 1)
+                self._df[column] += 1
+                self._row_tokens[row, position] = column
+                columns.append(column)
+                self._postings.setdefault(token, []).append(row)
+                self._offer(token, row)
+            # Токены строки уже записаны: ставшие частыми связываются с ней тоже
+            for token in tokens:
+                if len(self._postings[token]) == IMPACT_POSTINGS + 1:
+                    linked.update(self._link_pairs(token))
+            if len(columns) > 1:
+                # Хранящиеся пары поддерживаются всегда, даже если токен снова стал редким
+                for first, second in self._pairs_of(columns):
+                    if (first, second) in linked:
+                        continue
+                    rows = self._pairs.get((first, second))
+                    if rows is None and self._df[first] > IMPACT_POSTINGS and self._df[second] > IMPACT_POSTINGS:
+                        rows = self._pairs[first, second] = array('q')
+                    if rows is not None:
+                        rows.append(row)
+
+    def remove(self, pattern_id: int):
+        """Удаление паттерна: строка больше не участвует в поиске и в df"""
+        with self._lock:
+            entry = self.patterns.pop(pattern_id, None)
+            if entry is None:
+                return
+            row = self._rows.pop(pattern_id)
+            for pair in self._pairs_of([column for column in self._row_tokens[row].tolist() if column >= 0]):
+                rows = self._pairs.get(pair)
+                if rows is not None and row in rows:
+                    rows.remove(row)
+            self._prior[row] = 0.0
+            self._row_tokens[row] = -1
+            for token in set(entry[0].split()):
+                postings = self._postings.get(token)
+                if postings is not None and row in postings:
+                    postings.remove(row)
+                    self._df[self._tokens[token]] -= 1
+                    self._impact.pop(token, None)
+
+    @staticmethod
+    def _pattern_prior(frequency: int, length: int) -> float:
+        return math.log1p(max(frequency, 0)) / math.sqrt(max(length, 1))
+
+    @staticmethod
+    def _pairs_of(columns: List[int]) -> List[Tuple[int, int]]:
+        columns = sorted(columns)
+        return [(a, b) for i, a in enumerate(columns) for b in columns[i + 1:]]
+
+    def _link_pairs(self, token: str) -> List[Tuple[int, int]]:
+        """Общие строки токена, ставшего частым, с другими частыми токенами
+
+        Уже хранящиеся пары не трогаются: их строки поддерживают add и remove.
+        Возвращает созданные пары.
+        """
+        column = self._tokens[token]
+        found: Dict[Tuple[int, int], array] = {}
+        for row in self._postings[token]:
+            for other in self._row_tokens[row].tolist():
+                if other >= 0 and other != column and self._df[other] > IMPACT_POSTINGS:
+                    pair = (column, other) if column < other else (other, column)
+                    if pair not in self._pairs:
+                        found.setdefault(pair, array('q')).append(row)
+        self._pairs.update(found)
+        return list(found)
+
+    def _offer(self, token: str, row: int):
+        """Учет новой строки или выросшего prior в лучших строках токена
+
+        Частоты в БД только растут, поэтому строка вытесняет из лучших строк
+        худшую (меньший prior, при равенстве — более поздняя строка, как в
+        порядке выдачи); уменьшение prior здесь не учитывается.
+        """
+        import numpy as np
+
+        rows = self._impact.get(token)
+        if rows is None or (rows == row).any():
+            return
+        if len(rows) < IMPACT_POSTINGS:
+            self._impact[token] = np.append(rows, row)
+            return
+        priors = self._prior[rows]
+        lowest = priors.min()
+        weakest = np.flatnonzero(priors == lowest)
+        weakest = weakest[np.argmax(rows[weakest])]
+        prior = self._prior[row]
+        if prior > lowest or (prior == lowest and row < rows[weakest]):
+            rows[weakest] = row
+
+    def _impact_rows(self, token: str) -> 'np.ndarray':
+        """Строки токена; у длинных списков — IMPACT_POSTINGS лучших по prior"""
+        import numpy as np
+
+        rows = self._impact.get(token)
+        if rows is None:
+            rows = np.array(self._postings[token], dtype=np.int64)
+            if len(rows) > IMPACT_POSTINGS:
+                rows = rows[np.lexsort((rows, -self._prior[rows]))[:IMPACT_POSTINGS]]
+            self._impact[token] = rows
+        return rows
+
+    def search(self, context: Mapping[str, float], limit: int = 15) -> List[int]:
+        """id паттернов, лучше всего совпадающих с контекстом
+
+        context — веса токенов недавних сообщений. Оценка паттерна:
+        сумма вес·idf² по общим токенам, деленная на корень из числа его
+        токенов и умноженная на log(1 + frequency).
+        """
+        import numpy as np
+
+        with self._lock:
+            terms = [(token, weight) for token, weight in context.items() if token in self._tokens]
+            if not terms or limit <= 0:
+                return []
+
+            documents = len(self.patterns)
+            columns = np.fromiter((self._tokens[token] for token, _ in terms), dtype=np.int64, count=len(terms))
+            weights = np.fromiter((weight for _, weight in terms), dtype=np.float64, count=len(terms))
+
+            # Слишком частые токены почти не влияют на оценку, но дают больше всего работы
+            df = self._df[columns]
+            common = df > max(COMMON_TOKEN_MIN_DF, COMMON_TOKEN_SHARE * documents)
+            if common.all():
+                common[np.argmin(df)] = False
+            keep = np.flatnonzero(~common)
+            idf = np.log((documents + 1) / (df[keep] + 1)) + 1.0
+
+            # Вес токена по столбцу; последний элемент — нулевой вес для столбца -1
+            query = np.zeros(len(self._tokens) + 1, dtype=np.float64)
+            query[columns[keep]] = weights[keep] * idf ** 2
+
+            # Паттерн с одним токеном контекста за пределами IMPACT_POSTINGS лучших
+            # строк этого токена в выдачу не попадет; с двумя — берется из пересечений
+            candidates = [self._impact_rows(terms[i][0]) for i in keep]
+            frequent = sorted(column for column, count in zip(columns[keep].tolist(), df[keep].tolist())
+                              if count > IMPACT_POSTINGS)
+            for i, first in enumerate(frequent):
+                for second in frequent[i + 1:]:
+                    shared = self._pairs.get((first, second))
+                    if shared:
+                        candidates.append(np.array(shared, dtype=np.int64))
+            rows = np.concatenate(candidates)
+            if not len(rows):
+                return []
+            scores = query[self._row_tokens[rows]].sum(axis=1) * self._prior[rows]
+
+            # Строка встречается в rows не больше MAX_PATTERN_TOKENS раз в лучших строках
+            # токенов и трех раз в пересечениях
+            count = min(len(rows), limit * (MAX_PATTERN_TOKENS + 3))
+            if len(rows) > count:
+                top = np.argpartition(-scores, count - 1)[:count]
+                rows, scores = rows[top], scores[top]
+            order = np.lexsort((rows, -scores))
+            result = []
+            for row in rows[order].tolist():
+                if row not in result:
+                    result.append(row)
+                    if len(result) == limit:
+                        break
+            return self._ids[result].tolist()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+class PatternIndex:
+    """Индексы паттернов по чатам: строятся лениво из БД и обновляются при обучении"""
+
+    def __init__(self, max_chats: int = None):
+        self._chats = LRUCache(maxsize=max_chats or Config.PATTERN_INDEX_MAX_CHATS)
+        # Загрузку чата ждут только запросы к тому же чату
+        self._build_locks = KeyedLocks()
+
+    def get(self, chat_id: int, db: Session) -> ChatPatternIndex:
+        """Индекс чата; при первом обращении загружается одним запросом"""
+        index = self._chats.get(chat_id)
+        if index is not None:
+            return index
+
+        with self._build_locks.hold(chat_id):
+            index = self._chats.get(chat_id)
+            if index is not None:
+                return index
+            index = ChatPatternIndex()
+            rows = db.query(
+                Pattern.id, Pattern.pattern_text, Pattern.pattern_type, Pattern.frequency
+            ).filter(
+                Pattern.chat_id == chat_id,
+                Pattern.pattern_type.in_(INDEXED_TYPES)
+            ).all()
+            for pattern_id, pattern_text, pattern_type, frequency in rows:
+                index.add(pattern_id, pattern_text, pattern_type, frequency or 0)
+            self._chats.set(chat_id, index)
+        return index
+
+    def apply(self, rows: Iterable[PatternRow]):
+        """Инкрементальное обновление уже загруженных индексов после upsert
+
+        Строка с frequency <= 0 — удаленный паттерн (так передает уплотнение).
+        """
+        for pattern_id, chat_id, pattern_type, pattern_text, frequency in rows:
+            if pattern_type not in INDEXED_TYPES:
+                continue
+            index = self._chats.get(chat_id)
+            if index is None:
+                continue
+            if frequency <= 0:
+                index.remove(pattern_id)
+            else:
+                index.add(pattern_id, pattern_text, pattern_type, frequency)
+
+    def search(self, chat_id: int, context: Mapping[str, float], db: Session, limit: int = 15) -> List[Pattern]:
+        """Паттерны чата, ранжированные по контексту, как несвязанные с сессией объекты"""
+        index = self.get(chat_id, db)
+        patterns = []
+        for pattern_id in index.search(context, limit):
+            pattern_text, pattern_type, frequency = index.patterns[pattern_id]
+            patterns.append(Pattern(id=pattern_id, chat_id=chat_id, pattern_text=pattern_text,
+                                    pattern_type=pattern_type, frequency=frequency))
+        return patterns
+
+    def invalidate(self, chat_id: int):
+        self._chats.pop(chat_id)
+
+    def clear(self):
+        self._chats.clear()
+
+# Общий на процесс индекс
+pattern_index = PatternIndex()
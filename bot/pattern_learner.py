@@ -1,25 +1,32 @@
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 from collections import Counter, defaultdict
 from datetime import datetime
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Tuple
 from sqlalchemy.orm import Session
 
 from bot.database import Pattern, Message
+from bot.language_model import language_model
+from bot.media_index import media_context, media_index
+from bot.metrics import span
+from bot.ngram_aggregator import NgramAggregator
+from bot.pattern_index import pattern_index
+from bot.style_profile import style_profiles
+from bot.tokenizer import STOPWORDS, extract_ngrams
 from bot.utils import clean_text
 
+def repeated_counts(items: List[str], min_count: int) -> Counter:
+    """Частоты элементов, встретившихся в сообщении не меньше min_count раз"""
+    counter = Counter(items)
+    return Counter({item: count for item, count in counter.items() if count >= min_count})
+
 class PatternLearner:
-    def __init__(self):
-        try:
-            nltk.download('punkt', quiet=True)
-            nltk.download('stopwords', quiet=True)
-        except:
-            pass
-        
-        self.stop_words = set(stopwords.words('russian') + stopwords.words('english'))
+    # Сохраняем только паттерны, повторившиеся в сообщении
+    MIN_COUNT = 2
+    
+    def __init__(self, aggregator: NgramAggregator = None):
+        self.stop_words = STOPWORDS
         self.learned_patterns = defaultdict(list)
+        self.aggregator = aggregator or NgramAggregator()
         
     def analyze_message(self, text: str, chat_id: int, user_id: int, db: Session):
         """Анализ сообщения для извлечения паттернов"""
@@ -28,17 +35,53 @@ class PatternLearner:
         
         cleaned = clean_text(text)
         
-        # Токенизация
-        tokens = word_tokenize(cleaned, language='russian')
+        # Токенизация и извлечение n-грамм
+        self._learn(cleaned, extract_ngrams(cleaned), chat_id, user_id, db)
         
-        # Удаление стоп-слов
-        filtered_tokens = [word.lower() for word in tokens 
-                          if word.lower() not in self.stop_words and len(word) > 2]
+        # Периодическая выгрузка накопленных частот одним upsert
+        if self.aggregator.should_flush():
+            self.flush(db)
+    
+    def analyze_messages(self, messages: Iterable[Tuple[str, int, int]], db: Session):
+        """Пакетный анализ: messages — пары (text, chat_id, user_id)"""
+        with span('tokenize'):
+            messages = [(clean_text(text), chat_id, user_id)
+                        for text, chat_id, user_id in messages if text]
+            grams = [extract_ngrams(cleaned) for cleaned, _, _ in messages]
+        with span('aggregate'):
+            for (cleaned, chat_id, user_id), message_grams in zip(messages, grams):
+                self._learn(cleaned, message_grams, chat_id, user_id, db)
+        with span('style'):
+            # Профили стиля авторов: частые слова и фразы — все n-граммы сообщения
+            style_profiles.observe_many(db, [
+                (cleaned, user_id, unigrams, bigrams + trigrams)
+                for (cleaned, _, user_id), (unigrams, bigrams, trigrams) in zip(messages, grams)
+            ])
+        
+        if self.aggregator.should_flush():
+            self.flush(db)
+        elif style_profiles.should_flush():
+            self.flush_style_profiles(db)
+    
+    def analyze_media(self, media: Iterable[Tuple[str, str, str, int, int]], db: Session):
+        """Стикеры и GIF: media — (media_type, media_id, file_id, chat_id, user_id)"""
+        media = list(media)
+        if not media:
+            return
+        by_chat = defaultdict(list)
+        for media_type, media_id, file_id, chat_id, user_id in media:
+            # Частота по file_unique_id, в context — последний file_id для отправки
+            self.aggregator.add(chat_id, media_type, Counter({media_id: 1}), user_id,
+                                contexts={media_id: media_context(file_id)})
+            by_chat[chat_id].append((media_type, media_id, file_id))
+        for chat_id, items in by_chat.items():
+            media_index.remember(chat_id, items)
         
-        # Извлечение n-грамм
-        unigrams = filtered_tokens
-        bigrams = [' '.join(filtered_tokens[i:i+2]) for i in range(len(filtered_tokens)-1)]
-        trigrams = [' '.join(filtered_tokens[i:i+3]) for i in range(len(filtered_tokens)-2)]
+        if self.aggregator.should_flush():
+            self.flush(db)
+    
+    def _learn(self, cleaned: str, grams, chat_id: int, user_id: int, db: Session):
+        unigrams, bigrams, trigrams = grams
         
         # Сохранение паттернов
         self._save_patterns(unigrams, 'word', chat_id, user_id, db)
@@ -51,32 +94,28 @@ class PatternLearner:
     
     def _save_patterns(self, items: List[str], pattern_type: str, 
                        chat_id: int, user_id: int, db: Session):
-        """Сохранение паттернов в базу"""
-        counter = Counter(items)
-        
-        for item, count in counter.items():
-            if count >= 2:  # Сохраняем только повторяющиеся паттерны
-                pattern = db.query(Pattern).filter(
-                    Pattern.chat_id == chat_id,
-                    Pattern.pattern_text == item,
-                    Pattern.pattern_type == pattern_type
-                ).first()
-                
-                if pattern:
-                    pattern.frequency += count
-                    pattern.last_used = datetime.now()
-                else:
-                    pattern = Pattern(
-                        chat_id=chat_id,
-                        user_id=user_id,
-                        pattern_text=item,
-                        pattern_type=pattern_type,
-                        frequency=count,
-                        last_used=datetime.now()
-                    )
-                    db.add(pattern)
-        
-        db.commit()
+        """Накопление паттернов в памяти до следующей выгрузки"""
+        repeated = repeated_counts(items, self.MIN_COUNT)
+        if repeated:
+            self.aggregator.add(chat_id, pattern_type, repeated, user_id)
+    
+    def flush(self, db: Session) -> int:
+        """Выгрузка накопленных паттернов в базу"""
+        with span('pattern_flush'):
+            rows = self.aggregator.flush(db)
+        # Итоговые частоты сразу попадают в индекс и модели для ResponseGenerator
+        pattern_index.apply(rows)
+        language_model.apply(rows)
+        media_index.apply(rows)
+        self.flush_style_profiles(db)
+        return len(rows)
+    
+    def flush_style_profiles(self, db: Session) -> int:
+        """Запись измененных профилей стиля в users"""
+        with span('style_flush'):
+            saved = style_profiles.flush(db)
+            db.commit()
+        return saved
     
     def _check_for_phrases(self, text: str, chat_id: int, user_id: int, db: Session):
         """Проверка на часто повторяющиеся фразы"""
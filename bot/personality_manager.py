@@ -4,6 +4,7 @@ import json
 from sqlalchemy.orm import Session
 
 from bot.database import Chat, Statistic
+from bot.repository import repository
 
 class PersonalityManager:
     def __init__(self):
@@ -59,7 +60,5 @@ class PersonalityManager:
         """Сброс личности"""
         chat = db.query(Chat).filter(Chat.id == chat_id).first()
         if chat:
-            chat.personality_level = 1
-            chat.learning_mode = True
-            chat.learning_end_time = datetime.now() + timedelta(hours=72)
-            db.commit()
\ No newline at end of file
+            # Паттерны чата удаляются вместе со сбросом режима
+            repository.reset_chat(db, {'id': chat.id, 'chat_id': chat.chat_id})
\ No newline at end of file
@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Optional
+
+from bot.cache import LRUCache
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Срок хранения дневного счетчика в Redis: с запасом на смену суток
+DAILY_KEY_TTL = 2 * 24 * 3600
+
+def _day(now: float) -> str:
+    """Сутки по UTC — граница дневного лимита одинакова во всех процессах"""
+    return datetime.fromtimestamp(now, timezone.utc).strftime('%Y%m%d')
+
+class RateLimiter(ABC):
+    """Решение «можно ли боту ответить в чат» с учетом частоты и дневного лимита
+
+    Интервал между ответами задается ведром токенов: одна попытка —
+    один токен, токены восполняются со скоростью 1 / interval, в ведре
+    помещается burst токенов. Дневной лимит считает успешные попытки
+    за сутки по UTC (0 — без лимита).
+    """
+
+    def __init__(self, interval: float = None, burst: int = None, daily_limit: int = None):
+        self.interval = interval if interval is not None else Config.RATE_LIMIT_SECONDS
+        self.burst = burst or Config.RATE_LIMIT_BURST
+        self.daily_limit = daily_limit if daily_limit is not None else Config.MAX_MESSAGES_PER_DAY
+
+    @property
+    def rate(self) -> float:
+        """Токенов в секунду; -1 — частота не ограничена (interval = 0)"""
+        return 1.0 / self.interval if self.interval > 0 else -1.0
+
+    @abstractmethod
+    def try_acquire(self, key: str, now: float = None) -> bool:
+        """Забрать право на ответ; False — лимит исчерпан"""
+
+    @abstractmethod
+    def reset(self, key: str):
+        """Сброс ведра и дневного счетчика ключа"""
+
+class LocalRateLimiter(RateLimiter):
+    """Ведро токенов в памяти процесса (один воркер или тесты)
+
+    Хранится состояние не больше max_keys ключей: при переполнении
+    вытесняется ключ, к которому дольше всех не обращались, и его
+    лимит начинается заново.
+    """
+
+    def __init__(self, *args, max_keys: int = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # key -> [токены, время, сутки, ответов за сутки]
+        self._state = LRUCache(maxsize=max_keys or Config.RATE_LIMIT_MAX_KEYS)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        day = _day(now)
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = [float(self.burst), now, day, 0]
+                self._state.set(key, state)
+            if state[2] != day:
+                state[2], state[3] = day, 0
+            if self.daily_limit and state[3] >= self.daily_limit:
+                return False
+
+            if self.interval > 0:
+                tokens = min(self.burst, state[0] + max(0.0, now - state[1]) * self.rate)
+            else:
+                tokens = float(self.burst)
+            state[1] = now
+            if tokens < 1:
+                state[0] = tokens
+                return False
+            state[0] = tokens - 1
+            state[3] += 1
+            return True
+
+    def reset(self, key: str):
+        with self._lock:
+            self._state.pop(key, None)
+
+# Проверка и списание атомарно на стороне Redis: общий лимит для всех воркеров и реплик
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local daily_limit = tonumber(ARGV[4])
+local bucket_ttl = tonumber(ARGV[5])
+
+if daily_limit > 0 then
+    local used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if used >= daily_limit then
+        return 0
+    end
+end
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+if rate < 0 then
+    tokens = burst
+else
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+end
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], bucket_ttl)
+
+if allowed == 1 and daily_limit > 0 then
+    redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], tonumber(ARGV[6]))
+end
+return allowed
+"""
+
+class RedisRateLimiter(RateLimiter):
+    """Общий для процессов лимит в Redis (скрипт Lua)
+
+    Подходит любой клиент с API redis-py, например fakeredis.FakeRedis в
+    тестах. Если Redis недоступен, решение принимает локальное ведро
+    процесса — бот продолжает работать, но лимит становится по-процессным.
+    """
+
+    def __init__(self, client=None, prefix: str = 'chat_clone:rate', **kwargs):
+        super().__init__(**kwargs)
+        # Недоступность Redis логируется один раз, до восстановления
+        self._unavailable = False
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(Config.REDIS_URL, socket_timeout=1.0,
+                                          socket_connect_timeout=1.0)
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+        self._fallback = LocalRateLimiter(interval=self.interval, burst=self.burst,
+                                          daily_limit=self.daily_limit)
+
+    def _keys(self, key: str, now: float):
+        return [f"{self.prefix}:bucket:{key}", f"{self.prefix}:day:{key}:{_day(now)}"]
+
+    def try_acquire(self, key: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        # Ведро живет, пока не восполнится полностью
+        bucket_ttl = max(1, int(self.burst * self.interval) + 1)
+        try:
+            allowed = self._script(
+                keys=self._keys(key, now),
+                args=[now, self.rate, self.burst, self.daily_limit, bucket_ttl, DAILY_KEY_TTL],
+            )
+        except Exception as e:
+            if not self._unavailable:
+                self._unavailable = True
+                logger.warning(f"⚠️ Redis недоступен, локальный лимит: {e}")
+            return self._fallback.try_acquire(key, now)
+        if self._unavailable:
+            self._unavailable = False
+            logger.info("🔄 Redis снова доступен, общий лимит")
+        return bool(allowed)
+
+    def reset(self, key: str):
+        now = time.time()
+        try:
+            self.client.delete(*self._keys(key, now))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сбросить лимит в Redis: {e}")
+        self._fallback.reset(key)
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Лимитер процесса из RATE_LIMIT_BACKEND (local или redis)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                if Config.RATE_LIMIT_BACKEND == 'redis':
+                    _rate_limiter = RedisRateLimiter()
+                else:
+                    _rate_limiter = LocalRateLimiter()
+    return _rate_limiter
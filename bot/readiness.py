@@ -0,0 +1,94 @@
+"""Готовность процесса бота вместо фиксированной паузы на старте
+
+mark_ready() вызывается, когда бот начинает принимать обновления. Сигнал
+уходит туда, где его ждут: /ready HTTP-сервера метрик воркера (503 до
+готовности), файл READY_FILE для exec-проверок контейнера и sd_notify
+(READY=1), если процесс запущен systemd с Type=notify.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Отсчет от импорта модуля: его первым делом импортирует точка входа
+_started = time.monotonic()
+_ready = threading.Event()
+_startup_seconds = None
+
+def startup_seconds() -> float:
+    """Время от старта до готовности (до нее — сколько прошло)"""
+    if _startup_seconds is not None:
+        return _startup_seconds
+    return time.monotonic() - _started
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def wait_ready(timeout: float = None) -> bool:
+    return _ready.wait(timeout)
+
+def _sd_notify(state: str):
+    """Сообщение менеджеру сервисов по протоколу sd_notify (без libsystemd)"""
+    address = os.getenv('NOTIFY_SOCKET')
+    if not address:
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), address)
+    except OSError as e:
+        logger.warning(f"⚠️ sd_notify не отправлен: {e}")
+
+def mark_ready():
+    """Процесс готов принимать обновления"""
+    global _startup_seconds
+    if _ready.is_set():
+        return
+    _startup_seconds = time.monotonic() - _started
+    _ready.set()
+    if Config.READY_FILE:
+        try:
+            with open(Config.READY_FILE, 'w') as f:
+                f.write(f"{os.getpid()}\n")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось записать {Config.READY_FILE}: {e}")
+    _sd_notify('READY=1')
+    logger.info(f"🟢 Бот готов за {_startup_seconds:.2f} с")
+
+def mark_stopping():
+    """Остановка: проверки готовности снова отвечают «не готов»"""
+    _ready.clear()
+    if Config.READY_FILE:
+        try:
+            os.remove(Config.READY_FILE)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось удалить {Config.READY_FILE}: {e}")
+    _sd_notify('STOPPING=1')
+
+def warm_up(*modules: str):
+    """Фоновая загрузка тяжелых модулей после готовности
+
+    Первому сообщению не придется ждать их импорта, а старт не ждет их вовсе.
+    """
+    def load():
+        import importlib
+
+        started = time.monotonic()
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"⚠️ Прогрев: модуль {name} недоступен: {e}")
+        logger.info(f"🔥 Прогрев модулей за {time.monotonic() - started:.2f} с: {', '.join(modules)}")
+
+    thread = threading.Thread(target=load, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,378 @@
+"""Пересборка таблицы patterns из истории сообщений
+
+Запуск: python -m bot.relearn [--workers 4] [--chunk-size 5000] [--min-count 2] [--dry-run]
+
+Сообщения читаются серверным курсором в порядке (chat_id, id) и режутся на
+пачки по чатам. Пачки обрабатываются в пуле процессов той же логикой, что и
+PatternLearner, частичные счетчики сливаются по чатам, и каждый чат, как
+только все его пачки посчитаны, сразу выгружается через COPY во временную
+таблицу — в памяти держатся только чаты «в работе». В конце временная
+таблица получает индексы таблицы patterns и подменяет ее в одной транзакции.
+
+Паттерны других типов (не word/bigram/trigram) переносятся без изменений.
+Сообщения, которые боты записали во время пересборки (id больше
+прочитанного), досчитываются под блокировкой patterns перед подменой.
+Идентификаторы паттернов меняются, поэтому в той же транзакции уходит
+сигнал bot.invalidation: работающие боты сбрасывают индексы паттернов.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import func, select
+
+from bot.database import Message, engine
+from bot.invalidation import PATTERNS_REBUILT, notify
+from bot.pattern_learner import PatternLearner, repeated_counts
+from bot.tokenizer import extract_ngrams
+from bot.utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+# Типы паттернов, которые пересчитываются из сообщений
+LEARNED_TYPES = ('word', 'bigram', 'trigram')
+
+STAGING_TABLE = 'patterns_staging'
+COPY_COLUMNS = ('chat_id', 'user_id', 'pattern_text', 'pattern_type', 'frequency', 'last_used', 'created_at')
+COPY_BUFFER_ROWS = 50000
+
+# Пачка: [(chat_id, [(text, user_id), ...]), ...] — сообщения чатов по порядку id
+Chunk = List[Tuple[int, List[Tuple[str, int]]]]
+# Счетчики чата: (pattern_type, pattern_text) -> [frequency, номер пачки, первый user_id]
+ChatCounts = Dict[Tuple[str, str], list]
+
+def _init_worker():
+    # Соединения пула, унаследованные от родителя через fork, не трогаем
+    engine.dispose(close=False)
+
+def learn_chunk(seq: int, chunk: Chunk, min_count: int) -> Tuple[int, Dict[int, ChatCounts]]:
+    """Счетчики паттернов пачки (выполняется в процессе пула)"""
+    result = {}
+    for chat_id, rows in chunk:
+        grams = [extract_ngrams(clean_text(text)) for text, _ in rows]
+        counts: ChatCounts = {}
+        for (_, user_id), message_grams in zip(rows, grams):
+            for pattern_type, items in zip(LEARNED_TYPES, message_grams):
+                for item, count in repeated_counts(items, min_count).items():
+                    entry = counts.get((pattern_type, item))
+                    if entry is None:
+                        counts[(pattern_type, item)] = [count, seq, user_id]
+                    else:
+                        entry[0] += count
+                        if entry[2] is None:
+                            entry[2] = user_id
+        result[chat_id] = counts
+    return seq, result
+
+def stream_chunks(conn, max_id: int, chunk_size: int) -> Iterator[Tuple[Chunk, int]]:
+    """Пачки сообщений серверным курсором; вместе с пачкой — chat_id последнего чата"""
+    query = (
+        select(Message.chat_id, Message.user_id, Message.text)
+        .where(Message.chat_id.isnot(None), Message.text.isnot(None), Message.id <= max_id)
+        .order_by(Message.chat_id, Message.id)
+    )
+    result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(query)
+
+    chunk: Chunk = []
+    size = 0
+    for chat_id, user_id, text in result:
+        if not chunk or chunk[-1][0] != chat_id:
+            chunk.append((chat_id, []))
+        chunk[-1][1].append((text, user_id))
+        size += 1
+        if size >= chunk_size:
+            yield chunk, chat_id
+            chunk, size = [], 0
+    if chunk:
+        yield chunk, chunk[-1][0]
+
+class CopyWriter:
+    """Буферизованная выгрузка строк через COPY FROM STDIN"""
+
+    def __init__(self, raw_conn, table: str, columns=COPY_COLUMNS, buffer_rows: int = COPY_BUFFER_ROWS):
+        self.raw_conn = raw_conn
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        self.buffer_rows = buffer_rows
+        self.rows = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = 0
+
+    def write(self, rows):
+        for row in rows:
+            self._writer.writerow(row)
+            self._pending += 1
+            if self._pending >= self.buffer_rows:
+                self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._buffer.seek(0)
+        with self.raw_conn.cursor() as cur:
+            cur.copy_expert(self.sql, self._buffer)
+        self.rows += self._pending
+        self._pending = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+class PatternRebuild:
+    """Слияние частичных счетчиков по чатам и выгрузка готовых чатов"""
+
+    def __init__(self, writer: CopyWriter):
+        self.writer = writer
+        self.counts: Dict[int, ChatCounts] = {}
+        self.outstanding: Dict[int, int] = {}  # chat_id -> число непосчитанных пачек
+        self.streaming_chat = None  # чат, сообщения которого еще читаются
+        self.done_streaming = False
+        self.chats = 0
+        self.now = datetime.now()
+
+    def submitted(self, chunk: Chunk, last_chat_id: int):
+        for chat_id, _ in chunk:
+            self.outstanding[chat_id] = self.outstanding.get(chat_id, 0) + 1
+        self.streaming_chat = last_chat_id
+
+    def merge(self, result: Dict[int, ChatCounts]):
+        for chat_id, partial in result.items():
+            counts = self.counts.get(chat_id)
+            if counts is None:
+                self.counts[chat_id] = partial
+            else:
+                for key, (frequency, seq, user_id) in partial.items():
+                    entry = counts.get(key)
+                    if entry is None:
+                        counts[key] = [frequency, seq, user_id]
+                        continue
+                    entry[0] += frequency
+                    # Автор паттерна — из самой ранней пачки
+                    if user_id is not None and (entry[2] is None or seq < entry[1]):
+                        entry[1], entry[2] = seq, user_id
+            self.outstanding[chat_id] -= 1
+        self.spill()
+
+    def spill(self):
+        """Выгрузка чатов, все пачки которых прочитаны и посчитаны"""
+        for chat_id in list(self.outstanding):
+            if self.outstanding[chat_id]:
+                continue
+            if not self.done_streaming and chat_id == self.streaming_chat:
+                continue
+            del self.outstanding[chat_id]
+            counts = self.counts.pop(chat_id, {})
+            self.writer.write(
+                (chat_id, user_id, pattern_text, pattern_type, frequency, self.now, self.now)
+                for (pattern_type, pattern_text), (frequency, _, user_id) in counts.items()
+            )
+            self.chats += 1
+
+def _patterns_schema(cur):
+    """Индексы, внешние ключи и последовательность id таблицы patterns"""
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid), x.indisprimary
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = 'patterns'::regclass
+    """)
+    indexes = cur.fetchall()
+    cur.execute("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = 'patterns'::regclass AND contype = 'f'
+    """)
+    foreign_keys = cur.fetchall()
+    cur.execute("SELECT pg_get_serial_sequence('patterns', 'id')")
+    sequence = cur.fetchone()[0]
+    return indexes, foreign_keys, sequence
+
+def _staging_name(name: str) -> str:
+    return f"{name[:55]}_rebuild"
+
+def _build_indexes(raw_conn, indexes):
+    """Индексы patterns на временной таблице (после загрузки — так быстрее)"""
+    with raw_conn.cursor() as cur:
+        for name, definition, is_primary in indexes:
+            staging_name = _staging_name(name)
+            definition = re.sub(
+                rf'INDEX {re.escape(name)} ON ((?:\S+\.)?)patterns ',
+                lambda m: f'INDEX {staging_name} ON {m.group(1)}{STAGING_TABLE} ',
+                definition, count=1)
+            cur.execute(definition)
+            if is_primary:
+                cur.execute(f"ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {staging_name} "
+                            f"PRIMARY KEY USING INDEX {staging_name}")
+        cur.execute(f"ANALYZE {STAGING_TABLE}")
+    raw_conn.commit()
+
+def _merge_tail(cur, max_id: int, min_count: int, now: datetime) -> int:
+    """Досчет сообщений с id > max_id во временную таблицу; возвращает их число
+
+    Выполняется под блокировкой patterns: боты в это время не выгружают
+    паттерны, а их прежние выгрузки за эти сообщения остались в старой таблице.
+    Приросты, которые боты накопили, но еще не выгрузили (не дольше
+    PATTERN_FLUSH_INTERVAL), после подмены добавятся к досчитанным.
+    """
+    from psycopg2.extras import execute_values
+
+    cur.execute(f"""
+        SELECT chat_id, user_id, text FROM {Message.__tablename__}
+        WHERE id > %s AND chat_id IS NOT NULL AND text IS NOT NULL
+        ORDER BY chat_id, id
+    """, (max_id,))
+    chunk: Chunk = []
+    for chat_id, user_id, text in cur.fetchall():
+        if not chunk or chunk[-1][0] != chat_id:
+            chunk.append((chat_id, []))
+        chunk[-1][1].append((text, user_id))
+    if not chunk:
+        return 0
+
+    _, result = learn_chunk(0, chunk, min_count)
+    rows = [
+        (chat_id, user_id, pattern_text, pattern_type, frequency, now, now)
+        for chat_id, counts in result.items()
+        for (pattern_type, pattern_text), (frequency, _, user_id) in counts.items()
+    ]
+    execute_values(cur, f"""
+        INSERT INTO {STAGING_TABLE} ({', '.join(COPY_COLUMNS)}) VALUES %s
+        ON CONFLICT (chat_id, pattern_type, pattern_text) DO UPDATE SET
+            frequency = {STAGING_TABLE}.frequency + EXCLUDED.frequency,
+            last_used = EXCLUDED.last_used
+    """, rows)
+    return sum(len(messages) for _, messages in chunk)
+
+def _swap(raw_conn, indexes, foreign_keys, sequence, max_id: int, min_count: int, now: datetime) -> int:
+    """Атомарная подмена patterns временной таблицей; возвращает число досчитанных сообщений"""
+    placeholders = ', '.join(['%s'] * len(LEARNED_TYPES))
+    with raw_conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '30s'")
+        cur.execute("LOCK TABLE patterns IN ACCESS EXCLUSIVE MODE")
+        late_messages = _merge_tail(cur, max_id, min_count, now)
+        # Паттерны, которые не выводятся из текста сообщений, переносятся как есть
+        cur.execute(f"""
+            INSERT INTO {STAGING_TABLE}
+            SELECT * FROM patterns
+            WHERE pattern_type IS NULL OR pattern_type NOT IN ({placeholders})
+        """, LEARNED_TYPES)
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {STAGING_TABLE}.id")
+        cur.execute("DROP TABLE patterns")
+        cur.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO patterns")
+        for name, _, is_primary in indexes:
+            if is_primary:
+                cur.execute(f"ALTER TABLE patterns RENAME CONSTRAINT {_staging_name(name)} TO {name}")
+            else:
+                cur.execute(f"ALTER INDEX {_staging_name(name)} RENAME TO {name}")
+        for name, definition in foreign_keys:
+            cur.execute(f"ALTER TABLE patterns ADD CONSTRAINT {name} {definition} NOT VALID")
+        notify(cur, PATTERNS_REBUILT)
+    raw_conn.commit()
+
+    # Проверка внешних ключей не блокирует запись в таблицу
+    with raw_conn.cursor() as cur:
+        for name, _ in foreign_keys:
+            cur.execute(f"ALTER TABLE patterns VALIDATE CONSTRAINT {name}")
+    raw_conn.commit()
+    return late_messages
+
+def relearn(workers: int = None, chunk_size: int = 5000, min_count: int = None,
+            dry_run: bool = False) -> dict:
+    """Пересчет паттернов по всем сообщениям; возвращает сводку"""
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError("Пересборка паттернов поддерживается только для PostgreSQL")
+
+    workers = workers or os.cpu_count() or 1
+    min_count = min_count or PatternLearner.MIN_COUNT
+    started = time.perf_counter()
+
+    with engine.connect() as conn:
+        max_id = conn.execute(select(func.max(Message.id))).scalar() or 0
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            cur.execute(f"CREATE TABLE {STAGING_TABLE} (LIKE patterns INCLUDING DEFAULTS)")
+            indexes, foreign_keys, sequence = _patterns_schema(cur)
+        raw_conn.commit()
+
+        writer = CopyWriter(raw_conn, STAGING_TABLE)
+        rebuild = PatternRebuild(writer)
+        messages = 0
+        late_messages = 0
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                _, result = future.result()
+                rebuild.merge(result)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool, \
+                engine.connect() as conn:
+            for seq, (chunk, last_chat_id) in enumerate(stream_chunks(conn, max_id, chunk_size)):
+                rebuild.submitted(chunk, last_chat_id)
+                pending.add(pool.submit(learn_chunk, seq, chunk, min_count))
+                messages += sum(len(rows) for _, rows in chunk)
+                # Не больше двух пачек на процесс: память ограничена
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if seq and seq % 100 == 0:
+                    logger.info(f"Прочитано сообщений: {messages}, выгружено паттернов: {writer.rows}")
+
+            rebuild.done_streaming = True
+            done, pending = wait(pending)
+            collect(done)
+            rebuild.spill()
+
+        writer.flush()
+        raw_conn.commit()
+
+        if dry_run:
+            with raw_conn.cursor() as cur:
+                cur.execute(f"DROP TABLE {STAGING_TABLE}")
+            raw_conn.commit()
+        else:
+            _build_indexes(raw_conn, indexes)
+            late_messages = _swap(raw_conn, indexes, foreign_keys, sequence, max_id, min_count, rebuild.now)
+    except Exception:
+        raw_conn.rollback()
+        with raw_conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        raw_conn.commit()
+        raise
+    finally:
+        raw_conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'messages': messages,
+        'late_messages': late_messages,
+        'chats': rebuild.chats,
+        'patterns': writer.rows,
+        'seconds': round(elapsed, 2),
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed else 0.0,
+        'swapped': not dry_run,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=None, help='число процессов (по умолчанию — число CPU)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='сообщений в пачке')
+    parser.add_argument('--min-count', type=int, default=None,
+                        help=f'минимум повторов в сообщении (по умолчанию {PatternLearner.MIN_COUNT})')
+    parser.add_argument('--dry-run', action='store_true', help='посчитать без подмены таблицы')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    summary = relearn(args.workers, args.chunk_size, args.min_count, args.dry_run)
+    logger.info(f"✅ Пересборка паттернов завершена: {summary}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, desc, func, insert, select, tuple_, update
+
+from bot.cache import LRUCache, chat_cache, user_cache
+from bot.config import Config
+from bot.database import Chat, Message, Pattern, Statistic, User
+from bot.events import messages_event, publish
+
+logger = logging.getLogger(__name__)
+
+# Ограничение размера одного INSERT, чтобы не упираться в лимиты драйвера
+UPSERT_CHUNK_SIZE = 1000
+
+def dialect_insert(dialect_name: str):
+    """insert() с поддержкой ON CONFLICT для текущей СУБД"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert не поддерживается для {dialect_name}")
+    return insert
+
+def _dialect_name(db) -> str:
+    """Имя СУБД для Session и Connection"""
+    bind = db.get_bind() if hasattr(db, 'get_bind') else db
+    return bind.dialect.name
+
+def _connection(db):
+    """Connection текущей транзакции (для NOTIFY в той же транзакции)"""
+    return db.connection() if hasattr(db, 'connection') else db
+
+# Запросы горячего пути собираются один раз: SQLAlchemy кэширует их компиляцию
+# по ключу запроса, и на каждый вызов остается только подстановка параметров
+_CHAT_BY_TELEGRAM_ID = select(Chat.__table__).where(Chat.chat_id == bindparam('chat_id'))
+_CHATS_BY_TELEGRAM_ID = select(Chat.__table__).where(Chat.chat_id.in_(bindparam('chat_ids', expanding=True)))
+# Снимки пользователей без профиля стиля: он кэшируется отдельно (bot.style_profile)
+_USER_COLUMNS = [column for column in User.__table__.c if column.name != 'style_profile']
+_USER_BY_TELEGRAM_ID = select(*_USER_COLUMNS).where(User.user_id == bindparam('user_id'))
+_USERS_BY_TELEGRAM_ID = select(*_USER_COLUMNS).where(User.user_id.in_(bindparam('user_ids', expanding=True)))
+_STYLE_PROFILES = select(User.id, User.style_profile).where(User.id.in_(bindparam('pks', expanding=True)))
+_SAVE_STYLE_PROFILE = update(User.__table__).where(User.__table__.c.id == bindparam('pk')).values(
+    style_profile=bindparam('profile'),
+)
+_INSERT_MESSAGES = insert(Message.__table__)
+_BUMP_USERS = update(User.__table__).where(User.__table__.c.id == bindparam('pk')).values(
+    message_count=func.coalesce(User.__table__.c.message_count, 0) + bindparam('delta'),
+    last_seen=bindparam('seen'),
+)
+_RECENT_CONTEXT = select(Message.text).where(
+    Message.chat_id == bindparam('chat_id'),
+    Message.text.isnot(None),
+).order_by(desc(Message.timestamp), desc(Message.id)).limit(bindparam('limit'))
+_END_LEARNING = update(Chat.__table__).where(Chat.__table__.c.id == bindparam('pk')).values(
+    learning_mode=False, personality_level=2,
+)
+_MESSAGE_TOTAL = select(func.coalesce(func.sum(Statistic.total_messages), 0))
+
+PatternRow = Tuple[int, int, str, str, int]
+
+def _snapshot(row) -> Dict[str, Any]:
+    return dict(row._mapping)
+
+class Repository:
+    """Единый слой доступа к данным для бота, воркера и веб-панели
+
+    Методы принимают Session или Connection (db) и не коммитят сами, кроме
+    отмеченных явно: транзакцией управляет вызывающий. Строки chats и users
+    кэшируются как словари колонок (снимки), поэтому обработка пачки
+    сообщений обходится одним SELECT на новые чаты и пользователей.
+    """
+
+    def __init__(self, chats: LRUCache = chat_cache, users: LRUCache = user_cache):
+        self.chats = chats
+        self.users = users
+
+    # Чаты и пользователи
+
+    def get_chat(self, db, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Снимок чата по Telegram ID (None — чат еще не записан)"""
+        snapshot = self.chats.get(chat_id)
+        if snapshot is None:
+            row = db.execute(_CHAT_BY_TELEGRAM_ID, {'chat_id': chat_id}).first()
+            if row is None:
+                return None
+            snapshot = _snapshot(row)
+            self.chats.set(chat_id, snapshot)
+        return snapshot
+
+    def ensure_chats(self, db, titles: Dict[str, Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """Снимки чатов по Telegram ID; отсутствующие создаются одним INSERT"""
+        result, missing = {}, []
+        for chat_id in titles:
+            snapshot = self.chats.get(chat_id)
+            if snapshot is None:
+                missing.append(chat_id)
+            else:
+                result[chat_id] = snapshot
+        if not missing:
+            return result
+
+        learning_end_time = datetime.now() + timedelta(hours=Config.LEARNING_HOURS)
+        stmt = dialect_insert(_dialect_name(db))(Chat.__table__).values([
+            {'chat_id': chat_id, 'title': titles[chat_id] or 'Unknown', 'is_active': True,
+             'learning_mode': True, 'learning_end_time': learning_end_time, 'personality_level': 1}
+            for chat_id in missing
+        ]).on_conflict_do_nothing(index_elements=[Chat.chat_id])
+        db.execute(stmt)
+        for row in db.execute(_CHATS_BY_TELEGRAM_ID, {'chat_ids': missing}):
+            snapshot = result[row.chat_id] = _snapshot(row)
+            self.chats.set(row.chat_id, snapshot)
+        return result
+
+    def get_user(self, db, user_id: str) -> Optional[Dict[str, Any]]:
+        """Снимок пользователя по Telegram ID (None — пользователь еще не записан)"""
+        snapshot = self.users.get(user_id)
+        if snapshot is None:
+            row = db.execute(_USER_BY_TELEGRAM_ID, {'user_id': user_id}).first()
+            if row is None:
+                return None
+            snapshot = _snapshot(row)
+            self.users.set(user_id, snapshot)
+        return snapshot
+
+    def ensure_users(self, db, profiles: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Снимки пользователей по Telegram ID; profiles — username, first_name, last_name"""
+        result, missing = {}, []
+        for user_id in profiles:
+            snapshot = self.users.get(user_id)
+            if snapshot is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = snapshot
+        if not missing:
+            return result
+
+        stmt = dialect_insert(_dialect_name(db))(User.__table__).values([
+            {'user_id': user_id, 'message_count': 0, **profiles[user_id]}
+            for user_id in missing
+        ]).on_conflict_do_nothing(index_elements=[User.user_id])
+        db.execute(stmt)
+        for row in db.execute(_USERS_BY_TELEGRAM_ID, {'user_ids': missing}):
+            snapshot = result[row.user_id] = _snapshot(row)
+            self.users.set(row.user_id, snapshot)
+        return result
+
+    def bump_users(self, db, pending: Dict[int, list]):
+        """Прирост message_count и last_seen: один executemany на пачку"""
+        if pending:
+            db.execute(_BUMP_USERS, [
+                {'pk': pk, 'delta': delta, 'seen': seen}
+                for pk, (delta, seen) in pending.items()
+            ])
+
+    def load_style_profiles(self, db, pks: Iterable[int]) -> Dict[int, Optional[bytes]]:
+        """Сериализованные профили стиля по ключам users одним SELECT"""
+        pks = list(pks)
+        if not pks:
+            return {}
+        return {row.id: row.style_profile for row in db.execute(_STYLE_PROFILES, {'pks': pks})}
+
+    def save_style_profiles(self, db, profiles: Dict[int, bytes]):
+        """Запись профилей стиля: один executemany на пачку"""
+        if profiles:
+            db.execute(_SAVE_STYLE_PROFILE, [
+                {'pk': pk, 'profile': profile} for pk, profile in profiles.items()
+            ])
+
+    def end_learning(self, db, chat: Dict[str, Any]):
+        """Перевод чата из обучения в активный режим"""
+        db.execute(_END_LEARNING, {'pk': chat['id']})
+        self.chats.pop(chat['chat_id'])
+
+    def reset_chat(self, db, chat: Dict[str, Any]) -> int:
+        """Сброс обучения чата: паттерны удаляются, чат снова учится (с коммитом)"""
+        deleted = db.execute(delete(Pattern.__table__).where(Pattern.chat_id == chat['id'])).rowcount
+        db.execute(update(Chat.__table__).where(Chat.__table__.c.id == chat['id']).values(
+            personality_level=1,
+            learning_mode=True,
+            learning_end_time=datetime.now() + timedelta(hours=Config.LEARNING_HOURS),
+        ))
+        db.commit()
+        self.chats.pop(chat['chat_id'])
+
+        from bot.language_model import language_model
+        from bot.media_index import media_index
+        from bot.ngram_aggregator import discard_chat
+        from bot.pattern_index import pattern_index
+        # Иначе следующая выгрузка вернула бы паттерны, накопленные до сброса
+        discard_chat(chat['id'])
+        pattern_index.invalidate(chat['id'])
+        language_model.invalidate(chat['id'])
+        media_index.invalidate(chat['id'])
+        return deleted
+
+    # Сообщения
+
+    def insert_messages(self, db, rows: List[Dict[str, Any]]):
+        """Пачка сообщений одним многострочным INSERT и событие для живой ленты
+
+        rows — колонки messages: chat_id и user_id — ключи chats и users.
+        """
+        if not rows:
+            return
+        db.execute(_INSERT_MESSAGES, rows)
+        # NOTIFY уйдет подписчикам вместе с коммитом пачки
+        publish(_connection(db), messages_event([
+            {'chat_id': row['chat_id'], 'user_id': row['user_id'], 'text': row.get('text'),
+             'created_at': row.get('timestamp')}
+            for row in rows
+        ]))
+
+    def recent_context(self, db, chat_id: int, limit: int = 10) -> List[str]:
+        """Тексты последних сообщений чата, от новых к старым"""
+        return db.execute(_RECENT_CONTEXT, {'chat_id': chat_id, 'limit': limit}).scalars().all()
+
+    def messages_page(self, db, chat_id: int = None, user_id: int = None,
+                      since: datetime = None, until: datetime = None,
+                      after: Tuple[datetime, int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Страница ленты по индексу (timestamp, id); after — позиция последней строки"""
+        stmt = select(Message.id, Message.chat_id, Message.user_id, Message.text,
+                      Message.timestamp.label('created_at'))
+        if chat_id is not None:
+            stmt = stmt.where(Message.chat_id == chat_id)
+        if user_id is not None:
+            stmt = stmt.where(Message.user_id == user_id)
+        if since is not None:
+            stmt = stmt.where(Message.timestamp >= since)
+        if until is not None:
+            stmt = stmt.where(Message.timestamp < until)
+        if after is not None:
+            stmt = stmt.where(tuple_(Message.timestamp, Message.id) < tuple_(*after))
+        stmt = stmt.order_by(desc(Message.timestamp), desc(Message.id)).limit(limit)
+        return [dict(row._mapping) for row in db.execute(stmt)]
+
+    # Паттерны
+
+    def upsert_patterns(self, db, rows: List[Dict[str, Any]]) -> List[PatternRow]:
+        """INSERT ... ON CONFLICT: frequency += excluded.frequency, context — новый, если задан
+
+        Возвращает строки (id, chat_id, pattern_type, pattern_text, frequency)
+        с итоговыми частотами — по ним обновляются индексы в памяти.
+        """
+        insert_ = dialect_insert(_dialect_name(db))
+        updated = []
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = insert_(Pattern).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Pattern.chat_id, Pattern.pattern_type, Pattern.pattern_text],
+                set_={
+                    'frequency': Pattern.frequency + stmt.excluded.frequency,
+                    'context': func.coalesce(stmt.excluded.context, Pattern.context),
+                    'last_used': stmt.excluded.last_used,
+                }
+            ).returning(Pattern.id, Pattern.chat_id, Pattern.pattern_type,
+                        Pattern.pattern_text, Pattern.frequency)
+            updated.extend(tuple(row) for row in db.execute(stmt))
+        return updated
+
+    # Статистика
+
+    def message_total(self, db) -> int:
+        """Число сообщений по дневным счетчикам (без COUNT(*) по messages)"""
+        return db.execute(_MESSAGE_TOTAL).scalar() or 0
+
+    def dashboard_stats(self, db) -> Dict[str, Any]:
+        """Сводка панели: O(чатов × дней) строк statistics и MAX по индексу messages"""
+        row = db.execute(select(
+            func.coalesce(func.sum(Statistic.total_messages), 0).label('total_messages'),
+            func.count(func.distinct(Statistic.chat_id)).label('total_chats'),
+            select(func.count()).select_from(User).scalar_subquery().label('total_users'),
+            select(func.max(Message.timestamp)).scalar_subquery().label('last_message'),
+        )).one()
+        return dict(row._mapping)
+
+    def daily_activity(self, db, days: int = 7) -> List[Dict[str, Any]]:
+        """Сообщения и ответы бота по дням за последние days дней"""
+        day = func.date(Statistic.date)
+        since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        rows = db.execute(
+            select(day.label('date'),
+                   func.sum(Statistic.total_messages).label('messages'),
+                   func.sum(Statistic.bot_responses).label('bot_responses'))
+            .where(Statistic.date > since)
+            .group_by(day)
+            .order_by(day.desc())
+        )
+        return [dict(row._mapping) for row in rows]
+
+    def ping(self, db) -> bool:
+        return db.execute(select(1)).scalar() == 1
+
+# Общий на процесс репозиторий
+repository = Repository()
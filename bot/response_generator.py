@@ -1,88 +1,120 @@
 import random
 import json
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func
 
-from bot.database import Pattern, Message, Chat, User
+from bot.database import Pattern, Chat, User
+from bot.language_model import language_model
+from bot.media_index import MEDIA_TYPES, MediaReply, media_index
+from bot.metrics import span
+from bot.pattern_index import pattern_index
 from bot.personality_manager import PersonalityManager
+from bot.rate_limit import RateLimiter, get_rate_limiter
+from bot.repository import repository
+from bot.stats_rollup import stats_rollup
+from bot.style_profile import StyleProfile, style_profiles
+from bot.tokenizer import tokenize
+from bot.utils import clean_text
 from bot.config import Config
 
+# Затухание веса токенов контекста с каждым более старым сообщением
+CONTEXT_DECAY = 0.85
+# Сколько паттернов отбирается для генерации ответа
+RELEVANT_PATTERNS = 15
+
+# Короче этого сгенерированная фраза заменяется шаблонным ответом
+MIN_GENERATED_WORDS = 3
+# Сколько вариантов перебирает уровень 4
+GURU_CANDIDATES = 5
+# Сколько частых слов собеседника добавляется к ключевым словам (уровни 3 и 4)
+STYLE_SEED_WORDS = 5
+# Сколько частых слов собеседника учитывает оценка вариантов уровня 4
+WORDS_IN_STYLE = 15
+
 class ResponseGenerator:
-    def __init__(self, personality_manager: PersonalityManager):
+    def __init__(self, personality_manager: PersonalityManager, rate_limiter: RateLimiter = None):
         self.personality = personality_manager
-        self.last_response_time = {}
+        # Общий для воркеров лимит: RATE_LIMIT_SECONDS и MAX_MESSAGES_PER_DAY
+        self.rate_limiter = rate_limiter or get_rate_limiter()
         
     def should_respond(self, chat_id: str) -> bool:
-        """Определить, должен ли бот ответить"""
-        current_time = datetime.now()
-        
-        # Rate limiting
-        if chat_id in self.last_response_time:
-            time_diff = (current_time - self.last_response_time[chat_id]).total_seconds()
-            if time_diff < Config.RATE_LIMIT_SECONDS:
-                return False
-        
+        """Определить, должен ли бот ответить (забирает право на ответ из лимита)"""
         # Вероятность ответа
         if random.random() > Config.RESPONSE_RATE:
             return False
-            
-        return True
+        
+        # Rate limiting
+        return self.rate_limiter.try_acquire(str(chat_id))
     
-    def generate_response(self, chat_id: int, context: Dict, db: Session) -> Optional[str]:
-        """Генерация ответа на основе контекста"""
+    def generate_response(self, chat_id: int, context: Dict, db: Session) -> Optional[Union[str, MediaReply]]:
+        """Генерация ответа на основе контекста
+
+        context['received_at'] (если есть) — время получения сообщения,
+        от него считается время ответа в статистике чата; context['user_id']
+        (Telegram ID автора) — чей стиль перенимают уровни 3 и 4;
+        context['message_type'] — на стикер и GIF чат отвечает тем же.
+        """
+        started = context.get('received_at') or datetime.now()
         chat = db.query(Chat).filter(Chat.id == chat_id).first()
         if not chat:
             return None
         
+        # Популярный стикер или GIF чата: выбор из top-k в памяти без генерации
+        with span('media'):
+            media = self._pick_media(chat_id, context, db)
+        if media is not None:
+            stats_rollup.record_response(chat_id, (datetime.now() - started).total_seconds())
+            return media
+        
         # Получение релевантных паттернов
-        patterns = self._get_relevant_patterns(chat_id, context, db)
+        with span('patterns'):
+            patterns = self._get_relevant_patterns(chat_id, context, db)
         
         if not patterns:
             return None
         
         # Генерация ответа в зависимости от уровня личности
-        if chat.personality_level == 1:
-            response = self._generate_robot_response(patterns)
-        elif chat.personality_level == 2:
-            response = self._generate_novice_response(patterns, context, db)
-        elif chat.personality_level == 3:
-            response = self._generate_member_response(patterns, context, db)
-        else:  # level 4
-            response = self._generate_guru_response(patterns, context, db)
-        
-        # Обновление времени ответа
-        self.last_response_time[str(chat.chat_id)] = datetime.now()
+        with span('generate'):
+            if chat.personality_level == 1:
+                response = self._generate_robot_response(patterns)
+            elif chat.personality_level == 2:
+                response = self._generate_novice_response(patterns, context, db)
+            elif chat.personality_level == 3:
+                response = self._generate_member_response(patterns, context, db)
+            else:  # level 4
+                response = self._generate_guru_response(patterns, context, db)
+        
+        now = datetime.now()
+        if response:
+            stats_rollup.record_response(chat_id, (now - started).total_seconds(), when=now)
         
         return response
     
+    def _pick_media(self, chat_id: int, context: Dict, db: Session) -> Optional[MediaReply]:
+        if context.get('message_type') not in MEDIA_TYPES and random.random() >= Config.MEDIA_RESPONSE_RATE:
+            return None
+        return media_index.pick(chat_id, db)
+    
     def _get_relevant_patterns(self, chat_id: int, context: Dict, db: Session) -> List[Pattern]:
         """Получение релевантных паттернов"""
-        # Получаем последние сообщения для контекста
-        recent_messages = db.query(Message).filter(
-            Message.chat_id == chat_id,
-            Message.text.isnot(None)
-        ).order_by(desc(Message.timestamp)).limit(10).all()
-        
-        # Извлекаем ключевые слова
-        keywords = set()
-        for msg in recent_messages:
-            if msg.text:
-                words = msg.text.lower().split()
-                keywords.update([w for w in words if len(w) > 3])
-        
-        # Ищем паттерны с этими словами
-        patterns = []
-        for keyword in list(keywords)[:5]:  # Берем первые 5 ключевых слов
-            matched = db.query(Pattern).filter(
-                Pattern.chat_id == chat_id,
-                Pattern.pattern_text.like(f'%{keyword}%'),
-                Pattern.pattern_type.in_(['word', 'bigram', 'trigram'])
-            ).order_by(desc(Pattern.frequency)).limit(3).all()
-            patterns.extend(matched)
-        
-        return list(set(patterns))
+        # Последние сообщения чата (только текст, по индексу ix_messages_chat_timestamp_id);
+        # текущее сообщение может быть еще в очереди записи, поэтому идет первым
+        texts = repository.recent_context(db, chat_id, limit=10)
+        if context.get('text'):
+            texts = [context['text']] + texts
+        
+        # Веса токенов контекста: те же токены, что у паттернов, свежие сообщения весомее
+        context_weights = Counter()
+        for age, text in enumerate(texts):
+            weight = CONTEXT_DECAY ** age
+            for token in tokenize(clean_text(text)):
+                context_weights[token] += weight
+        
+        # Один ранжированный (TF-IDF) поиск по инвертированному индексу чата
+        return pattern_index.search(chat_id, context_weights, db, limit=RELEVANT_PATTERNS)
     
     def _generate_robot_response(self, patterns: List[Pattern]) -> str:
         """Генерация ответа уровня 1 (Робот)"""
@@ -116,4 +148,91 @@ class ResponseGenerator:
             template = random.choice(templates)
             return template.format(word=word)
         
-        return random.choice(["Согласен", "Не уверен", "Может быть"])
\ No newline at end of file
+        return random.choice(["Согласен", "Не уверен", "Может быть"])
+    
+    def _seed_words(self, patterns: List[Pattern]) -> List[str]:
+        """Слова релевантных паттернов в порядке релевантности, без повторов"""
+        seeds = []
+        for pattern in patterns:
+            for word in pattern.pattern_text.split():
+                if word not in seeds:
+                    seeds.append(word)
+        return seeds
+    
+    def _style_profile(self, context: Dict, db: Session) -> Optional[StyleProfile]:
+        """Профиль стиля автора сообщения (None — автор неизвестен или еще молчал)"""
+        if context.get('user_id') is None:
+            return None
+        user = repository.get_user(db, str(context['user_id']))
+        return style_profiles.get(db, user['id']) if user else None
+    
+    def _style_seeds(self, seeds: List[str], profile: Optional[StyleProfile]) -> List[str]:
+        """Ключевые слова контекста и за ними частые слова собеседника"""
+        if profile is None:
+            return seeds
+        return seeds + [word for word in profile.top_words(STYLE_SEED_WORDS) if word not in seeds]
+    
+    def _max_words(self, profile: Optional[StyleProfile], low: int, high: int) -> int:
+        """Длина фразы: из распределения длин собеседника в пределах [low, high]"""
+        if profile is None:
+            return random.randint(low, high)
+        return min(max(profile.sample_length(), low), high)
+    
+    def _sentence(self, words: List[str], profile: Optional[StyleProfile] = None) -> str:
+        if profile is None:
+            return ' '.join(words).capitalize() + random.choice(['.', '!', '...', ')'])
+        # Регистр и концовка (знак или эмодзи) — как обычно пишет собеседник
+        text = ' '.join(words)
+        if profile.capitalizes():
+            text = text.capitalize()
+        return text + profile.sample_ending()
+    
+    def _generate_member_response(self, patterns: List[Pattern], context: Dict, db: Session) -> str:
+        """Генерация ответа уровня 3 (Свой): фраза из n-граммной модели чата в стиле собеседника"""
+        model = language_model.get(patterns[0].chat_id, db)
+        profile = self._style_profile(context, db)
+        seeds = self._seed_words(patterns)
+        random.shuffle(seeds)
+        words, _ = model.generate(self._style_seeds(seeds, profile),
+                                  max_words=self._max_words(profile, 4, 10))
+        
+        if len(words) < MIN_GENERATED_WORDS:
+            return self._generate_novice_response(patterns, context, db)
+        return self._sentence(words, profile)
+    
+    def _generate_guru_response(self, patterns: List[Pattern], context: Dict, db: Session) -> str:
+        """Генерация ответа уровня 4 (Гуру): лучший из нескольких вариантов и отсылки"""
+        model = language_model.get(patterns[0].chat_id, db)
+        profile = self._style_profile(context, db)
+        seeds = self._style_seeds(self._seed_words(patterns), profile)
+        keywords = set(seeds)
+        user_words = set(profile.top_words(WORDS_IN_STYLE)) if profile else set()
+        user_phrases = profile.top_phrases() if profile else []
+        
+        best, best_score = None, -1.0
+        for i in range(GURU_CANDIDATES):
+            # Каждый вариант начинается со своего ключевого слова
+            words, trigram_steps = model.generate(seeds[i:] or seeds,
+                                                  max_words=self._max_words(profile, 5, 12))
+            if len(words) < MIN_GENERATED_WORDS:
+                continue
+            # Больше слов из контекста и переходов по триграммам — ближе к стилю чата,
+            # частые слова и фразы собеседника — к его стилю
+            score = len(keywords.intersection(words)) + trigram_steps / len(words)
+            if profile is not None:
+                text = ' '.join(words)
+                score += 0.5 * len(user_words.intersection(words))
+                score += sum(1 for phrase in user_phrases if phrase in text)
+            if score > best_score:
+                best, best_score = words, score
+        
+        if best is None:
+            return self._generate_member_response(patterns, context, db)
+        
+        response = self._sentence(best, profile)
+        
+        # Отсылка к частой фразе чата
+        phrases = [p.pattern_text for p in patterns if p.pattern_type == 'trigram']
+        if phrases and random.random() < 0.3:
+            response += f" Как тут говорят, «{random.choice(phrases)}»"
+        return response
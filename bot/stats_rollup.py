@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Tuple, Optional
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from bot.config import Config
+from bot.database import Statistic
+from bot.repository import dialect_insert
+
+# Ключ: (id чата, начало дня)
+RollupKey = Tuple[int, datetime]
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class StatsRollup:
+    """Инкрементальные дневные счетчики чатов для таблицы statistics
+
+    Сообщения и ответы бота считаются в памяти и периодически сливаются в
+    statistics одним upsert, поэтому панель и повышение уровня читают
+    O(дней) строк вместо сканирования messages.
+    """
+
+    def __init__(self, flush_interval: float = None):
+        self.flush_interval = flush_interval if flush_interval is not None else Config.STATS_FLUSH_INTERVAL
+        # key -> [сообщений, ответов, сумма времени ответа, уровень личности]
+        self._deltas: Dict[RollupKey, list] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _entry(self, chat_id: int, when: Optional[datetime]) -> list:
+        key = (chat_id, day_start(when or datetime.now()))
+        entry = self._deltas.get(key)
+        if entry is None:
+            entry = self._deltas[key] = [0, 0, 0.0, None]
+        return entry
+
+    def record_message(self, chat_id: int, personality_level: int = None, when: datetime = None):
+        with self._lock:
+            entry = self._entry(chat_id, when)
+            entry[0] += 1
+            if personality_level is not None:
+                entry[3] = personality_level
+
+    def record_response(self, chat_id: int, response_time: float, when: datetime = None):
+        """Учет ответа бота; response_time — секунды от сообщения до ответа"""
+        with self._lock:
+            entry = self._entry(chat_id, when)
+            entry[1] += 1
+            entry[2] += response_time
+
+    def should_flush(self) -> bool:
+        return bool(self._deltas) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, db: Session) -> int:
+        """Слияние накопленных счетчиков в statistics"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+            self._last_flush = time.monotonic()
+
+        if not deltas:
+            return 0
+
+        rows = [
+            {
+                'chat_id': chat_id,
+                'date': day,
+                'total_messages': messages,
+                'bot_responses': responses,
+                'avg_response_time': response_time / responses if responses else 0.0,
+                'personality_level': level,
+            }
+            for (chat_id, day), (messages, responses, response_time, level) in deltas.items()
+        ]
+
+        insert = dialect_insert(db.get_bind().dialect.name)
+        stmt = insert(Statistic).values(rows)
+        old_responses = func.coalesce(Statistic.bot_responses, 0)
+        all_responses = old_responses + stmt.excluded.bot_responses
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Statistic.chat_id, Statistic.date],
+            set_={
+                'total_messages': func.coalesce(Statistic.total_messages, 0) + stmt.excluded.total_messages,
+                'bot_responses': all_responses,
+                # Среднее пересчитывается как взвешенное по числу ответов
+                'avg_response_time': case(
+                    (all_responses > 0,
+                     (func.coalesce(Statistic.avg_response_time, 0.0) * old_responses
+                      + stmt.excluded.avg_response_time * stmt.excluded.bot_responses) / all_responses),
+                    else_=0.0
+                ),
+                'personality_level': func.coalesce(stmt.excluded.personality_level,
+                                                   Statistic.personality_level),
+            }
+        )
+
+        try:
+            db.execute(stmt)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._merge_back(deltas)
+            raise
+        return len(rows)
+
+    def _merge_back(self, deltas: Dict[RollupKey, list]):
+        with self._lock:
+            for key, (messages, responses, response_time, level) in deltas.items():
+                entry = self._deltas.setdefault(key, [0, 0, 0.0, None])
+                entry[0] += messages
+                entry[1] += responses
+                entry[2] += response_time
+                if entry[3] is None:
+                    entry[3] = level
+
+# Общие на процесс счетчики
+stats_rollup = StatsRollup()
@@ -0,0 +1,434 @@
+"""Потоковые профили стиля пользователей
+
+Запуск: python -m bot.style_profile --backfill [--batch-size 5000]
+(профили заново по истории сообщений; дальше они обновляются сами)
+
+Профиль обновляется каждым сообщением за O(1) на токен (амортизированно)
+и занимает ограниченную память: распределение длины сообщений по
+корзинам, доли концовок, частоты знаков и эмодзи, а также частые слова,
+фразы и эмодзи пользователя — сводки Space-Saving (Metwally и др.):
+k счетчиков, при вытеснении новый элемент наследует минимальный счетчик
+как верхнюю оценку ошибки. В users.style_profile профиль хранится в
+компактном бинарном виде (struct, до ~1.5 КБ), уровни личности 3–4
+читают его одним SELECT вместо разбора истории пользователя.
+"""
+import argparse
+import logging
+import random
+import re
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from bot.cache import LRUCache
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+_MAGIC = b'SP'
+
+# Корзины длины сообщения в словах: [1], [2], [3], [4, 5], ..., [31, ∞)
+LENGTH_BOUNDS = (1, 2, 3, 4, 6, 8, 11, 15, 21, 31)
+# Концовки сообщения
+ENDINGS = ('.', '!', '?', '...', ')', '(', 'emoji', 'none')
+# Знаки, частота которых считается на символ
+MARKS = ('!', '?', ',', '.', ')', 'emoji')
+
+WORDS_K = 32
+PHRASES_K = 16
+EMOJI_K = 8
+
+# При таком числе сообщений все счетчики делятся пополам: профиль следит
+# за текущим стилем и не переполняет 32-битные поля
+DECAY_AT = 20000
+
+_EMOJI_RE = re.compile(
+    '[\U0001F300-\U0001FAFF\U00002600-\U000027BF\U0001F000-\U0001F2FF\U0001F900-\U0001F9FF]'
+    '[\U0001F3FB-\U0001F3FF\uFE0F\u200D]*'
+)
+
+_HEADER = struct.Struct('<2sB4I')
+_COUNTS = struct.Struct(f'<{len(LENGTH_BOUNDS)}I{len(ENDINGS)}I{len(MARKS)}I')
+_ENTRY = struct.Struct('<IIB')
+_UINT32_MAX = 2 ** 32 - 1
+
+class SpaceSaving:
+    """Top-k частых элементов потока в k счетчиках"""
+
+    __slots__ = ('k', 'counts', 'errors', '_floor', '_floor_items')
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # Кандидаты на вытеснение: элементы с минимальным счетчиком на момент
+        # последнего просмотра (счетчики только растут, поэтому список
+        # пересобирается, лишь когда кандидаты кончились)
+        self._floor = 0
+        self._floor_items: List[str] = []
+
+    def update(self, items: Iterable[str]):
+        """Учет каждого вхождения items (цикл внутри: без вызова на элемент)"""
+        counts, errors, k = self.counts, self.errors, self.k
+        for item in items:
+            current = counts.get(item)
+            if current is not None:
+                counts[item] = current + 1
+                continue
+            if len(counts) < k:
+                counts[item] = 1
+                errors[item] = 0
+                continue
+            # Вытесняется элемент с минимальным счетчиком
+            floor, candidates = self._floor, self._floor_items
+            while candidates:
+                victim = candidates.pop()
+                if counts.get(victim) == floor:
+                    break
+            else:
+                floor = min(counts.values())
+                candidates = [key for key, value in counts.items() if value == floor]
+                self._floor, self._floor_items = floor, candidates
+                victim = candidates.pop()
+            del counts[victim]
+            del errors[victim]
+            counts[item] = floor + 1
+            errors[item] = floor
+
+    def top(self, n: int = None) -> List[Tuple[str, int]]:
+        """Элементы по убыванию оценки частоты"""
+        ranked = sorted(self.counts.items(), key=lambda entry: -entry[1])
+        return ranked if n is None else ranked[:n]
+
+    def halve(self):
+        for item in list(self.counts):
+            self.counts[item] //= 2
+            self.errors[item] //= 2
+        self._floor_items = []
+
+    def copy(self) -> 'SpaceSaving':
+        other = SpaceSaving(self.k)
+        other.counts = dict(self.counts)
+        other.errors = dict(self.errors)
+        return other
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+class StyleProfile:
+    """Стиль одного пользователя: счетчики фиксированного размера и сводки top-k"""
+
+    __slots__ = ('messages', 'words_total', 'chars_total', 'capitalized',
+                 'lengths', 'endings', 'marks', 'words', 'phrases', 'emoji')
+
+    def __init__(self):
+        self.messages = 0
+        self.words_total = 0
+        self.chars_total = 0
+        self.capitalized = 0
+        self.lengths = [0] * len(LENGTH_BOUNDS)
+        self.endings = [0] * len(ENDINGS)
+        self.marks = [0] * len(MARKS)
+        self.words = SpaceSaving(WORDS_K)
+        self.phrases = SpaceSaving(PHRASES_K)
+        self.emoji = SpaceSaving(EMOJI_K)
+
+    # Обновление
+
+    def observe(self, text: str, tokens: Sequence[str] = (), phrases: Sequence[str] = ()):
+        """Учет сообщения: text — очищенный текст, tokens и phrases — его n-граммы"""
+        text = text.strip()
+        if not text:
+            return
+        if self.messages >= DECAY_AT:
+            self._decay()
+
+        emoji = _EMOJI_RE.findall(text)
+        length = len(text.split())
+        self.messages += 1
+        self.words_total += length
+        self.chars_total += len(text)
+        self.lengths[self._length_bucket(length)] += 1
+        if text[0].isupper():
+            self.capitalized += 1
+        self.endings[ENDINGS.index(self._ending(text, emoji))] += 1
+
+        marks = self.marks
+        marks[0] += text.count('!')
+        marks[1] += text.count('?')
+        marks[2] += text.count(',')
+        marks[3] += text.count('.')
+        marks[4] += text.count(')')
+        marks[5] += len(emoji)
+
+        self.words.update(tokens)
+        self.phrases.update(phrases)
+        if emoji:
+            self.emoji.update(emoji)
+
+    @staticmethod
+    def _length_bucket(length: int) -> int:
+        for index, bound in enumerate(LENGTH_BOUNDS[1:]):
+            if length < bound:
+                return index
+        return len(LENGTH_BOUNDS) - 1
+
+    @staticmethod
+    def _ending(text: str, emoji: List[str]) -> str:
+        if emoji and text.endswith(emoji[-1]):
+            return 'emoji'
+        if text.endswith('...') or text.endswith('…'):
+            return '...'
+        last = text[-1]
+        return last if last in ('.', '!', '?', ')', '(') else 'none'
+
+    def _decay(self):
+        self.messages //= 2
+        self.words_total //= 2
+        self.chars_total //= 2
+        self.capitalized //= 2
+        for counters in (self.lengths, self.endings, self.marks):
+            for i in range(len(counters)):
+                counters[i] //= 2
+        for summary in (self.words, self.phrases, self.emoji):
+            summary.halve()
+
+    # Чтение
+
+    def top_words(self, n: int = 10) -> List[str]:
+        return [word for word, _ in self.words.top(n)]
+
+    def top_phrases(self, n: int = 5) -> List[str]:
+        return [phrase for phrase, _ in self.phrases.top(n)]
+
+    def mean_words(self) -> float:
+        return self.words_total / self.messages if self.messages else 0.0
+
+    def rate(self, mark: str) -> float:
+        """Знаков mark на символ текста"""
+        return self.marks[MARKS.index(mark)] / self.chars_total if self.chars_total else 0.0
+
+    def emoji_rate(self) -> float:
+        """Доля сообщений, которые заканчиваются эмодзи"""
+        return self.endings[ENDINGS.index('emoji')] / self.messages if self.messages else 0.0
+
+    def sample_length(self, rng: random.Random = random) -> int:
+        """Длина сообщения в словах из распределения пользователя"""
+        if not self.messages:
+            return rng.randint(4, 10)
+        index = rng.choices(range(len(self.lengths)), weights=self.lengths)[0]
+        low = LENGTH_BOUNDS[index]
+        high = LENGTH_BOUNDS[index + 1] - 1 if index + 1 < len(LENGTH_BOUNDS) else low + 10
+        return rng.randint(low, high)
+
+    def sample_ending(self, rng: random.Random = random) -> str:
+        """Концовка фразы в манере пользователя (эмодзи — из его частых)"""
+        if not self.messages:
+            return rng.choice(['.', '!', '...', ')'])
+        ending = rng.choices(ENDINGS, weights=self.endings)[0]
+        if ending == 'emoji':
+            top = self.emoji.top(3)
+            return ' ' + rng.choice(top)[0] if top else ''
+        return '' if ending == 'none' else ending
+
+    def capitalizes(self) -> bool:
+        """Начинает ли пользователь сообщения с заглавной буквы"""
+        return not self.messages or self.capitalized * 2 >= self.messages
+
+    def copy(self) -> 'StyleProfile':
+        other = StyleProfile()
+        other.messages = self.messages
+        other.words_total = self.words_total
+        other.chars_total = self.chars_total
+        other.capitalized = self.capitalized
+        other.lengths = list(self.lengths)
+        other.endings = list(self.endings)
+        other.marks = list(self.marks)
+        other.words = self.words.copy()
+        other.phrases = self.phrases.copy()
+        other.emoji = self.emoji.copy()
+        return other
+
+    # Бинарный формат
+
+    def to_bytes(self) -> bytes:
+        clamp = lambda value: min(value, _UINT32_MAX)
+        parts = [
+            _HEADER.pack(_MAGIC, FORMAT_VERSION, clamp(self.messages), clamp(self.words_total),
+                         clamp(self.chars_total), clamp(self.capitalized)),
+            _COUNTS.pack(*map(clamp, self.lengths + self.endings + self.marks)),
+        ]
+        for summary in (self.words, self.phrases, self.emoji):
+            entries = [(item.encode(), count) for item, count in summary.top()]
+            entries = [(raw, count) for raw, count in entries if len(raw) <= 255]
+            parts.append(bytes([len(entries)]))
+            for raw, count in entries:
+                item = raw.decode()
+                parts.append(_ENTRY.pack(clamp(count), clamp(summary.errors[item]), len(raw)))
+                parts.append(raw)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'StyleProfile':
+        profile = cls()
+        magic, version, *totals = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Неизвестный формат профиля стиля: {magic!r} v{version}")
+        profile.messages, profile.words_total, profile.chars_total, profile.capitalized = totals
+
+        counts = _COUNTS.unpack_from(data, _HEADER.size)
+        lengths, endings = len(profile.lengths), len(profile.endings)
+        profile.lengths = list(counts[:lengths])
+        profile.endings = list(counts[lengths:lengths + endings])
+        profile.marks = list(counts[lengths + endings:])
+
+        offset = _HEADER.size + _COUNTS.size
+        for summary in (profile.words, profile.phrases, profile.emoji):
+            size = data[offset]
+            offset += 1
+            for _ in range(size):
+                count, error, length = _ENTRY.unpack_from(data, offset)
+                offset += _ENTRY.size
+                item = data[offset:offset + length].decode()
+                offset += length
+                summary.counts[item] = count
+                summary.errors[item] = error
+        return profile
+
+class StyleProfileStore:
+    """Профили пользователей процесса: LRU в памяти и пакетная запись в users
+
+    Измененные профили держатся в _dirty до выгрузки, даже если LRU их уже
+    вытеснил, поэтому обновления не теряются. Наружу отдаются копии:
+    обучение меняет профили в фоновом потоке.
+    """
+
+    def __init__(self, max_users: int = None, flush_interval: float = None):
+        self._profiles = LRUCache(maxsize=max_users or Config.STYLE_PROFILE_MAX_USERS)
+        self._dirty: Dict[int, StyleProfile] = {}
+        self._lock = threading.Lock()
+        self.flush_interval = flush_interval if flush_interval is not None else Config.STYLE_PROFILE_FLUSH_INTERVAL
+        self._last_flush = time.monotonic()
+
+    def _cached(self, user_id: int) -> Optional[StyleProfile]:
+        profile = self._dirty.get(user_id)
+        return profile if profile is not None else self._profiles.get(user_id)
+
+    def _load(self, db: Session, user_ids: Iterable[int]):
+        """Профили из БД одним SELECT (у новых пользователей — пустые)"""
+        from bot.repository import repository
+
+        missing = [user_id for user_id in set(user_ids) if self._cached(user_id) is None]
+        if not missing:
+            return
+        stored = repository.load_style_profiles(db, missing)
+        for user_id in missing:
+            data = stored.get(user_id)
+            profile = None
+            if data:
+                try:
+                    profile = StyleProfile.from_bytes(data)
+                except (ValueError, struct.error) as e:
+                    logger.warning(f"⚠️ Профиль стиля пользователя {user_id} не прочитан: {e}")
+            self._profiles.set(user_id, profile or StyleProfile())
+
+    def observe_many(self, db: Session, messages: Iterable[Tuple[str, int, Sequence[str], Sequence[str]]]):
+        """Пачка (text, user_id, tokens, phrases); user_id — ключ users"""
+        messages = [message for message in messages if message[1] is not None]
+        if not messages:
+            return
+        with self._lock:
+            self._load(db, (user_id for _, user_id, _, _ in messages))
+            for text, user_id, tokens, phrases in messages:
+                profile = self._cached(user_id)
+                profile.observe(text, tokens, phrases)
+                self._dirty[user_id] = profile
+
+    def get(self, db: Session, user_id: int) -> Optional[StyleProfile]:
+        """Копия профиля (None — пользователь еще ничего не написал)"""
+        with self._lock:
+            self._load(db, (user_id,))
+            profile = self._cached(user_id)
+            return profile.copy() if profile is not None and profile.messages else None
+
+    def should_flush(self) -> bool:
+        return bool(self._dirty) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, db: Session) -> int:
+        """Запись измененных профилей одним executemany (коммитит вызывающий)"""
+        from bot.repository import repository
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+            payload = {user_id: profile.to_bytes() for user_id, profile in dirty.items()}
+        try:
+            repository.save_style_profiles(db, payload)
+        except Exception:
+            # Профили вернутся в очередь записи, если их не обновили заново
+            with self._lock:
+                for user_id, profile in dirty.items():
+                    self._dirty.setdefault(user_id, profile)
+            raise
+        return len(payload)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._dirty.pop(user_id, None)
+            self._profiles.pop(user_id)
+
+# Общие на процесс профили
+style_profiles = StyleProfileStore()
+
+def backfill(batch_size: int = 5000) -> int:
+    """Профили всех пользователей заново по истории сообщений (бот остановлен)"""
+    from collections import defaultdict
+
+    from sqlalchemy import select
+
+    from bot.database import Message, SessionLocal
+    from bot.repository import repository
+    from bot.tokenizer import extract_ngrams
+    from bot.utils import clean_text
+
+    profiles: Dict[int, StyleProfile] = defaultdict(StyleProfile)
+    last_id, total = 0, 0
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(
+                select(Message.id, Message.user_id, Message.text)
+                .where(Message.id > last_id, Message.text.isnot(None))
+                .order_by(Message.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            for row in rows:
+                if row.user_id is not None:
+                    text = clean_text(row.text)
+                    unigrams, bigrams, trigrams = extract_ngrams(text)
+                    profiles[row.user_id].observe(text, unigrams, bigrams + trigrams)
+            total += len(rows)
+            logger.info(f"Профили стиля: учтено сообщений {total}")
+        repository.save_style_profiles(db, {user_id: profile.to_bytes() for user_id, profile in profiles.items()})
+        db.commit()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backfill', action='store_true', help='построить профили по истории сообщений')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.backfill:
+        parser.print_help()
+        return
+    logger.info(f"✅ Профили стиля построены по {backfill(args.batch_size)} сообщениям")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import re
+import sys
+from typing import List, Tuple
+
+# Стоп-слова NLTK (russian + english), встроены, чтобы не скачивать корпус при старте
+RUSSIAN_STOPWORDS = frozenset('''
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы
+по только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг
+ли если уже или ни быть был него до вас нибудь опять уж вам ведь там потом
+себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам
+чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому
+этого какой совсем ним здесь этом один почти мой тем чтобы нее сейчас были
+куда зачем всех никогда можно при наконец два об другой хоть после над больше
+тот через эти нас про всего них какая много разве три эту моя впрочем хорошо
+свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно
+всю между
+'''.split())
+
+ENGLISH_STOPWORDS = frozenset('''
+i me my myself we our ours ourselves you you're you've you'll you'd your yours
+yourself yourselves he him his himself she she's her hers herself it it's its
+itself they them their theirs themselves what which who whom this that that'll
+these those am is are was were be been being have has had having do does did
+doing a an the and but if or because as until while of at by for with about
+against between into through during before after above below to from up down
+in out on off over under again further then once here there when where why how
+all any both each few more most other some such no nor not only own same so
+than too very s t can will just don don't should should've now d ll m o re ve
+y ain aren aren't couldn couldn't didn didn't doesn doesn't hadn hadn't hasn
+hasn't haven haven't isn isn't ma mightn mightn't mustn mustn't needn needn't
+shan shan't shouldn shouldn't wasn wasn't weren weren't won won't wouldn
+wouldn't
+'''.split())
+
+STOPWORDS = RUSSIAN_STOPWORDS | ENGLISH_STOPWORDS
+
+# Слово: буквы и цифры, допускаются внутренние дефис и апостроф (кто-то, don't)
+_WORD_RE = re.compile(r"\w+(?:[-'’]\w+)*")
+
+MIN_TOKEN_LENGTH = 3
+
+Ngrams = Tuple[List[str], List[str], List[str]]
+
+def tokenize(text: str) -> List[str]:
+    """Токены сообщения в нижнем регистре без стоп-слов и коротких слов
+
+    Строки токенов интернируются: одинаковые слова разных сообщений — один
+    объект, что экономит память в счетчиках агрегатора.
+    """
+    if not text:
+        return []
+    intern = sys.intern
+    stopwords = STOPWORDS
+    return [intern(token) for token in _WORD_RE.findall(text.lower())
+            if len(token) >= MIN_TOKEN_LENGTH and token not in stopwords]
+
+def ngrams(tokens: List[str], n: int) -> List[str]:
+    """N-граммы подряд идущих токенов, склеенные пробелом"""
+    if n == 1:
+        return tokens
+    if len(tokens) < n:
+        return []
+    if n == 2:
+        return [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+    if n == 3:
+        return [f'{a} {b} {c}' for a, b, c in zip(tokens, tokens[1:], tokens[2:])]
+    return [' '.join(gram) for gram in zip(*(tokens[i:] for i in range(n)))]
+
+def extract_ngrams(text: str) -> Ngrams:
+    """Униграммы, биграммы и триграммы сообщения"""
+    tokens = tokenize(text)
+    return tokens, ngrams(tokens, 2), ngrams(tokens, 3)
@@ -0,0 +1,20 @@
+import re
+from typing import Iterable
+
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+_MENTION_RE = re.compile(r'@\w+')
+_SPACES_RE = re.compile(r'\s+')
+
+def clean_text(text: str) -> str:
+    """Удаление ссылок, упоминаний и лишних пробелов"""
+    if not text:
+        return ''
+    text = _URL_RE.sub(' ', text)
+    text = _MENTION_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def contains_blacklisted_words(text: str, words: Iterable[str]) -> bool:
+    """Есть ли в тексте слова из чёрного списка (с учетом форм слова и гомоглифов)"""
+    from bot.moderation_filter import get_filter
+    return get_filter(words).contains(text)
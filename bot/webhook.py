@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+class WebhookDispatcher:
+    """Ограниченная очередь обновлений из webhook и пул потоков-обработчиков
+
+    HTTP-запрос Telegram только кладет тело в очередь и сразу получает ответ,
+    а обработчики SimpleBot.setup_handlers выполняются в рабочих потоках.
+    """
+
+    def __init__(self, bot, workers: int = None, max_size: int = None):
+        self.bot = bot
+        self.workers = workers or Config.WEBHOOK_WORKERS
+        self._queue = queue.Queue(maxsize=max_size or Config.WEBHOOK_QUEUE_SIZE)
+        self._threads = []
+        self.stats = {'accepted': 0, 'rejected': 0, 'processed': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'webhook-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload: str) -> bool:
+        """Поставить тело обновления в очередь; False — очередь заполнена"""
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self._count('rejected')
+            return False
+        self._count('accepted')
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Обработка оставшихся обновлений и остановка потоков"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _worker(self):
+        import telebot
+
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                break
+            try:
+                update = telebot.types.Update.de_json(payload)
+                self.bot.bot.process_new_updates([update])
+                self._count('processed')
+            except Exception as e:
+                self._count('failed')
+                logger.error(f"❌ Ошибка обработки обновления из webhook: {e}")
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher() -> WebhookDispatcher:
+    """Диспетчер текущего процесса (создается при первом обновлении)
+
+    Каждый воркер gunicorn поднимает свой экземпляр бота и пул обработчиков.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                import atexit
+                from bot.main import SimpleBot
+                from bot.metrics import register_queue
+                bot = SimpleBot(threaded=False)
+                bot.init_database()
+                dispatcher = WebhookDispatcher(bot)
+                dispatcher.start()
+                # Принятые обновления обрабатываются до остановки воркера gunicorn;
+                # atexit — LIFO, поэтому очередь записи сбросится уже после них
+                atexit.register(dispatcher.stop)
+                register_queue('webhook', dispatcher, 'Очередь обновлений из webhook')
+                _dispatcher = dispatcher
+    return _dispatcher
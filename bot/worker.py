@@ -5,20 +5,43 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def start_metrics():
+    """HTTP-сервер /metrics воркера (METRICS_PORT=0 — не запускать)"""
+    from bot.config import Config
+    
+    if not Config.METRICS_ENABLED or not Config.METRICS_PORT:
+        return None
+    from bot.metrics import start_http_server
+    try:
+        return start_http_server(Config.METRICS_PORT)
+    except OSError as e:
+        logger.error(f"❌ Не удалось запустить сервер метрик на порту {Config.METRICS_PORT}: {e}")
+        return None
+
 def run_bot_with_retry():
     """Запуск бота с повторными попытками"""
+    # Отсчет времени до готовности (bot.readiness)
+    import bot.readiness  # noqa: F401
+    
     retry_count = 0
     max_retries = 10
     
+    start_metrics()
+    
     while retry_count < max_retries:
         try:
             logger.info(f"🔄 Попытка запуска бота #{retry_count + 1}")
             
             # Импортируем и запускаем бота
-            from bot.main import SimpleBot
-            bot = SimpleBot()
-            bot.init_database()
+            from bot.config import Config
+            from bot.main import create_bot
+            bot = create_bot()
+            if Config.BOT_RUNTIME != 'webhook':
+                # В режиме webhook конвейер и БД — в процессах веб-приложения,
+                # воркер только регистрирует webhook и ждет остановки
+                bot.init_database()
             bot.run()
+            return
             
         except Exception as e:
             retry_count += 1
@@ -0,0 +1,50 @@
+"""Общие настройки тестов
+
+bot.config читает окружение при импорте, а bot.database сразу создает
+engine, поэтому TELEGRAM_TOKEN и DATABASE_URL (файл SQLite во временном
+каталоге) задаются здесь — до первого импорта модулей bot и web.
+
+Запуск: pip install -r requirements-dev.txt && python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TMP_DIR = tempfile.mkdtemp(prefix='chat_clone_tests_')
+os.environ['TELEGRAM_TOKEN'] = '123:test'
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ['RATE_LIMIT_BACKEND'] = 'local'
+os.environ['BLACKLIST_FILE'] = ''
+
+# Сообщения старого бота: (chat_id, user_id, username, message_text, created_at)
+LEGACY_ROWS = [
+    (-100, 1, 'alice', 'старое сообщение', '2025-05-01 10:00:00'),
+    (-100, 2, 'bob', 'ещё одно', '2025-05-01 12:00:00'),
+    (5, 1, 'alice', 'личка', '2025-06-02 09:00:00'),
+]
+
+@pytest.fixture(scope='session')
+def database():
+    """БД с сырой таблицей messages старого бота, переведенная миграциями на текущую схему"""
+    from sqlalchemy import text
+    from bot.database import engine
+    from bot.migrations import migrate
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY, chat_id BIGINT, user_id BIGINT, username VARCHAR(255),
+                message_text TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO messages (chat_id, user_id, username, message_text, created_at)
+            VALUES (:chat_id, :user_id, :username, :message_text, :created_at)
+        """), [dict(zip(('chat_id', 'user_id', 'username', 'message_text', 'created_at'), row))
+               for row in LEGACY_ROWS])
+    migrate()
+    return engine
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.async_runtime import AsyncBot
+from bot.main import WELCOME_TEXT
+
+def _message(chat_id: int, message_id: int = 1):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id, type='private'), message_id=message_id,
+                           from_user=SimpleNamespace(id=1, username='user'), text='привет',
+                           content_type='text')
+
+@pytest.fixture
+def bot():
+    bot = AsyncBot()
+    yield bot
+    bot.executor.shutdown(wait=True)
+
+def _run(bot, coroutine):
+    async def main():
+        bot._global_slots = asyncio.Semaphore(bot.max_concurrency)
+        return await coroutine()
+    return asyncio.run(main())
+
+def test_one_chat_is_handled_sequentially(bot):
+    bot.per_chat_concurrency = 1
+    active = {}
+    overlap = []
+
+    async def handler(message):
+        chat_id = message.chat.id
+        active[chat_id] = active.get(chat_id, 0) + 1
+        overlap.append(dict(active))
+        await asyncio.sleep(0.01)
+        active[chat_id] -= 1
+
+    async def scenario():
+        for i in range(3):
+            await bot._dispatch(handler, _message(1, i))
+            await bot._dispatch(handler, _message(2, i))
+        await asyncio.gather(*bot._tasks)
+
+    _run(bot, scenario)
+    # В одном чате не больше одного обработчика, разные чаты — параллельно
+    assert max(state.get(1, 0) for state in overlap) == 1
+    assert any(state.get(1) and state.get(2) for state in overlap)
+    assert bot._chat_slots == {}
+
+def test_handler_error_releases_global_slot(bot):
+    bot.max_concurrency = 1
+
+    async def broken(message):
+        raise RuntimeError('boom')
+
+    async def scenario():
+        for i in range(3):
+            # С одним глобальным слотом третий вызов повис бы, если слот не возвращается
+            await asyncio.wait_for(bot._dispatch(broken, _message(1, i)), timeout=1)
+        await asyncio.gather(*bot._tasks, return_exceptions=True)
+        return bot._global_slots._value
+
+    assert _run(bot, scenario) == 1
+
+def test_replies_go_through_dispatcher(bot):
+    sent = []
+
+    async def reply_to(message, text, **kwargs):
+        sent.append((message.chat.id, text, kwargs))
+
+    bot.bot.reply_to = reply_to
+    welcome = bot.bot.message_handlers[0]['function']
+
+    async def scenario():
+        bot.start_dispatcher(loop=asyncio.get_running_loop())
+        await welcome(_message(7))
+        await asyncio.gather(*bot._tasks)
+        stats = dict(bot.dispatcher.stats)
+        await bot.run_blocking(bot.stop_dispatcher)
+        return stats
+
+    stats = _run(bot, scenario)
+    assert stats['enqueued'] == 1
+    assert sent == [(7, WELCOME_TEXT, {'parse_mode': 'Markdown'})]
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from bot.cache import KeyedLocks, LRUCache
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # a становится самым свежим
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+def test_overwrite_refreshes_position():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('a', 10)
+    cache.set('c', 3)
+    assert cache.get('a') == 10
+    assert cache.get('b') is None
+
+def test_ttl_expires_entries():
+    cache = LRUCache(maxsize=10, ttl=0.02)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.03)
+    assert cache.get('a', 'нет') == 'нет'
+    assert len(cache) == 0
+
+def test_pop_and_stats():
+    cache = LRUCache(maxsize=10)
+    cache.set('a', 1)
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'нет') == 'нет'
+    cache.get('a')
+    cache.set('b', 2)
+    cache.get('b')
+    assert cache.stats() == {'size': 1, 'maxsize': 10, 'hits': 1, 'misses': 1}
+
+def _try_hold(locks: KeyedLocks, key, acquired: list) -> threading.Thread:
+    def run():
+        with locks.hold(key):
+            acquired.append(key)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def test_keyed_locks_block_same_key_only():
+    locks = KeyedLocks()
+    acquired = []
+    with locks.hold('a'):
+        other = _try_hold(locks, 'b', acquired)
+        other.join(1)
+        assert acquired == ['b']
+
+        same = _try_hold(locks, 'a', acquired)
+        same.join(0.1)
+        assert acquired == ['b']
+    same.join(1)
+    assert acquired == ['b', 'a']
+    # Освобожденные блокировки не копятся
+    assert len(locks) == 0
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from bot.dispatcher import PRIORITY_COMMAND, OutboundDispatcher
+
+def _flood(retry_after: float) -> ApiTelegramException:
+    return ApiTelegramException('sendMessage', None, {
+        'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+        'parameters': {'retry_after': retry_after},
+    })
+
+class _Sender:
+    """Фальшивый вызов Bot API: запоминает время отправки, может вернуть ошибки"""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+
+    def __call__(self, chat_id, text):
+        self.calls.append((chat_id, text, time.monotonic()))
+        if self.errors:
+            raise self.errors.pop(0)
+
+def _dispatch(jobs, errors=(), **kwargs):
+    """Отправка jobs [(chat_id, text)] и остановка с дожиданием очереди"""
+    send = _Sender(errors)
+    dispatcher = OutboundDispatcher(**{'workers': 2, 'global_rate': 1000, 'chat_interval': 0,
+                                       'group_interval': 0, **kwargs})
+    dispatcher.start()
+    for chat_id, text in jobs:
+        dispatcher.submit(chat_id, send, chat_id, text)
+    dispatcher.stop()
+    return dispatcher, send.calls
+
+def test_flood_wait_delays_only_that_chat():
+    dispatcher, calls = _dispatch([(1, 'a'), (2, 'b')], errors=[_flood(0.3)])
+    sent = {}
+    for chat_id, text, at in calls:
+        sent.setdefault(chat_id, []).append(at)
+    assert len(sent[1]) == 2
+    # Повтор после retry_after, второй чат не ждет
+    assert sent[1][1] - sent[1][0] >= 0.3
+    assert sent[2][0] - sent[1][0] < 0.2
+    assert dispatcher.stats['flood_waits'] == 1
+    assert dispatcher.stats['sent'] == 2
+
+def test_request_errors_are_not_retried():
+    error = ApiTelegramException('sendMessage', None, {'ok': False, 'error_code': 400,
+                                                       'description': 'chat not found'})
+    dispatcher, calls = _dispatch([(1, 'a')], errors=[error])
+    assert len(calls) == 1
+    assert dispatcher.stats['failed'] == 1
+
+def test_chat_interval_paces_one_chat():
+    _, calls = _dispatch([(5, str(i)) for i in range(3)], chat_interval=0.1, group_interval=0.3)
+    times = [at for _, _, at in calls]
+    assert [text for _, text, _ in calls] == ['0', '1', '2']
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+
+def test_group_interval_for_negative_ids():
+    dispatcher = OutboundDispatcher(chat_interval=0.1, group_interval=0.3)
+    assert dispatcher._interval(-100) == 0.3
+    assert dispatcher._interval(100) == 0.1
+
+def test_global_rate_limits_all_chats():
+    _, calls = _dispatch([(chat_id, 'x') for chat_id in range(30)], workers=4, global_rate=20)
+    times = sorted(at for _, _, at in calls)
+    # Ведро на 20 токенов: остальные 10 сообщений идут со скоростью 20/с
+    assert times[-1] - times[0] >= 0.4
+
+def test_commands_go_before_replies():
+    send = _Sender()
+    dispatcher = OutboundDispatcher(workers=1, global_rate=1000, chat_interval=0, group_interval=0)
+    dispatcher.submit(1, send, 1, 'reply')
+    dispatcher.submit(1, send, 1, 'command', priority=PRIORITY_COMMAND)
+    dispatcher.start()
+    dispatcher.stop()
+    assert [text for _, text, _ in send.calls] == ['command', 'reply']
+
+def test_full_queue_drops():
+    dispatcher = OutboundDispatcher(max_size=1)
+    assert dispatcher.submit(1, print, 'a')
+    assert not dispatcher.submit(1, print, 'b')
+    assert dispatcher.stats['dropped'] == 1
+
+def test_idle_chats_are_swept():
+    dispatcher, _ = _dispatch([(1, 'a'), (2, 'b')], idle_seconds=0.05)
+    assert set(dispatcher.latency_stats()) == {1, 2}
+    time.sleep(0.1)
+    dispatcher._sweep(time.monotonic())
+    assert dispatcher.latency_stats() == {}
+
+def test_latency_metrics_export_most_active_chats():
+    dispatcher, _ = _dispatch([(1, 'a'), (2, 'b'), (2, 'c')])
+    (name, kind, _, samples), = dispatcher.latency_metrics(limit=1)
+    assert (name, kind) == ('chatclone_send_chat_latency_seconds', 'gauge')
+    assert [labels for labels, _ in samples] == [{'chat': '2', 'quantile': '0.5'},
+                                                 {'chat': '2', 'quantile': '0.95'}]
+
+def test_async_calls_run_on_loop_with_flood_wait():
+    from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+    calls = []
+
+    async def send(chat_id, text):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise AsyncApiTelegramException('sendMessage', None, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                'parameters': {'retry_after': 0.2},
+            })
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        dispatcher = OutboundDispatcher(workers=1, global_rate=1000, chat_interval=0, loop=loop)
+        dispatcher.start()
+        dispatcher.submit(1, send, 1, 'a')
+        # Потоки отправки ждут корутины этого цикла: останавливаем не в нем
+        await loop.run_in_executor(None, dispatcher.stop)
+        return dispatcher.stats
+
+    stats = asyncio.run(scenario())
+    assert stats['flood_waits'] == 1 and stats['sent'] == 1
+    assert calls[1] - calls[0] >= 0.2
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from bot.ingestion import IngestionQueue
+
+def _wait(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'не дождались'
+        time.sleep(0.01)
+
+def test_flushes_full_batches():
+    batches = []
+    ingestion = IngestionQueue(batches.append, batch_size=3, flush_interval=10, max_size=100)
+    for i in range(6):
+        assert ingestion.put({'i': i})
+    ingestion.start()
+    _wait(lambda: sum(map(len, batches)) == 6)
+    ingestion.stop()
+    assert [len(batch) for batch in batches] == [3, 3]
+    assert ingestion.stats['written'] == 6
+    assert ingestion.stats['batches'] == 2
+
+def test_flushes_partial_batch_after_interval():
+    batches = []
+    ingestion = IngestionQueue(batches.append, batch_size=100, flush_interval=0.05, max_size=100)
+    ingestion.start()
+    ingestion.put({'i': 1})
+    _wait(lambda: batches)
+    ingestion.stop()
+    assert batches == [[{'i': 1}]]
+
+def test_stop_drains_queue():
+    batches = []
+    ingestion = IngestionQueue(batches.append, batch_size=100, flush_interval=60, max_size=100)
+    ingestion.start()
+    for i in range(5):
+        ingestion.put({'i': i})
+    ingestion.stop()
+    assert [row['i'] for batch in batches for row in batch] == list(range(5))
+    # После остановки строки не принимаются
+    assert not ingestion.put({'i': 5})
+    assert ingestion.stats['dropped'] == 1
+
+def test_retries_failed_batch():
+    calls = []
+
+    def flaky(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise RuntimeError('db down')
+
+    ingestion = IngestionQueue(flaky, batch_size=2, flush_interval=10, max_size=10, max_retries=1)
+    ingestion.put({'i': 1})
+    ingestion.put({'i': 2})
+    ingestion.start()
+    ingestion.stop()
+    assert calls == [[{'i': 1}, {'i': 2}]] * 2
+    assert ingestion.stats['written'] == 2
+    assert ingestion.stats['failed_batches'] == 0
+
+def test_gives_up_after_retries():
+    def broken(batch):
+        raise RuntimeError('db down')
+
+    ingestion = IngestionQueue(broken, batch_size=1, flush_interval=10, max_size=10, max_retries=0)
+    ingestion.put({'i': 1})
+    ingestion.start()
+    ingestion.stop()
+    assert ingestion.stats['failed_batches'] == 1
+    assert ingestion.stats['dropped'] == 1
+
+def test_backpressure_drops_after_timeout():
+    release = threading.Event()
+    ingestion = IngestionQueue(lambda batch: release.wait(5), batch_size=1, flush_interval=10,
+                               max_size=1, put_timeout=0.05)
+    ingestion.start()
+    assert ingestion.put({'i': 1})
+    # Поток записи занят первой строкой: вторая занимает очередь, третья ждет и отбрасывается
+    _wait(lambda: ingestion.qsize() == 0)
+    assert ingestion.put({'i': 2})
+    started = time.monotonic()
+    assert not ingestion.put({'i': 3})
+    assert time.monotonic() - started >= 0.05
+    assert ingestion.stats['dropped'] == 1
+    release.set()
+    ingestion.stop()
+    assert ingestion.stats['written'] == 2
@@ -0,0 +1,102 @@
+import random
+import threading
+from array import array
+
+import pytest
+
+from bot.database import Pattern, SessionLocal
+from bot.language_model import ChatLanguageModel, LanguageModelIndex, Transitions
+from bot.repository import repository
+
+def test_transitions_rebuild_applies_pending():
+    transitions = Transitions()
+    transitions.set(1, 3)
+    transitions.set(2, 1)
+    transitions.rebuild()
+    assert transitions.arrays == (array('I', [1, 2]), array('Q', [3, 4]))
+
+    # Новая частота заменяет старую, нулевая убирает переход
+    transitions.set(1, 0)
+    transitions.set(3, 5)
+    transitions.rebuild()
+    assert transitions.arrays == (array('I', [2, 3]), array('Q', [1, 6]))
+    assert transitions.pending is None
+
+def test_sample_follows_weights():
+    transitions = Transitions()
+    transitions.set(1, 1)
+    transitions.set(2, 99)
+    transitions.rebuild()
+    rng = random.Random(1)
+    samples = [transitions.sample(rng) for _ in range(1000)]
+    assert samples.count(2) > 950
+    assert Transitions().sample(rng) is None
+
+def _model():
+    model = ChatLanguageModel()
+    model.add('word', 'хорошая', 5)
+    model.add('bigram', 'хорошая погода', 3)
+    model.add('bigram', 'погода сегодня', 3)
+    model.add('trigram', 'хорошая погода сегодня', 2)
+    return model
+
+def test_generate_uses_trigrams():
+    words, trigram_steps = _model().generate(seeds=['хорошая'], rng=random.Random(0))
+    assert words == ['хорошая', 'погода', 'сегодня']
+    assert trigram_steps == 1
+
+def test_generate_stops_on_repeats():
+    model = ChatLanguageModel()
+    model.add('bigram', 'снова снова', 1)
+    words, _ = model.generate(seeds=['снова'], max_words=10, rng=random.Random(0))
+    assert words == ['снова', 'снова']
+
+def test_generate_without_transitions():
+    assert ChatLanguageModel().generate(seeds=['что']) == ([], 0)
+
+def test_sampling_while_adding():
+    model = _model()
+    errors = []
+
+    def writer():
+        for i in range(2000):
+            model.add('bigram', f'погода слово{i % 50}', i)
+
+    def reader():
+        try:
+            for i in range(2000):
+                model.generate(seeds=['хорошая'], rng=random.Random(i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-700': 'Модель'})['-700']
+        db.add_all([
+            Pattern(chat_id=chat['id'], pattern_type='bigram', pattern_text='хорошая погода', frequency=2),
+            Pattern(chat_id=chat['id'], pattern_type='sticker', pattern_text='sticker', frequency=2),
+        ])
+        db.commit()
+    return chat['id']
+
+def test_index_loads_applies_and_invalidates(chat_pk):
+    index = LanguageModelIndex(max_chats=10)
+    with SessionLocal() as db:
+        model = index.get(chat_pk, db)
+        assert index.get(chat_pk, db) is model
+    assert model.generate(seeds=['хорошая'], rng=random.Random(0))[0] == ['хорошая', 'погода']
+
+    index.apply([(1, chat_pk, 'bigram', 'погода сегодня', 2), (2, chat_pk, 'sticker', 'x', 1)])
+    assert model.generate(seeds=['хорошая'], rng=random.Random(0))[0] == ['хорошая', 'погода', 'сегодня']
+
+    index.invalidate(chat_pk)
+    with SessionLocal() as db:
+        assert index.get(chat_pk, db) is not model
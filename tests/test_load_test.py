@@ -0,0 +1,49 @@
+from benchmarks.load_test import RU_WORDS, TrafficGenerator, compare, latency_summary, percentile, zipf_weights
+
+def _traffic(seed=42, **kwargs):
+    return [(message.chat.id, message.from_user.id, message.text)
+            for message in TrafficGenerator(chats=10, users=50, seed=seed, **kwargs).messages(300)]
+
+def test_traffic_is_reproducible():
+    assert _traffic() == _traffic()
+    assert _traffic() != _traffic(seed=43)
+
+def test_traffic_follows_zipf():
+    traffic = _traffic()
+    generator = TrafficGenerator(chats=10, users=50)
+    by_chat = [sum(1 for chat_id, _, _ in traffic if chat_id == generated) for generated in generator.chat_ids]
+    # Самый активный чат — первый по рангу
+    assert by_chat[0] == max(by_chat)
+    assert by_chat[0] > by_chat[-1]
+    assert all(text for _, _, text in traffic)
+
+def test_chat_language_and_members():
+    generator = TrafficGenerator(chats=4, users=50, english_share=0.0, catchphrase_rate=0.0)
+    for message in generator.messages(100):
+        chat_index = generator.chat_ids.index(message.chat.id)
+        assert message.from_user.id - 1 in generator.members[chat_index]
+        assert message.text.rstrip('!?.)').split()[0] in RU_WORDS
+
+def test_id_offset_separates_runs():
+    first, second = TrafficGenerator(chats=3), TrafficGenerator(chats=3, id_offset=1000)
+    assert not set(first.chat_ids) & set(second.chat_ids)
+
+def test_zipf_weights_and_latency_summary():
+    assert zipf_weights(3, 1.0) == [1.0, 1.5, 1.5 + 1 / 3]
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert latency_summary([0.001, 0.002, 0.010]) == {'count': 3, 'p50_ms': 2.0, 'p99_ms': 10.0, 'max_ms': 10.0}
+
+def test_compare(capsys):
+    baseline = {'commit': 'abc', 'dialect': 'sqlite', 'params': {'seed': 42},
+                'ingest': {'messages_per_s': 100.0, 'batch': {'p50_ms': 10.0}}}
+    current = {'commit': 'def', 'dialect': 'sqlite', 'params': {'seed': 42},
+               'ingest': {'messages_per_s': 150.0, 'batch': {'p50_ms': 12.0}}}
+    compare(baseline, current)
+    output = capsys.readouterr().out
+    assert 'ingest.messages_per_s' in output and '+50.0% ✅' in output
+    assert '+20.0% ⚠️' in output
+    assert 'различаются' not in output
+
+    compare(baseline, dict(current, params={'seed': 1}))
+    assert 'Прогоны различаются (params)' in capsys.readouterr().out
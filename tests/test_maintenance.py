@@ -0,0 +1,69 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import delete
+
+from bot.database import Pattern, SessionLocal, engine
+from bot.maintenance import MaintenanceThread, add_months, compact_patterns, month_start, partition_name, run_maintenance
+from bot.repository import repository
+
+NOW = datetime(2026, 3, 15, 12, 0)
+
+@pytest.mark.parametrize('month, count, expected', [
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), 25, date(2028, 4, 1)),
+])
+def test_add_months(month, count, expected):
+    assert add_months(month, count) == expected
+
+def test_partition_name():
+    assert month_start(NOW) == date(2026, 3, 1)
+    assert partition_name(date(2026, 3, 1)) == 'messages_p2026_03'
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-800': 'Обслуживание'})['-800']
+        db.add_all([
+            # Давно не встречался и редкий — удаляется
+            Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='старое',
+                    frequency=2, last_used=datetime(2025, 1, 1)),
+            # Давно не встречался, но частый
+            Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='частое',
+                    frequency=50, last_used=datetime(2025, 1, 1)),
+            # Редкий, но встречался недавно
+            Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='свежее',
+                    frequency=2, last_used=datetime(2026, 3, 10)),
+            # Без last_used срок считается от created_at
+            Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='неиспользованное',
+                    frequency=2, created_at=datetime(2025, 1, 1)),
+        ])
+        db.commit()
+    yield chat['id']
+    with SessionLocal() as db:
+        db.execute(delete(Pattern).where(Pattern.chat_id == chat['id']))
+        db.commit()
+
+def test_compact_patterns(chat_pk):
+    with engine.begin() as conn:
+        assert compact_patterns(conn, now=NOW, days=30, max_frequency=2) == [chat_pk]
+    with SessionLocal() as db:
+        left = db.query(Pattern.pattern_text).filter(Pattern.chat_id == chat_pk).all()
+    assert sorted(text for text, in left) == ['свежее', 'частое']
+
+def test_compact_patterns_disabled(chat_pk):
+    with engine.begin() as conn:
+        assert compact_patterns(conn, now=NOW, days=0, max_frequency=2) == []
+    with SessionLocal() as db:
+        assert db.query(Pattern).filter(Pattern.chat_id == chat_pk).count() == 4
+
+def test_maintenance_skips_sqlite(database):
+    assert run_maintenance(NOW) is None
+
+def test_thread_disabled_with_zero_interval():
+    thread = MaintenanceThread(interval=0)
+    thread.start()
+    assert thread._thread is None
+    thread.stop()
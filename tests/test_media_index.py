@@ -0,0 +1,74 @@
+import random
+
+import pytest
+from sqlalchemy import delete
+
+from bot.database import Pattern, SessionLocal
+from bot.media_index import ChatMediaIndex, MediaIndex, MediaReply, media_context
+from bot.repository import repository
+
+def test_rare_media_wait_in_recent():
+    index = ChatMediaIndex(top_k=5, min_frequency=2, max_entries=10, recent_size=10)
+    index.remember('u1', 'sticker', 'file-1')
+    assert len(index) == 0 and index.pick() is None
+
+    # Частота из выгрузки паттернов переносит медиа в индекс с запомненным file_id
+    index.add('u1', 'sticker', None, 2)
+    assert index.pick() == MediaReply('sticker', 'file-1')
+    assert len(index.recent) == 0
+
+    # Частота без file_id, которого не видели, ответом не станет
+    index.add('u2', 'sticker', None, 5)
+    assert len(index) == 1
+
+def test_remember_updates_file_id():
+    index = ChatMediaIndex(top_k=5, min_frequency=1)
+    index.add('u1', 'animation', 'old', 3)
+    index.remember('u1', 'animation', 'new')
+    assert index.top() == [MediaReply('animation', 'new')]
+
+def test_index_size_is_bounded():
+    index = ChatMediaIndex(top_k=2, min_frequency=1, max_entries=3, recent_size=2)
+    for i in range(10):
+        index.remember(f'rare{i}', 'sticker', f'file-rare{i}')
+        index.add(f'u{i}', 'sticker', f'file-{i}', i + 1)
+    assert len(index) == 3
+    assert len(index.recent) == 2
+    # Остаются самые частые
+    assert sorted(index.media) == ['u7', 'u8', 'u9']
+    assert index.top() == [MediaReply('sticker', 'file-9'), MediaReply('sticker', 'file-8')]
+
+def test_pick_follows_frequency():
+    index = ChatMediaIndex(top_k=5, min_frequency=1)
+    index.add('a', 'sticker', 'file-a', 1)
+    index.add('b', 'sticker', 'file-b', 99)
+    rng = random.Random(1)
+    picks = [index.pick(rng).file_id for _ in range(500)]
+    assert picks.count('file-b') > 450
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-900': 'Стикеры'})['-900']
+        db.add_all([Pattern(chat_id=chat['id'], pattern_type='sticker', pattern_text=f'u{i}',
+                            context=media_context(f'file-{i}'), frequency=i) for i in range(1, 6)]
+                   + [Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='кот', frequency=9)])
+        db.commit()
+    yield chat['id']
+    with SessionLocal() as db:
+        db.execute(delete(Pattern).where(Pattern.chat_id == chat['id']))
+        db.commit()
+
+def test_load_keeps_frequent_media(chat_pk, monkeypatch):
+    from bot.config import Config
+
+    monkeypatch.setattr(Config, 'MEDIA_MIN_FREQUENCY', 2)
+    monkeypatch.setattr(Config, 'MEDIA_INDEX_MAX_ENTRIES', 3)
+    media = MediaIndex(max_chats=10)
+    with SessionLocal() as db:
+        index = media.get(chat_pk, db)
+    assert sorted(index.media) == ['u3', 'u4', 'u5']
+
+    media.remember(chat_pk, [('sticker', 'u6', 'file-6')])
+    media.apply([(1, chat_pk, 'sticker', 'u6', 7), (2, chat_pk, 'word', 'кот', 10)])
+    assert index.top()[0] == MediaReply('sticker', 'file-6')
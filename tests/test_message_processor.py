@@ -0,0 +1,83 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, select, text
+
+from bot.database import SessionLocal, User, engine
+from bot.message_processor import MessageProcessor
+from bot.ngram_aggregator import NgramAggregator
+from bot.repository import repository
+
+def _row(message_id: int, chat_id: str = '-400', user_id: str = '40'):
+    return {'chat_id': chat_id, 'chat_title': 'Кэш', 'user_id': user_id, 'username': 'user',
+            'first_name': 'Имя', 'last_name': None, 'message_id': message_id,
+            'text': f'сообщение {message_id}', 'message_type': 'text',
+            'timestamp': datetime(2025, 8, 1, 12, message_id % 60), 'media_id': None, 'file_id': None}
+
+class _Queries:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@pytest.fixture(autouse=True, scope='module')
+def cleanup(database):
+    # БД общая на сессию: сообщения и статистика этих чатов не должны попасть в другие тесты
+    yield
+    with database.begin() as conn:
+        chats = "SELECT id FROM chats WHERE chat_id IN ('-400', '-401')"
+        for table in ('messages', 'statistics', 'patterns'):
+            conn.execute(text(f"DELETE FROM {table} WHERE chat_id IN ({chats})"))
+
+@pytest.fixture
+def queries():
+    listener = _Queries()
+    event.listen(engine, 'before_cursor_execute', listener)
+    yield listener.statements
+    event.remove(engine, 'before_cursor_execute', listener)
+
+def _message_count(user_id: str) -> int:
+    with SessionLocal() as db:
+        return db.execute(select(User.message_count).where(User.user_id == user_id)).scalar()
+
+def test_known_chats_and_users_come_from_cache(database, queries):
+    processor = MessageProcessor(flush_interval=3600)
+    with SessionLocal() as db:
+        processor.process_batch([_row(1)], db)
+        queries.clear()
+        processor.process_batch([_row(2)], db)
+    # Вторая пачка: только INSERT сообщений, без SELECT чатов и пользователей
+    assert not [statement for statement in queries if statement.lstrip().upper().startswith('SELECT')]
+
+def test_user_counters_survive_failed_commit(database):
+    processor = MessageProcessor(flush_interval=0)
+    with SessionLocal() as db:
+        processor.process_batch([_row(10, user_id='41')], db)
+        commit = db.commit
+
+        def broken():
+            raise RuntimeError('db down')
+
+        db.commit = broken
+        with pytest.raises(RuntimeError):
+            processor.process_batch([_row(11, user_id='41')], db)
+        db.commit = commit
+        processor.process_batch([_row(12, user_id='41')], db)
+        processor.flush(db)
+    # Откаченная пачка не считается, но приросты из первой не теряются
+    assert _message_count('41') == 2
+
+def test_reset_chat_drops_pending_deltas(database):
+    aggregator = NgramAggregator(flush_interval=3600, max_pending=1000)
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-401': 'Сброс'})['-401']
+        db.commit()
+        aggregator.add(chat['id'], 'word', Counter({'старое': 2}))
+        aggregator.add(chat['id'] + 1000, 'word', Counter({'чужое': 2}))
+        repository.reset_chat(db, chat)
+    assert aggregator.pending() == 1
+    with SessionLocal() as db:
+        rows = aggregator.flush(db)
+    assert [text for _, _, _, text, _ in rows] == ['чужое']
@@ -0,0 +1,52 @@
+from bot.metrics import Registry
+
+def _lines(registry: Registry):
+    return registry.render().splitlines()
+
+def test_counter_with_labels():
+    registry = Registry()
+    counter = registry.counter('test_events_total', 'События', ['kind'])
+    counter.labels('a').inc()
+    counter.labels('a').inc(2)
+    counter.labels('b').inc()
+    assert _lines(registry) == [
+        '# HELP test_events_total События',
+        '# TYPE test_events_total counter',
+        'test_events_total{kind="a"} 3.0',
+        'test_events_total{kind="b"} 1.0',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('test_seconds', 'Длительность', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    lines = _lines(registry)
+    assert lines[1] == '# TYPE test_seconds histogram'
+    assert lines[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 3.65',
+        'test_seconds_count 4',
+    ]
+
+def test_label_values_escaped():
+    registry = Registry()
+    registry.counter('test_total', 'Экранирование', ['path']).labels('a"b\\c\nd').inc()
+    assert _lines(registry)[-1] == 'test_total{path="a\\"b\\\\c\\nd"} 1.0'
+
+def test_collectors():
+    registry = Registry()
+    registry.register_collector('queue', lambda: [
+        ('test_queue_size', 'gauge', 'Длина очереди', [({}, 5), ({'name': 'x'}, 1)]),
+    ])
+    registry.register_collector('broken', lambda: 1 / 0)
+    assert _lines(registry) == [
+        '# HELP test_queue_size Длина очереди',
+        '# TYPE test_queue_size gauge',
+        'test_queue_size 5',
+        'test_queue_size{name="x"} 1',
+    ]
+    registry.unregister_collector('queue')
+    assert registry.render() == '\n'
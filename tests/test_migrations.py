@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, text
+
+from bot.migrations import LEGACY_TABLE, MIGRATIONS, applied_versions, migrate
+from tests.conftest import LEGACY_ROWS
+
+def test_all_migrations_applied(database):
+    with database.connect() as conn:
+        assert applied_versions(conn) == sorted(version for version, _, _ in MIGRATIONS)
+    # Повторный запуск ничего не делает
+    assert migrate() == []
+
+def test_legacy_messages_imported(database):
+    with database.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.chat_id, u.user_id, u.username, m.text
+            FROM messages m JOIN chats c ON c.id = m.chat_id JOIN users u ON u.id = m.user_id
+            ORDER BY m.timestamp
+        """)).all()
+        has_legacy = inspect(conn).has_table(LEGACY_TABLE)
+    assert [(chat_id, user_id, username, text_) for chat_id, user_id, username, text_ in rows] == [
+        (str(chat_id), str(user_id), username, message_text)
+        for chat_id, user_id, username, message_text, _ in LEGACY_ROWS
+    ]
+    # Сырая таблица удаляется после переноса
+    assert not has_legacy
+
+def test_statistics_backfilled(database):
+    with database.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.chat_id, s.date, s.total_messages
+            FROM statistics s JOIN chats c ON c.id = s.chat_id
+            ORDER BY c.chat_id, s.date
+        """)).all()
+    assert [(chat_id, str(day)[:10], total) for chat_id, day, total in rows] == [
+        ('-100', '2025-05-01', 2),
+        ('5', '2025-06-02', 1),
+    ]
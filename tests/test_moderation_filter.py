@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from bot.config import Config
+from bot.moderation_filter import ModerationFilter, normalize
+
+@pytest.fixture
+def moderation_filter():
+    return ModerationFilter(['ass', 'fuck', 'идиот', 'спам рассылка'], reload_interval=0)
+
+@pytest.mark.parametrize('text', [
+    'as far as I know',
+    'ask me',
+    'pass the salt',
+    'класс',
+    'идея',
+    'спам',
+])
+def test_clean_text(moderation_filter, text):
+    assert not moderation_filter.contains(text)
+    assert moderation_filter.find(text) == []
+
+@pytest.mark.parametrize('text', [
+    'ass',
+    'you ASS!',
+    'fuuuuck',
+    'fucking hell',
+    'ИДИОТЫ',
+    'ты идиооот',
+    'ты идиoт',  # латинская o
+    'и​диот',
+    'спам-рассылки',
+])
+def test_blacklisted_text(moderation_filter, text):
+    assert moderation_filter.contains(text)
+    assert moderation_filter.find(text)
+
+def test_short_term_is_whole_word_only(moderation_filter):
+    assert not moderation_filter.contains('asses')
+    assert not moderation_filter.contains('assist')
+
+def test_normalize():
+    assert normalize('Ёлки-палки!!  ЁЖ') == 'елки палки еж'
+    assert normalize('h3ll0 w0rld') == 'helo world'
+    assert normalize('aaa', collapse_repeats=False) == 'aaa'
+
+def test_empty_filter():
+    moderation_filter = ModerationFilter([], reload_interval=0)
+    assert not moderation_filter.contains('что угодно')
+    assert moderation_filter.find('что угодно') == []
+
+def test_reload_from_file(tmp_path):
+    path = tmp_path / 'blacklist.txt'
+    path.write_text('# комментарий\nспамер\n', encoding='utf-8')
+    moderation_filter = ModerationFilter(path=str(path), reload_interval=0)
+    assert moderation_filter.contains('он спамеры')
+    assert not moderation_filter.contains('мошенник')
+
+    path.write_text('мошенник\n', encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert moderation_filter.contains('мошенники')
+    assert not moderation_filter.contains('спамер')
+
+@pytest.fixture
+def config_filter():
+    return ModerationFilter(Config.BLACKLIST_WORDS, reload_interval=0)
+
+@pytest.mark.parametrize('text', [
+    'порнография',
+    'религиозный спор',
+    'расистский выпад',
+    'расисты',
+    'политический вопрос',
+    'о политике',
+    'националистический',
+    'экстремисты',
+    'наркотический',
+    'ксенофобы',
+])
+def test_config_blacklist_derived_forms(config_filter, text):
+    assert config_filter.contains(text)
+
+@pytest.mark.parametrize('text', [
+    'расписание',
+    'политолог',
+    'экстрим',
+    'национальный',
+    'наркоз',
+    'порода',
+    'полиция',
+])
+def test_config_blacklist_clean_words(config_filter, text):
+    assert not config_filter.contains(text)
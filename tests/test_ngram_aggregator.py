@@ -0,0 +1,80 @@
+import time
+from collections import Counter
+
+import pytest
+from sqlalchemy import delete, select
+
+from bot.database import Pattern, SessionLocal
+from bot.ngram_aggregator import NgramAggregator
+from bot.pattern_learner import repeated_counts
+from bot.repository import repository
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-300': 'n-граммы'})['-300']
+        db.commit()
+    return chat['id']
+
+def _patterns(chat_pk):
+    with SessionLocal() as db:
+        rows = db.execute(select(Pattern.pattern_type, Pattern.pattern_text, Pattern.frequency, Pattern.user_id)
+                          .where(Pattern.chat_id == chat_pk).order_by(Pattern.pattern_text)).all()
+    return [tuple(row) for row in rows]
+
+@pytest.fixture(autouse=True)
+def clean_patterns(chat_pk):
+    yield
+    with SessionLocal() as db:
+        db.execute(delete(Pattern).where(Pattern.chat_id == chat_pk))
+        db.commit()
+
+def test_repeated_counts():
+    assert repeated_counts(['a', 'b', 'a', 'c', 'a', 'b'], 2) == Counter({'a': 3, 'b': 2})
+
+def test_flush_sums_deltas_and_upserts(chat_pk):
+    aggregator = NgramAggregator(flush_interval=60, max_pending=100)
+    aggregator.add(chat_pk, 'word', Counter({'кот': 2, 'пес': 3}), user_id=1)
+    aggregator.add(chat_pk, 'word', Counter({'кот': 2}), user_id=2)
+    with SessionLocal() as db:
+        rows = aggregator.flush(db)
+    assert sorted((text, frequency) for _, _, _, text, frequency in rows) == [('кот', 4), ('пес', 3)]
+    assert aggregator.pending() == 0
+
+    aggregator.add(chat_pk, 'word', Counter({'кот': 2}), user_id=3)
+    with SessionLocal() as db:
+        aggregator.flush(db)
+    # Частоты в БД накапливаются, автор — первый увидевший паттерн
+    assert _patterns(chat_pk) == [('word', 'кот', 6, 1), ('word', 'пес', 3, 1)]
+
+def test_failed_flush_merges_deltas_back(chat_pk, monkeypatch):
+    aggregator = NgramAggregator(flush_interval=60, max_pending=100)
+    aggregator.add(chat_pk, 'bigram', Counter({'кот пес': 2}), user_id=1)
+
+    def broken(db, rows):
+        raise RuntimeError('db down')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(repository, 'upsert_patterns', broken)
+        with SessionLocal() as db, pytest.raises(RuntimeError):
+            aggregator.flush(db)
+    # Дельты, пришедшие во время неудачной выгрузки, складываются с возвращенными
+    aggregator.add(chat_pk, 'bigram', Counter({'кот пес': 2}), user_id=2)
+    assert aggregator.pending() == 1
+
+    with SessionLocal() as db:
+        aggregator.flush(db)
+    assert _patterns(chat_pk) == [('bigram', 'кот пес', 4, 1)]
+
+def test_should_flush():
+    aggregator = NgramAggregator(flush_interval=60, max_pending=2)
+    assert not aggregator.should_flush()
+    aggregator.add(1, 'word', Counter({'a': 2}))
+    assert not aggregator.should_flush()
+    aggregator.add(1, 'word', Counter({'b': 2}))
+    assert aggregator.should_flush()
+
+    aggregator = NgramAggregator(flush_interval=0.01, max_pending=100)
+    aggregator.add(1, 'word', Counter({'a': 2}))
+    time.sleep(0.02)
+    assert aggregator.should_flush()
@@ -0,0 +1,172 @@
+import math
+import random
+import threading
+
+import pytest
+from sqlalchemy import delete
+
+from bot.database import Pattern, SessionLocal
+import bot.pattern_index as pattern_index_module
+from bot.pattern_index import ChatPatternIndex, PatternIndex
+from bot.repository import repository
+
+def _index(patterns):
+    index = ChatPatternIndex()
+    for pattern_id, (text, frequency) in enumerate(patterns, start=1):
+        index.add(pattern_id, text, 'bigram' if ' ' in text else 'word', frequency)
+    return index
+
+def test_search_ranks_by_context():
+    index = _index([('погода', 3), ('хорошая погода', 3), ('кот', 3), ('кот спит', 3)])
+    assert index.search({'кот': 1.0})[:2] == [3, 4]
+    assert index.search({'погода': 1.0, 'хорошая': 1.0})[0] == 2
+    assert index.search({'неизвестно': 1.0}) == []
+    assert index.search({'кот': 1.0}, limit=0) == []
+
+def test_frequency_breaks_ties():
+    index = _index([('кот', 2), ('кот', 50)])
+    assert index.search({'кот': 1.0}) == [2, 1]
+    # Обновление частоты меняет порядок без перестройки индекса
+    index.add(1, 'кот', 'word', 500)
+    assert index.search({'кот': 1.0}) == [1, 2]
+    assert len(index) == 2
+
+def test_rare_tokens_weigh_more():
+    index = _index([('да', 5)] * 50 + [('да редкий', 5)])
+    assert index.search({'да': 1.0, 'редкий': 1.0}, limit=1) == [51]
+
+def test_limit():
+    index = _index([(f'слово{i} общее', i + 1) for i in range(30)])
+    result = index.search({'общее': 1.0}, limit=5)
+    assert result == [30, 29, 28, 27, 26]
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-500': 'Индекс'})['-500']
+        db.add_all([Pattern(chat_id=chat['id'], pattern_type='word', pattern_text='кот', frequency=3),
+                    Pattern(chat_id=chat['id'], pattern_type='bigram', pattern_text='кот спит', frequency=2),
+                    Pattern(chat_id=chat['id'], pattern_type='sticker', pattern_text='file', frequency=9)])
+        db.commit()
+    yield chat['id']
+    with SessionLocal() as db:
+        db.execute(delete(Pattern).where(Pattern.chat_id == chat['id']))
+        db.commit()
+
+def test_loads_chat_once_and_applies_updates(chat_pk):
+    patterns = PatternIndex(max_chats=10)
+    with SessionLocal() as db:
+        index = patterns.get(chat_pk, db)
+        assert patterns.get(chat_pk, db) is index
+        # Медиа-паттерны в текстовый индекс не попадают
+        assert sorted(text for text, _, _ in index.patterns.values()) == ['кот', 'кот спит']
+
+        patterns.apply([(10 ** 6, chat_pk, 'word', 'спит', 4), (10 ** 6 + 1, chat_pk, 'sticker', 'x', 1)])
+        assert [p.pattern_text for p in patterns.search(chat_pk, {'спит': 1.0}, db)][0] == 'спит'
+
+        patterns.invalidate(chat_pk)
+        assert patterns.get(chat_pk, db) is not index
+
+class _BlockingSession:
+    """Сессия, чей запрос ждет события: загрузка чата «висит»"""
+
+    def __init__(self, release: threading.Event = None):
+        self.release = release
+        self.entered = threading.Event()
+
+    def query(self, *columns):
+        return self
+
+    def filter(self, *conditions):
+        return self
+
+    def all(self):
+        self.entered.set()
+        if self.release is not None:
+            self.release.wait(5)
+        return []
+
+def test_slow_chat_load_does_not_block_other_chats():
+    patterns = PatternIndex(max_chats=10)
+    release = threading.Event()
+    slow = _BlockingSession(release)
+    thread = threading.Thread(target=patterns.get, args=(1, slow))
+    thread.start()
+    assert slow.entered.wait(5)
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (patterns.get(2, _BlockingSession()), done.set())).start()
+    try:
+        assert done.wait(1), 'загрузка другого чата ждала первую'
+    finally:
+        release.set()
+        thread.join(5)
+
+def _exhaustive_scores(index, context):
+    """Оценки всех паттернов по формуле ChatPatternIndex.search полным перебором"""
+    documents = len(index.patterns)
+    df = {token: len(rows) for token, rows in index._postings.items() if rows}
+    terms = {token: weight for token, weight in context.items() if token in df}
+    common = {token for token in terms if df[token] > max(1000, 0.05 * documents)}
+    if terms and common == set(terms):
+        common.discard(min(terms, key=df.get))
+    scores = {}
+    for pattern_id, (text, _, frequency) in index.patterns.items():
+        tokens = list(dict.fromkeys(text.split()))
+        score = sum(terms[token] * (math.log((documents + 1) / (df[token] + 1)) + 1) ** 2
+                    for token in tokens if token in terms and token not in common)
+        if score > 0:
+            scores[pattern_id] = round(score * math.log1p(frequency) / math.sqrt(len(tokens)), 9)
+    return scores
+
+def test_remove_updates_df_and_results():
+    index = _index([('кот', 3), ('кот спит', 3), ('пес', 3)])
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 2
+    assert index._df[index._tokens['кот']] == 1
+    assert index.search({'кот': 1.0}) == [2]
+    index.remove(2)
+    assert index.search({'кот': 1.0}) == []
+
+def test_apply_zero_frequency_removes_pattern():
+    patterns = PatternIndex(max_chats=10)
+    index = _index([('кот', 3), ('пес', 3)])
+    patterns._chats.set(1, index)
+    patterns.apply([(1, 1, 'word', 'кот', 0)])
+    assert index.search({'кот': 1.0, 'пес': 1.0}) == [2]
+
+def test_best_rows_follow_frequency_updates(monkeypatch):
+    monkeypatch.setattr(pattern_index_module, 'IMPACT_POSTINGS', 3)
+    index = _index([('кот', frequency) for frequency in (5, 4, 3, 2, 1)])
+    assert index.search({'кот': 1.0}, limit=3) == [1, 2, 3]
+    index.add(5, 'кот', 'word', 100)
+    index.add(6, 'кот', 'word', 50)
+    assert index.search({'кот': 1.0}, limit=3) == [5, 6, 1]
+
+def test_search_matches_exhaustive_scoring(monkeypatch):
+    # Маленький IMPACT_POSTINGS (но не меньше limit): у частых токенов в поиске участвует часть строк
+    monkeypatch.setattr(pattern_index_module, 'IMPACT_POSTINGS', 10)
+    rng = random.Random(3)
+    words = [f'с{i}' for i in range(12)]
+    index = ChatPatternIndex()
+
+    def add(pattern_id):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        index.add(pattern_id, text, 'word', rng.randint(1, 50))
+
+    for pattern_id in range(300):
+        add(pattern_id)
+    for step in range(200):
+        context = {word: rng.choice((0.5, 1.0, 2.0)) for word in rng.sample(words, 4)}
+        scores = _exhaustive_scores(index, context)
+        expected = sorted(scores.values(), reverse=True)[:10]
+        assert [scores[pattern_id] for pattern_id in index.search(context, limit=10)] == expected
+        # Между поисками паттерны добавляются, растут и удаляются
+        add(300 + step)
+        pattern_id = rng.choice(list(index.patterns))
+        if step % 3:
+            text, pattern_type, frequency = index.patterns[pattern_id]
+            index.add(pattern_id, text, pattern_type, frequency + rng.randint(1, 20))
+        else:
+            index.remove(pattern_id)
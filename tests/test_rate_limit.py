@@ -0,0 +1,93 @@
+import pytest
+
+from bot.rate_limit import LocalRateLimiter, RedisRateLimiter
+
+fakeredis = pytest.importorskip('fakeredis')
+
+NOW = 1_700_000_000.0
+
+@pytest.fixture(params=['local', 'redis'])
+def make_limiter(request):
+    server = fakeredis.FakeServer()
+
+    def make(**kwargs):
+        if request.param == 'local':
+            return LocalRateLimiter(**kwargs)
+        return RedisRateLimiter(client=fakeredis.FakeRedis(server=server), **kwargs)
+    return make
+
+def test_burst_then_refill(make_limiter):
+    limiter = make_limiter(interval=10, burst=2, daily_limit=0)
+    assert limiter.try_acquire('chat', NOW)
+    assert limiter.try_acquire('chat', NOW)
+    assert not limiter.try_acquire('chat', NOW + 1)
+    # Один токен восполняется за interval секунд
+    assert limiter.try_acquire('chat', NOW + 11)
+    assert not limiter.try_acquire('chat', NOW + 12)
+
+def test_keys_are_independent(make_limiter):
+    limiter = make_limiter(interval=10, burst=1, daily_limit=0)
+    assert limiter.try_acquire('a', NOW)
+    assert limiter.try_acquire('b', NOW)
+    assert not limiter.try_acquire('a', NOW)
+
+def test_zero_interval_is_unlimited(make_limiter):
+    limiter = make_limiter(interval=0, burst=1, daily_limit=0)
+    assert all(limiter.try_acquire('chat', NOW) for _ in range(20))
+
+def test_daily_limit_resets_next_day(make_limiter):
+    limiter = make_limiter(interval=0, burst=1, daily_limit=3)
+    assert [limiter.try_acquire('chat', NOW + i) for i in range(4)] == [True, True, True, False]
+    assert limiter.try_acquire('chat', NOW + 24 * 3600)
+
+def test_reset(make_limiter):
+    limiter = make_limiter(interval=60, burst=1, daily_limit=0)
+    assert limiter.try_acquire('chat')
+    assert not limiter.try_acquire('chat')
+    limiter.reset('chat')
+    assert limiter.try_acquire('chat')
+
+def test_redis_limit_shared_between_processes():
+    server = fakeredis.FakeServer()
+    first, second = (RedisRateLimiter(client=fakeredis.FakeRedis(server=server), interval=10, burst=1,
+                                      daily_limit=0) for _ in range(2))
+    assert first.try_acquire('chat', NOW)
+    assert not second.try_acquire('chat', NOW)
+
+def test_redis_unavailable_falls_back_to_local():
+    server = fakeredis.FakeServer()
+    limiter = RedisRateLimiter(client=fakeredis.FakeRedis(server=server), interval=10, burst=1, daily_limit=0)
+    server.connected = False
+    assert limiter.try_acquire('chat', NOW)
+    assert not limiter.try_acquire('chat', NOW)
+
+def test_rate_limiter_is_abstract():
+    from bot.rate_limit import RateLimiter
+
+    with pytest.raises(TypeError):
+        RateLimiter()
+
+def test_local_state_is_bounded():
+    limiter = LocalRateLimiter(interval=60, burst=1, daily_limit=0, max_keys=2)
+    assert limiter.try_acquire('a', NOW)
+    assert limiter.try_acquire('b', NOW)
+    assert not limiter.try_acquire('a', NOW)
+    assert limiter.try_acquire('c', NOW)
+    assert len(limiter._state) == 2
+    # Дольше всех неактивный ключ вытеснен: его лимит начинается заново
+    assert limiter.try_acquire('b', NOW)
+
+def test_redis_outage_logged_once(caplog):
+    server = fakeredis.FakeServer()
+    limiter = RedisRateLimiter(client=fakeredis.FakeRedis(server=server), interval=0, burst=1, daily_limit=0)
+    server.connected = False
+    with caplog.at_level('INFO', logger='bot.rate_limit'):
+        for _ in range(5):
+            assert limiter.try_acquire('chat', NOW)
+        server.connected = True
+        assert limiter.try_acquire('chat', NOW)
+        server.connected = False
+        assert limiter.try_acquire('chat', NOW)
+    warnings = [record for record in caplog.records if record.levelname == 'WARNING']
+    assert len(warnings) == 2
+    assert any('снова доступен' in record.getMessage() for record in caplog.records)
@@ -0,0 +1,77 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bot import readiness
+from bot.config import Config
+from bot.metrics import registry, start_http_server
+
+@pytest.fixture
+def fresh_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(readiness, '_ready', threading.Event())
+    monkeypatch.setattr(readiness, '_startup_seconds', None)
+    monkeypatch.setattr(Config, 'READY_FILE', str(tmp_path / 'ready'))
+    monkeypatch.delenv('NOTIFY_SOCKET', raising=False)
+    return tmp_path / 'ready'
+
+def _status(server, path='/ready'):
+    url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_ready_endpoint_file_and_gauge(fresh_state):
+    server = start_http_server(0, host='127.0.0.1')
+    try:
+        assert _status(server) == 503
+        assert 'chatclone_ready 0' in registry.render()
+
+        readiness.mark_ready()
+        assert _status(server) == 200
+        assert fresh_state.read_text() == f"{os.getpid()}\n"
+        assert 'chatclone_ready 1' in registry.render()
+        assert readiness.startup_seconds() == readiness.startup_seconds()
+
+        readiness.mark_stopping()
+        assert _status(server) == 503
+        assert not fresh_state.exists()
+        assert _status(server, '/missing') == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_sd_notify(fresh_state, monkeypatch, tmp_path):
+    address = str(tmp_path / 'notify.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(address)
+        sock.settimeout(5)
+        monkeypatch.setenv('NOTIFY_SOCKET', address)
+        readiness.mark_ready()
+        assert sock.recv(64) == b'READY=1'
+        # Повторная отметка ничего не отправляет
+        readiness.mark_ready()
+        readiness.mark_stopping()
+        assert sock.recv(64) == b'STOPPING=1'
+
+def test_warm_up_loads_modules():
+    sys.modules.pop('colorsys', None)
+    readiness.warm_up('colorsys', 'no_such_module_for_warm_up').join(5)
+    assert 'colorsys' in sys.modules
+
+def test_worker_import_skips_heavy_modules():
+    from benchmarks.bench_startup import FORBIDDEN
+
+    env = dict(os.environ, TELEGRAM_TOKEN='123:test', DATABASE_URL='sqlite://')
+    script = ("import sys; import bot.main; "
+              f"print(','.join(name for name in {FORBIDDEN!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,54 @@
+from bot.invalidation import PATTERNS_REBUILT, InvalidationListener
+from bot.relearn import PatternRebuild, learn_chunk
+
+class _Writer:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+def test_learn_chunk_counts_repeats_per_chat():
+    chunk = [
+        (1, [('кофе кофе утром', 10), ('кофе кофе снова', 11)]),
+        (2, [('чай чай', None), ('погода', 20)]),
+    ]
+    seq, result = learn_chunk(3, chunk, min_count=2)
+    assert seq == 3
+    assert result[1] == {('word', 'кофе'): [4, 3, 10]}
+    assert result[2] == {('word', 'чай'): [2, 3, None]}
+
+def test_rebuild_merges_chunks_and_spills_finished_chats():
+    writer = _Writer()
+    rebuild = PatternRebuild(writer)
+    first = [(1, [('кофе кофе', 10)])]
+    second = [(1, [('кофе кофе', 11)]), (2, [('чай чай', 20)])]
+    rebuild.submitted(first, 1)
+    rebuild.submitted(second, 2)
+
+    # Вторая пачка посчитана раньше первой: автор паттерна — из более ранней пачки
+    rebuild.merge(learn_chunk(1, second, 2)[1])
+    assert writer.rows == []
+    rebuild.merge(learn_chunk(0, first, 2)[1])
+    assert [row[:5] for row in writer.rows] == [(1, 10, 'кофе', 'word', 4)]
+
+    # Чат 2 еще читается, пока поток пачек не закончился
+    rebuild.done_streaming = True
+    rebuild.spill()
+    assert [row[:5] for row in writer.rows[1:]] == [(2, 20, 'чай', 'word', 2)]
+    assert rebuild.chats == 2
+
+def test_rebuilt_signal_clears_pattern_caches(monkeypatch):
+    from bot.language_model import language_model
+    from bot.media_index import media_index
+    from bot.pattern_index import pattern_index
+
+    for index in (pattern_index, language_model, media_index):
+        monkeypatch.setattr(index, '_chats', type(index._chats)(maxsize=10))
+        index._chats.set(1, object())
+
+    listener = InvalidationListener(dsn='postgresql://unused')
+    listener.handle({'type': 'messages'})
+    assert all(len(index._chats) == 1 for index in (pattern_index, language_model, media_index))
+    listener.handle({'type': PATTERNS_REBUILT})
+    assert all(len(index._chats) == 0 for index in (pattern_index, language_model, media_index))
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select, text
+
+from bot.database import SessionLocal, Statistic
+from bot.repository import repository
+from bot.stats_rollup import StatsRollup
+
+DAY = datetime(2025, 9, 1, 15, 30)
+
+@pytest.fixture
+def chat_pk(database):
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-600': 'Статистика'})['-600']
+        db.commit()
+    yield chat['id']
+    # БД общая на сессию: строки statistics этого чата видны другим тестам
+    with database.begin() as conn:
+        conn.execute(text('DELETE FROM statistics WHERE chat_id = :chat_id'), {'chat_id': chat['id']})
+
+def _row(chat_pk: int):
+    with SessionLocal() as db:
+        return db.execute(select(
+            Statistic.date, Statistic.total_messages, Statistic.bot_responses,
+            Statistic.avg_response_time, Statistic.personality_level
+        ).where(Statistic.chat_id == chat_pk)).one()
+
+def test_flushes_add_to_daily_row(chat_pk):
+    rollup = StatsRollup(flush_interval=3600)
+    rollup.record_message(chat_pk, personality_level=2, when=DAY)
+    rollup.record_message(chat_pk, when=DAY)
+    rollup.record_response(chat_pk, 1.0, when=DAY)
+    with SessionLocal() as db:
+        assert rollup.flush(db) == 1
+
+    rollup.record_message(chat_pk, when=DAY.replace(hour=20))
+    rollup.record_response(chat_pk, 2.0, when=DAY)
+    rollup.record_response(chat_pk, 3.0, when=DAY)
+    with SessionLocal() as db:
+        rollup.flush(db)
+
+    day, messages, responses, average, level = _row(chat_pk)
+    assert str(day)[:10] == '2025-09-01'
+    assert (messages, responses, level) == (3, 3, 2)
+    # Среднее взвешено по числу ответов: (1 + 2 + 3) / 3
+    assert average == pytest.approx(2.0)
+
+def test_failed_flush_merges_back(chat_pk):
+    rollup = StatsRollup(flush_interval=3600)
+    rollup.record_message(chat_pk, personality_level=1, when=DAY)
+    with SessionLocal() as db:
+        def broken():
+            raise RuntimeError('db down')
+
+        db.commit = broken
+        with pytest.raises(RuntimeError):
+            rollup.flush(db)
+
+    rollup.record_message(chat_pk, when=DAY)
+    with SessionLocal() as db:
+        rollup.flush(db)
+    assert _row(chat_pk)[1] == 2
+
+def test_should_flush():
+    rollup = StatsRollup(flush_interval=0)
+    assert not rollup.should_flush()
+    rollup.record_message(1, when=DAY)
+    assert rollup.should_flush()
+    assert not StatsRollup(flush_interval=3600).should_flush()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from web.stream import EventBroker, format_sse
+
+class _Broker(EventBroker):
+    """Брокер без соединения LISTEN: события публикуются из теста"""
+
+    def _listen(self):
+        pass
+
+@pytest.fixture
+def broker():
+    return _Broker('postgresql://unused', max_clients=2, client_queue_size=2)
+
+def test_subscribe_limited_by_max_clients(broker):
+    first, second = broker.subscribe(), broker.subscribe()
+    assert first is not None and second is not None
+    assert broker.subscribe() is None
+    broker.unsubscribe(first)
+    assert broker.subscribe() is not None
+
+def test_publish_reaches_every_client(broker):
+    clients = [broker.subscribe(), broker.subscribe()]
+    broker.publish({'type': 'message', 'text': 'привет'})
+    assert [client.get_nowait()['text'] for client in clients] == ['привет', 'привет']
+
+def test_slow_client_loses_events(broker):
+    slow, fast = broker.subscribe(), broker.subscribe()
+    for i in range(3):
+        broker.publish({'type': 'message', 'id': i})
+        fast.get_nowait()
+    # Очередь на 2 события: третье медленный клиент теряет, быстрый получает все
+    assert [slow.get_nowait()['id'] for _ in range(slow.qsize())] == [0, 1]
+
+def test_stats_published_only_after_events(broker):
+    calls = []
+    broker.stats_provider = lambda: calls.append(1) or {'total': len(calls)}
+    broker.stats_interval = 0
+    client = broker.subscribe()
+
+    broker._maybe_publish_stats()
+    assert client.empty()
+    broker._stats_dirty = True
+    broker._maybe_publish_stats()
+    broker._maybe_publish_stats()
+    assert calls == [1]
+    assert client.get_nowait() == {'type': 'stats', 'total': 1}
+
+def test_stats_error_is_logged(broker, caplog):
+    def broken():
+        raise RuntimeError('db down')
+
+    broker.stats_provider = broken
+    broker._stats_dirty = True
+    broker._maybe_publish_stats()
+    assert 'db down' in caplog.text
+
+def test_format_sse():
+    event = {'type': 'message', 'text': 'привет'}
+    frame = format_sse(event)
+    assert frame.startswith('event: message\ndata: ')
+    assert frame.endswith('\n\n')
+    assert json.loads(frame.split('data: ', 1)[1]) == event
+    assert format_sse({'id': 1}).startswith('event: message\n')
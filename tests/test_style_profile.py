@@ -0,0 +1,63 @@
+import pytest
+
+from bot.style_profile import SpaceSaving, StyleProfile
+
+def test_space_saving_keeps_k_counters():
+    summary = SpaceSaving(3)
+    summary.update(['a', 'b', 'c', 'd', 'e'])
+    assert len(summary) == 3
+
+def test_space_saving_evicts_minimum():
+    summary = SpaceSaving(2)
+    summary.update(['a', 'a', 'a', 'b', 'c'])
+    # b (счетчик 1) вытеснен: c наследует его счетчик с ошибкой 1
+    assert summary.counts == {'a': 3, 'c': 2}
+    assert summary.errors == {'a': 0, 'c': 1}
+
+def test_space_saving_never_undercounts():
+    stream = ['hot'] * 50 + [f'cold{i}' for i in range(200)] + ['warm'] * 30
+    summary = SpaceSaving(8)
+    summary.update(stream)
+    for item, count in summary.counts.items():
+        assert count - summary.errors[item] <= stream.count(item) <= count
+    # Оценки завышены не больше чем на ошибку, поэтому частые элементы остаются в top
+    assert {item for item, _ in summary.top(2)} == {'hot', 'warm'}
+
+def test_space_saving_eviction_after_halve():
+    summary = SpaceSaving(2)
+    summary.update(['a'] * 4 + ['b'] * 2)
+    summary.halve()
+    summary.update(['c'])
+    assert summary.counts == {'a': 2, 'c': 2}
+
+def _profile() -> StyleProfile:
+    profile = StyleProfile()
+    profile.observe('Привет всем!', ['привет', 'всем'], ['привет всем'])
+    profile.observe('как дела?', ['как', 'дела'], ['как дела'])
+    profile.observe('Отлично 😀', ['отлично'])
+    profile.observe('привет, как дела...', ['привет', 'как', 'дела'], ['как дела'])
+    return profile
+
+def test_style_profile_round_trip():
+    profile = _profile()
+    restored = StyleProfile.from_bytes(profile.to_bytes())
+    for field in ('messages', 'words_total', 'chars_total', 'capitalized', 'lengths', 'endings', 'marks'):
+        assert getattr(restored, field) == getattr(profile, field), field
+    for field in ('words', 'phrases', 'emoji'):
+        original, copy = getattr(profile, field), getattr(restored, field)
+        assert copy.counts == original.counts
+        assert copy.errors == original.errors
+    assert restored.top_phrases(1) == ['как дела']
+    assert restored.sample_ending() is not None
+
+def test_style_profile_skips_long_items():
+    profile = StyleProfile()
+    profile.observe('слово', ['x' * 300, 'слово'])
+    restored = StyleProfile.from_bytes(profile.to_bytes())
+    assert restored.top_words() == ['слово']
+
+def test_style_profile_rejects_unknown_format():
+    data = bytearray(StyleProfile().to_bytes())
+    data[0:2] = b'XX'
+    with pytest.raises(ValueError):
+        StyleProfile.from_bytes(bytes(data))
@@ -0,0 +1,32 @@
+from bot.tokenizer import MIN_TOKEN_LENGTH, extract_ngrams, ngrams, tokenize
+
+def test_tokenize_drops_stopwords_and_short_words():
+    assert tokenize('Я и ты пьем КОФЕ, а он — чай!') == ['пьем', 'кофе', 'чай']
+    assert all(len(token) >= MIN_TOKEN_LENGTH for token in tokenize('ok да нет кот'))
+
+def test_tokenize_keeps_inner_hyphen_and_apostrophe():
+    assert tokenize("кто-то любит rock'n'roll") == ['кто-то', 'любит', "rock'n'roll"]
+
+def test_tokenize_empty():
+    assert tokenize('') == []
+    assert tokenize(None) == []
+
+def test_tokens_are_interned():
+    first, = tokenize('погода')
+    second, = tokenize('ПОГОДА')
+    assert first is second
+
+def test_ngrams():
+    tokens = ['один', 'два', 'три', 'четыре']
+    assert ngrams(tokens, 1) is tokens
+    assert ngrams(tokens, 2) == ['один два', 'два три', 'три четыре']
+    assert ngrams(tokens, 3) == ['один два три', 'два три четыре']
+    assert ngrams(tokens, 4) == ['один два три четыре']
+    assert ngrams(tokens[:1], 2) == []
+
+def test_extract_ngrams():
+    unigrams, bigrams, trigrams = extract_ngrams('хорошая погода сегодня утром')
+    assert unigrams == ['хорошая', 'погода', 'сегодня', 'утром']
+    assert bigrams == ['хорошая погода', 'погода сегодня', 'сегодня утром']
+    assert trigrams == ['хорошая погода сегодня', 'погода сегодня утром']
+    assert extract_ngrams('кофе') == (['кофе'], [], [])
@@ -0,0 +1,67 @@
+import pytest
+
+import web.app as web_app
+from web.app import app, cached_json
+
+@pytest.fixture
+def client(database):
+    web_app._response_cache.clear()
+    yield app.test_client()
+    web_app._response_cache.clear()
+
+def test_cached_json_calls_producer_once():
+    web_app._response_cache.clear()
+    calls = []
+
+    def producer():
+        calls.append(1)
+        return {'value': len(calls)}
+
+    with app.test_request_context('/'):
+        first = cached_json('test', producer)
+        second = cached_json('test', producer)
+    assert calls == [1]
+    assert first.get_data() == second.get_data()
+    assert first.get_etag() == second.get_etag()
+    assert first.cache_control.max_age == web_app.STATS_CACHE_TTL
+    web_app._response_cache.clear()
+
+def test_stats_etag_returns_not_modified(client):
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    etag, _ = response.get_etag()
+    assert 'statistics' in response.get_json()
+
+    repeated = client.get('/api/stats', headers={'If-None-Match': f'"{etag}"'})
+    assert repeated.status_code == 304
+    assert repeated.get_data() == b''
+
+def test_stats_served_from_cache(client, monkeypatch):
+    client.get('/api/stats')
+
+    def broken():
+        raise AssertionError('статистика должна браться из кэша')
+
+    monkeypatch.setattr(web_app, 'load_stats', broken)
+    assert client.get('/api/stats').status_code == 200
+
+def test_message_count_cached(client, monkeypatch):
+    count = web_app.count_messages()
+    assert count is not None
+    monkeypatch.setattr(web_app, 'get_repository', lambda: pytest.fail('счетчик должен браться из кэша'))
+    assert web_app.count_messages() == count
+
+def test_health_uses_shared_pool(client):
+    data = client.get('/api/health').get_json()
+    assert (data['status'], data['database']) == ('healthy', 'connected')
+
+def test_health_degraded_without_database(client, monkeypatch):
+    class Broken:
+        def ping(self, conn):
+            from sqlalchemy.exc import OperationalError
+            raise OperationalError('SELECT 1', {}, Exception('down'))
+
+    monkeypatch.setattr(web_app, 'get_repository', Broken)
+    response = client.get('/api/health')
+    assert response.status_code == 503
+    assert response.get_json()['database'] == 'disconnected'
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import LEGACY_ROWS
+from web.app import MESSAGES_MAX_PAGE_SIZE, app, decode_cursor, encode_cursor
+
+# Сообщения отдельного чата; третье и четвертое с одинаковым временем
+# оказываются на разных страницах при limit=2 — порядок решает id
+PAGE_TEXTS = ['первое', 'второе', 'третье', 'четвертое', 'пятое']
+PAGE_MINUTES = [0, 1, 2, 2, 3]
+
+@pytest.fixture(scope='module')
+def chat_pk(database):
+    from bot.database import SessionLocal
+    from bot.repository import repository
+
+    start = datetime(2025, 7, 1, 12, 0)
+    with SessionLocal() as db:
+        chat = repository.ensure_chats(db, {'-200': 'Страницы'})['-200']
+        repository.insert_messages(db, [
+            {'chat_id': chat['id'], 'user_id': None, 'message_id': i, 'text': text,
+             'message_type': 'text', 'timestamp': start + timedelta(minutes=PAGE_MINUTES[i]),
+             'is_processed': False, 'has_reaction': False}
+            for i, text in enumerate(PAGE_TEXTS)
+        ])
+        db.commit()
+    return chat['id']
+
+@pytest.fixture
+def client(database):
+    return app.test_client()
+
+def test_cursor_round_trip():
+    timestamp = datetime(2025, 5, 1, 10, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2025, 1, 1), 10 ** 12)
+    assert all(char.isalnum() or char in '-_=' for char in cursor)
+
+def _all_pages(client, query: str):
+    texts = []
+    cursor = None
+    for _ in range(20):
+        data = client.get(f'/api/messages?{query}' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        texts.extend(message['text'] for message in data['messages'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            return texts
+    pytest.fail('курсор не продвигается')
+
+def test_pages_follow_cursor(client, chat_pk):
+    # Новые сообщения первыми, без повторов и пропусков
+    assert _all_pages(client, f'chat_id={chat_pk}&limit=2') == list(reversed(PAGE_TEXTS))
+
+def test_pages_include_imported_messages(client, chat_pk):
+    expected = list(reversed(PAGE_TEXTS)) + [row[3] for row in reversed(LEGACY_ROWS)]
+    assert _all_pages(client, 'limit=2') == expected
+
+@pytest.mark.parametrize('limit', ['0', '-3'])
+def test_limit_at_least_one(client, limit):
+    response = client.get(f'/api/messages?limit={limit}')
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
+
+def test_limit_capped(client, chat_pk):
+    data = client.get(f'/api/messages?chat_id={chat_pk}&limit={MESSAGES_MAX_PAGE_SIZE * 10}').get_json()
+    assert data['count'] == len(PAGE_TEXTS)
+    assert data['next_cursor'] is None
+
+@pytest.mark.parametrize('query', ['limit=abc', 'cursor=not-a-cursor', 'since=yesterday'])
+def test_invalid_parameters(client, query):
+    assert client.get(f'/api/messages?{query}').status_code == 400
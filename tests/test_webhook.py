@@ -0,0 +1,69 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import bot.webhook as webhook
+from bot.webhook import WebhookDispatcher
+
+def _update(update_id: int, text: str = 'привет') -> str:
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'text': text,
+        'chat': {'id': -100, 'type': 'group', 'title': 'Чат'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'Имя'},
+    }})
+
+class _FakeBot:
+    """SimpleBot с TeleBot, который только запоминает обновления"""
+
+    def __init__(self):
+        self.updates = []
+        self.bot = SimpleNamespace(process_new_updates=self.updates.extend)
+
+def test_updates_processed_by_workers():
+    bot = _FakeBot()
+    dispatcher = WebhookDispatcher(bot, workers=2, max_size=10)
+    dispatcher.start()
+    for update_id in range(5):
+        assert dispatcher.submit(_update(update_id))
+    # stop дожидается обработки всего принятого
+    dispatcher.stop()
+    assert sorted(update.update_id for update in bot.updates) == list(range(5))
+    assert dispatcher.stats == {'accepted': 5, 'rejected': 0, 'processed': 5, 'failed': 0}
+
+def test_full_queue_rejects():
+    dispatcher = WebhookDispatcher(_FakeBot(), workers=1, max_size=2)
+    assert dispatcher.submit(_update(1))
+    assert dispatcher.submit(_update(2))
+    assert not dispatcher.submit(_update(3))
+    assert dispatcher.stats['rejected'] == 1
+
+def test_broken_update_does_not_stop_worker():
+    bot = _FakeBot()
+    dispatcher = WebhookDispatcher(bot, workers=1, max_size=10)
+    dispatcher.start()
+    dispatcher.submit('{не json')
+    dispatcher.submit(_update(7))
+    dispatcher.stop()
+    assert [update.update_id for update in bot.updates] == [7]
+    assert dispatcher.stats['failed'] == 1
+
+@pytest.fixture
+def client(monkeypatch):
+    from web.app import app
+
+    monkeypatch.setenv('WEBHOOK_SECRET', 'secret')
+    return app.test_client()
+
+def test_route_requires_secret(client):
+    response = client.post('/telegram/webhook', data=_update(1),
+                           headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+    assert response.status_code == 403
+
+def test_route_answers_busy_when_queue_full(client, monkeypatch):
+    dispatcher = WebhookDispatcher(_FakeBot(), workers=1, max_size=1)
+    monkeypatch.setattr(webhook, '_dispatcher', dispatcher)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+    assert client.post('/telegram/webhook', data=_update(1), headers=headers).status_code == 200
+    # Telegram повторит доставку после 503
+    assert client.post('/telegram/webhook', data=_update(2), headers=headers).status_code == 503
@@ -1,43 +1,92 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, Response, jsonify, render_template, request
 from flask_cors import CORS
+import base64
+import hashlib
+import hmac
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import json
+from sqlalchemy.exc import SQLAlchemyError
+
+from bot.cache import LRUCache
+from web.stream import EventBroker, format_sse
 
 app = Flask(__name__)
 CORS(app)
 
-# Получение URL базы данных
-def get_db_url():
-    db_url = os.environ.get('DATABASE_URL', '')
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
-    return db_url
+# Время жизни закэшированных ответов статистики, секунды
+STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 5))
+
+_response_cache = LRUCache(maxsize=64, ttl=STATS_CACHE_TTL)
+_response_lock = threading.Lock()
 
-def get_db_connection():
-    """Получение соединения с БД"""
+class DatabaseUnavailable(Exception):
+    pass
+
+@contextmanager
+def db_connection():
+    """Соединение из общего пула bot.database (тот же слой данных, что у бота)"""
     try:
-        conn = psycopg2.connect(get_db_url(), sslmode='require')
-        return conn
+        from bot.database import engine
+        conn = engine.connect()
     except Exception as e:
         print(f"Database connection error: {e}")
+        raise DatabaseUnavailable() from e
+    with conn:
+        yield conn
+
+def get_repository():
+    from bot.repository import repository
+    return repository
+
+def cached_json(key, producer):
+    """JSON-ответ из кэша с ETag и Cache-Control"""
+    payload = _response_cache.get(key)
+    if payload is None:
+        with _response_lock:
+            payload = _response_cache.get(key)
+            if payload is None:
+                body = app.json.dumps(producer())
+                etag = hashlib.md5(body.encode()).hexdigest()
+                payload = (body, etag)
+                _response_cache.set(key, payload)
+    
+    body, etag = payload
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = STATS_CACHE_TTL
+    return response
+
+def count_messages():
+    """Количество сообщений (кэшируется вместе со статистикой)"""
+    cached = _response_cache.get('message_count')
+    if cached is not None:
+        return cached
+    
+    try:
+        with db_connection() as conn:
+            # Сумма дневных счетчиков вместо COUNT(*) по messages
+            message_count = get_repository().message_total(conn)
+    except DatabaseUnavailable:
         return None
+    
+    _response_cache.set('message_count', message_count)
+    return message_count
 
 @app.route('/')
 def index():
     """Главная страница с healthcheck"""
     try:
         # Проверка подключения к БД
-        conn = get_db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) as count FROM messages")
-                result = cur.fetchone()
-                message_count = result[0] if result else 0
-            conn.close()
-            
+        message_count = count_messages()
+        if message_count is not None:
             return render_template('index.html', 
                                  status='healthy',
                                  message_count=message_count,
@@ -59,13 +108,10 @@ def health():
     """API healthcheck для Railway"""
     try:
         # Проверка БД
-        conn = get_db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-                db_ok = cur.fetchone() is not None
-            conn.close()
-        else:
+        try:
+            with db_connection() as conn:
+                db_ok = get_repository().ping(conn)
+        except (DatabaseUnavailable, SQLAlchemyError):
             db_ok = False
         
         return jsonify({
@@ -81,75 +127,163 @@ def health():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+def load_stats():
+    """Статистика из БД"""
+    repository = get_repository()
+    with db_connection() as conn:
+        # Общая статистика и активность по дням из дневных счетчиков (O(чатов × дней) строк)
+        stats = repository.dashboard_stats(conn)
+        daily_stats = repository.daily_activity(conn, days=7)
+    
+    return {
+        "statistics": stats,
+        "daily_activity": daily_stats,
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.route('/api/stats')
 def stats():
     """Статистика"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database not available"}), 503
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Общая статистика
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_messages,
-                    COUNT(DISTINCT chat_id) as total_chats,
-                    COUNT(DISTINCT user_id) as total_users,
-                    MAX(created_at) as last_message
-                FROM messages
-            """)
-            stats = cur.fetchone()
-            
-            # Активность по дням
-            cur.execute("""
-                SELECT 
-                    DATE(created_at) as date,
-                    COUNT(*) as messages
-                FROM messages 
-                WHERE created_at > CURRENT_DATE - INTERVAL '7 days'
-                GROUP BY DATE(created_at)
-                ORDER BY date DESC
-            """)
-            daily_stats = cur.fetchall()
-        
-        conn.close()
-        
-        return jsonify({
-            "statistics": stats,
-            "daily_activity": daily_stats,
-            "timestamp": datetime.now().isoformat()
-        })
+        return cached_json('stats', load_stats)
+    except DatabaseUnavailable:
+        return jsonify({"error": "Database not available"}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Размер страницы /api/messages
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+def encode_cursor(timestamp, message_id):
+    """Курсор страницы: позиция последней строки (timestamp, id)"""
+    raw = f"{timestamp.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    timestamp, message_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(timestamp), int(message_id)
+
 @app.route('/api/messages')
 def get_messages():
-    """Получение последних сообщений"""
+    """Лента сообщений с keyset-пагинацией
+
+    Параметры: chat_id, user_id, since, until (ISO 8601), limit, cursor.
+    Каждая страница — один проход по индексу (timestamp, id) без OFFSET.
+    """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database not available"}), 503
+        filters = {}
+        try:
+            if request.args.get('chat_id'):
+                filters['chat_id'] = int(request.args['chat_id'])
+            if request.args.get('user_id'):
+                filters['user_id'] = int(request.args['user_id'])
+            if request.args.get('since'):
+                filters['since'] = datetime.fromisoformat(request.args['since'])
+            if request.args.get('until'):
+                filters['until'] = datetime.fromisoformat(request.args['until'])
+            if request.args.get('cursor'):
+                filters['after'] = decode_cursor(request.args['cursor'])
+            limit = max(1, min(int(request.args.get('limit', MESSAGES_PAGE_SIZE)), MESSAGES_MAX_PAGE_SIZE))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid parameter: {e}"}), 400
         
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT 
-                    id, chat_id, user_id, text, created_at
-                FROM messages 
-                ORDER BY created_at DESC 
-                LIMIT 50
-            """)
-            messages = cur.fetchall()
+        try:
+            with db_connection() as conn:
+                # Лишняя строка показывает, есть ли следующая страница
+                messages = get_repository().messages_page(conn, limit=limit + 1, **filters)
+        except DatabaseUnavailable:
+            return jsonify({"error": "Database not available"}), 503
         
-        conn.close()
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            last = messages[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
         
         return jsonify({
             "messages": messages,
-            "count": len(messages)
+            "count": len(messages),
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Живая лента: одно LISTEN-соединение на воркер, события раздаются всем клиентам
+STREAM_STATS_INTERVAL = float(os.environ.get('STREAM_STATS_INTERVAL', 5))
+STREAM_HEARTBEAT = 15
+# SSE-клиентов на процесс: каждый держит поток gunicorn (--threads в Procfile)
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', 8))
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                from bot.config import Config
+                connect_kwargs = {'sslmode': Config.DB_SSLMODE} if Config.DB_SSLMODE else {}
+                _broker = EventBroker(Config.DATABASE_URL, connect_kwargs,
+                                      stats_provider=load_stats,
+                                      stats_interval=STREAM_STATS_INTERVAL,
+                                      max_clients=STREAM_MAX_CLIENTS)
+    return _broker
+
+@app.route('/api/stream')
+def stream():
+    """Server-Sent Events: новые сообщения и обновленная статистика"""
+    broker = get_broker()
+    client = broker.subscribe()
+    if client is None:
+        # Лимит клиентов: свободные потоки нужны webhook и /api/health
+        return jsonify({"error": "Too many stream clients"}), 503, {'Retry-After': '30'}
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = client.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(client)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Метрики Prometheus этого процесса: этапы обработки, запросы к БД, очереди"""
+    from bot.metrics import CONTENT_TYPE, registry
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Приём обновлений Telegram (альтернатива long polling)"""
+    secret = os.environ.get('WEBHOOK_SECRET', '')
+    received = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not secret or not hmac.compare_digest(received, secret):
+        return jsonify({"error": "forbidden"}), 403
+    
+    if not os.environ.get('TELEGRAM_TOKEN'):
+        return jsonify({"error": "Bot not configured"}), 503
+    
+    from bot.webhook import get_dispatcher
+    if not get_dispatcher().submit(request.get_data(as_text=True)):
+        # Очередь заполнена: Telegram повторит доставку позже
+        return jsonify({"error": "busy"}), 503
+    
+    return jsonify({"ok": True})
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
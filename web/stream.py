@@ -0,0 +1,122 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from typing import Optional
+
+import psycopg2
+
+from bot.events import EVENTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+class EventBroker:
+    """Раздача событий LISTEN/NOTIFY всем SSE-клиентам воркера
+
+    На процесс держится одно соединение с LISTEN, поэтому нагрузка на БД
+    не зависит от числа открытых вкладок панели. Статистика пересчитывается
+    не чаще stats_interval секунд и только если были новые события.
+
+    Каждый клиент занимает поток gthread-воркера на все соединение, поэтому
+    их число ограничено max_clients: остальные потоки остаются webhook,
+    /api/health и обычным запросам.
+    """
+
+    def __init__(self, dsn: str, connect_kwargs: dict = None, stats_provider=None,
+                 stats_interval: float = 5.0, client_queue_size: int = 100, max_clients: int = 8):
+        self.dsn = dsn
+        self.connect_kwargs = connect_kwargs or {}
+        self.stats_provider = stats_provider
+        self.stats_interval = stats_interval
+        self.client_queue_size = client_queue_size
+        self.max_clients = max_clients
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats_dirty = False
+        self._last_stats = 0.0
+
+    def subscribe(self) -> Optional[queue.Queue]:
+        """Очередь событий нового клиента (None — достигнут лимит клиентов)"""
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            self._subscribers.add(client)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='sse-listener', daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(client)
+
+    def publish(self, event: dict):
+        """Раздача события; медленный клиент теряет события, а не тормозит остальных"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for client in subscribers:
+            try:
+                client.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {EVENTS_CHANNEL}")
+                backoff = 1
+                try:
+                    self._poll(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"❌ Ошибка слушателя SSE, переподключение через {backoff} с: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _poll(self, conn):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    return
+            if select.select([conn], [], [], 1.0)[0]:
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    self._stats_dirty = True
+                    self.publish(event)
+            self._maybe_publish_stats()
+
+    def _maybe_publish_stats(self):
+        if not self.stats_provider or not self._stats_dirty:
+            return
+        if time.monotonic() - self._last_stats < self.stats_interval:
+            return
+        self._stats_dirty = False
+        self._last_stats = time.monotonic()
+        try:
+            self.publish({'type': 'stats', **self.stats_provider()})
+        except Exception as e:
+            logger.error(f"❌ Ошибка расчета статистики для SSE: {e}")
+
+def format_sse(event: dict) -> str:
+    """Сериализация события в формат text/event-stream"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n"